@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Batch decode/encode/summary over whole blueprint libraries.
+Reads a directory, a file with one blueprint string per line, or stdin,
+spreads the work over a process pool, and writes one JSON line per input
+in input order. Bad inputs are reported on their own line and do not stop
+the rest of the batch.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from blueprint_decoder import decode_blueprint, encode_blueprint, summarize_blueprint
+
+
+OPERATIONS = ('decode', 'encode', 'summary')
+
+# Chunks per worker handed to the pool at once; keeps memory flat on huge
+# inputs while still giving every worker a queue
+_CHUNKS_PER_WORKER = 8
+
+
+def iter_inputs(source):
+    """
+    Lists the items of a batch as (label, kind, payload) tuples.
+
+    A directory yields every file in it (sorted by name): '.json' files are
+    blueprint data, anything else holds one blueprint string. A file yields
+    one blueprint string per non-empty line, and '-' reads lines from stdin.
+    Files are only read by the worker that handles them.
+
+    Args:
+        source: Directory path, file path or '-'
+
+    Yields:
+        tuple: (label, kind, payload) where kind is 'string', 'json_file'
+            or 'string_file'
+    """
+    if source == '-':
+        for number, line in enumerate(sys.stdin, 1):
+            line = line.strip()
+            if line:
+                yield f"stdin:{number}", 'string', line
+    elif os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if not os.path.isfile(path):
+                continue
+            kind = 'json_file' if name.endswith('.json') else 'string_file'
+            yield path, kind, path
+    else:
+        with open(source, 'r') as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield f"{source}:{number}", 'string', line
+
+
+def process_item(item, operation):
+    """
+    Runs one operation on one batch item.
+
+    Args:
+        item: (label, kind, payload) tuple from iter_inputs()
+        operation: 'decode', 'encode' or 'summary'
+
+    Returns:
+        dict: The result record; 'ok' tells whether the item succeeded
+    """
+    label, kind, payload = item
+    record = {"source": label}
+    try:
+        if kind == 'json_file':
+            with open(payload, 'r') as f:
+                blueprint_data = json.load(f)
+        else:
+            if kind == 'string_file':
+                with open(payload, 'r') as f:
+                    payload = f.read().strip()
+            blueprint_data, version_byte = decode_blueprint(payload)
+
+        if operation == 'decode':
+            record['result'] = blueprint_data
+        elif operation == 'encode':
+            record['result'] = encode_blueprint(blueprint_data)
+        else:
+            record['result'] = summarize_blueprint(blueprint_data)
+        record['ok'] = True
+    except Exception as e:
+        record['ok'] = False
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _process_line(args):
+    # Runs in the worker, so serializing the result is spread out as well
+    index, item, operation = args
+    record = process_item(item, operation)
+    record = {"index": index, **record}
+    return json.dumps(record), record['ok']
+
+
+def run_batch(items, operation, out, workers=None, chunksize=16):
+    """
+    Processes batch items and writes JSON Lines results in input order.
+
+    Args:
+        items: Iterable of (label, kind, payload) tuples
+        operation: 'decode', 'encode' or 'summary'
+        out: Text file to write the JSON lines to
+        workers: Number of worker processes (default: CPU count; 1 runs
+            everything in this process)
+        chunksize: Items sent to a worker per dispatch
+
+    Returns:
+        tuple: (number of items, number of failures)
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = ((index, item, operation) for index, item in enumerate(items))
+    total = 0
+    failed = 0
+
+    def write(results):
+        nonlocal total, failed
+        for line, ok in results:
+            out.write(line + "\n")
+            total += 1
+            failed += not ok
+
+    if workers == 1:
+        write(map(_process_line, jobs))
+        return total, failed
+
+    window = workers * chunksize * _CHUNKS_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(jobs, window))
+            if not batch:
+                break
+            write(pool.map(_process_line, batch, chunksize=chunksize))
+    return total, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode, encode or summarize many blueprints at once.")
+    parser.add_argument('source',
+                        help="directory, file with one string per line, or '-' for stdin")
+    parser.add_argument('--op', choices=OPERATIONS, default='summary',
+                        help="what to do with each blueprint (default: summary)")
+    parser.add_argument('-o', '--output',
+                        help="JSON Lines file to write (default: stdout)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=16,
+                        help="items per worker dispatch (default: 16)")
+    args = parser.parse_args()
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        total, failed = run_batch(iter_inputs(args.source), args.op, out,
+                                  args.workers, args.chunksize)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"Processed {total} blueprints, {failed} failed", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
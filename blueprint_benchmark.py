@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the blueprint codec.
+Generates synthetic blueprints and books at scale (many entities, nested
+books, heavy tiles, heavy combinator filters, wire-dense layouts), times
+decode_blueprint, encode_blueprint, print_blueprint_summary and file
+save/load, and records throughput and peak memory to a JSON baseline.
+With --check, any result that regresses past the threshold fails the run.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from blueprint_decoder import (decode_blueprint, encode_blueprint, load_from_file,
+                               print_blueprint_summary, save_to_file)
+
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 0.20  # fail when 20% slower or bigger than the baseline
+DEFAULT_SEED = 42
+
+VERSION = 562949958205441
+ENTITY_NAMES = ('transport-belt', 'fast-inserter', 'assembling-machine-2',
+                'medium-electric-pole', 'decider-combinator', 'constant-combinator')
+ITEMS = ('bob-ruby-4', 'bob-sapphire-4', 'bob-emerald-4',
+         'bob-amethyst-4', 'bob-topaz-4', 'bob-diamond-4')
+QUALITIES = ('normal', 'uncommon', 'rare', 'epic', 'legendary')
+
+
+def synthetic_entities(count, rng):
+    """
+    Generates a mix of ordinary entities on a square-ish grid.
+    """
+    side = max(1, int(count ** 0.5))
+    entities = []
+    for i in range(count):
+        entities.append({
+            "entity_number": i + 1,
+            "name": rng.choice(ENTITY_NAMES),
+            "position": {"x": i % side + 0.5, "y": i // side + 0.5},
+            "direction": rng.choice((0, 4, 8, 12)),
+        })
+    return entities
+
+
+def synthetic_blueprint(entities=0, tiles=0, filter_combinators=0,
+                        wired_deciders=0, seed=DEFAULT_SEED, label=None):
+    """
+    Builds one synthetic blueprint.
+
+    Args:
+        entities: Ordinary entities to place
+        tiles: Landfill tiles to lay
+        filter_combinators: Constant combinators carrying the 30 item x
+            quality filters of factorio_blueprint.py
+        wired_deciders: Decider combinators joined by dense red/green wires
+        seed: Random seed, so runs are reproducible
+        label: Optional blueprint label
+
+    Returns:
+        dict: Blueprint data as decode_blueprint returns it
+    """
+    rng = random.Random(seed)
+    entity_list = synthetic_entities(entities, rng)
+
+    filters = [
+        {"index": i + 1, "name": item, "quality": quality,
+         "comparator": "=", "count": 1}
+        for i, (quality, item) in enumerate(
+            (q, item) for q in QUALITIES for item in ITEMS)
+    ]
+    for i in range(filter_combinators):
+        entity_list.append({
+            "entity_number": len(entity_list) + 1,
+            "name": "constant-combinator",
+            "position": {"x": -2.5 - i % 100, "y": i // 100 + 0.5},
+            "direction": 12,
+            "control_behavior": {
+                "sections": {"sections": [{"index": 1, "filters": filters}]}
+            },
+        })
+
+    wires = []
+    first = len(entity_list) + 1
+    for i in range(wired_deciders):
+        entity_list.append({
+            "entity_number": first + i,
+            "name": "decider-combinator",
+            "position": {"x": i % 100 + 0.5, "y": -2 - (i // 100) * 2},
+            "direction": 0,
+            "control_behavior": {
+                "decider_conditions": {
+                    "conditions": [{
+                        "first_signal": {"type": "virtual", "name": "signal-A"},
+                        "constant": rng.randint(0, 100),
+                        "comparator": ">",
+                    }],
+                    "outputs": [{"signal": {"type": "virtual", "name": "signal-B"}}],
+                }
+            },
+        })
+        # Chain every decider to the next few, on both colours
+        for j in range(1, 4):
+            if i + j < wired_deciders:
+                wires.append([first + i, 1, first + i + j, 1])
+                wires.append([first + i, 2, first + i + j, 2])
+
+    side = max(1, int(tiles ** 0.5))
+    tile_list = [{"name": "landfill", "position": {"x": i % side, "y": i // side}}
+                 for i in range(tiles)]
+
+    bp = {"icons": [{"signal": {"name": "decider-combinator"}, "index": 1}]}
+    if label is not None:
+        bp["label"] = label
+    if entity_list:
+        bp["entities"] = entity_list
+    if wires:
+        bp["wires"] = wires
+    if tile_list:
+        bp["tiles"] = tile_list
+    bp["item"] = "blueprint"
+    bp["version"] = VERSION
+    return {"blueprint": bp}
+
+
+def synthetic_book(children, depth=1, entities=1000, seed=DEFAULT_SEED):
+    """
+    Builds a blueprint book, nesting books `depth` levels deep with
+    `children` entries per book and `entities` per leaf blueprint.
+    """
+    blueprints = []
+    for i in range(children):
+        if depth > 1:
+            child = synthetic_book(children, depth - 1, entities, seed * 31 + i)
+        else:
+            child = synthetic_blueprint(entities=entities, seed=seed * 31 + i,
+                                        label=f"child {i}")
+        child["index"] = i
+        blueprints.append(child)
+    return {"blueprint_book": {"blueprints": blueprints, "item": "blueprint-book",
+                               "label": f"book {seed}", "version": VERSION,
+                               "active_index": 0}}
+
+
+# name -> (generator, arguments) at scale 1.0
+SCENARIOS = {
+    'entities': (synthetic_blueprint, {'entities': 50000}),
+    'nested_book': (synthetic_book, {'children': 8, 'depth': 2, 'entities': 500}),
+    'tiles': (synthetic_blueprint, {'tiles': 200000}),
+    'filters': (synthetic_blueprint, {'filter_combinators': 2000}),
+    'wires': (synthetic_blueprint, {'wired_deciders': 10000}),
+}
+
+
+def _scaled(args, scale):
+    return {key: max(1, int(value * scale)) if key in
+            ('entities', 'tiles', 'filter_combinators', 'wired_deciders') else value
+            for key, value in args.items()}
+
+
+def _measure(func, repeats):
+    # Best-of-N wall time, then one more run under tracemalloc for the peak
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(scale=1.0, repeats=3, names=None):
+    """
+    Runs every scenario (or the named ones) and returns the results.
+
+    Returns:
+        dict: "scenario/operation" -> {"seconds", "mb_per_s", "peak_bytes"}
+    """
+    results = {}
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    for name, (generator, args) in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        blueprint_data = generator(**_scaled(args, scale))
+        blueprint_string = encode_blueprint(blueprint_data)
+        json_size = len(json.dumps(blueprint_data))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'blueprint.json')
+            with quiet:
+                save_to_file(blueprint_data, path)
+
+            def save():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    save_to_file(blueprint_data, path)
+
+            def load():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    load_from_file(path)
+
+            def summary():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    print_blueprint_summary(blueprint_data)
+
+            operations = {
+                'decode': lambda: decode_blueprint(blueprint_string),
+                'encode': lambda: encode_blueprint(blueprint_data),
+                'summary': summary,
+                'save': save,
+                'load': load,
+            }
+            for operation, func in operations.items():
+                seconds, peak = _measure(func, repeats)
+                results[f"{name}/{operation}"] = {
+                    "seconds": round(seconds, 6),
+                    "mb_per_s": round(json_size / seconds / 1e6, 2) if seconds else None,
+                    "peak_bytes": peak,
+                }
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Lists results that got slower or bigger than the baseline allows.
+
+    Returns:
+        list: Human-readable regression messages (empty when all pass)
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            old, new = base.get(metric), result.get(metric)
+            if old and new and new > old * (1 + threshold):
+                regressions.append(
+                    f"{key} {metric}: {old} -> {new} (+{(new / old - 1):.0%})")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'Benchmark':<26} {'Time':>10} {'MB/s':>9} {'Peak memory':>14}")
+    print("-"*62)
+    for key, result in results.items():
+        print(f"{key:<26} {result['seconds'] * 1000:>8.1f}ms "
+              f"{result['mb_per_s'] or 0:>9.1f} {result['peak_bytes']:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blueprint codec.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiply every scenario's size (default: 1.0)")
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="timed runs per benchmark, best one kept (default: 3)")
+    parser.add_argument('--only', nargs='*', choices=sorted(SCENARIOS),
+                        help="run only these scenarios")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help=f"baseline JSON file (default: {DEFAULT_BASELINE})")
+    parser.add_argument('--save', action='store_true',
+                        help="write the results as the new baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="fail if any result regresses past the threshold")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown/growth as a fraction (default: 0.20)")
+    args = parser.parse_args()
+
+    print("Blueprint Codec Benchmarks")
+    print("="*62)
+    results = run_benchmarks(args.scale, args.repeats, args.only)
+    print_results(results)
+
+    if args.check:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print(f"\nWarning: baseline was recorded at scale {baseline.get('scale')}")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for message in regressions:
+                print(f"  - {message}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'scale': args.scale, 'results': results}, f, indent=2)
+        print(f"\nBaseline saved to: {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
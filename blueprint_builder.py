@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+"""
+Declarative builder for blueprints.
+Signal, Filter, Section, Condition and Entity are __slots__ types whose
+fields are checked against SCHEMA, compiled once at import into per-type
+check and writer functions with the JSON keys baked in. A Blueprint writes
+its JSON text straight from these objects, without building entity dicts.
+Filters, sections, signals and conditions are values: build them once
+(product_filters() turns items x qualities into a filter grid) and share
+them between any number of entities; a shared section or condition is
+serialized once per encode.
+"""
+
+import json
+import math
+import sys
+import time
+import tracemalloc
+from itertools import product
+from json.encoder import encode_basestring_ascii
+
+from blueprint_stream import COMPACT_SEPARATORS, DEFAULT_SEPARATORS, iter_encoded_text
+from circuit_sim import DEFAULT_QUALITY
+
+
+# Blueprint version written by Factorio 2.0
+DEFAULT_VERSION = 562949958205441
+
+SIGNAL_TYPES = frozenset(('item', 'fluid', 'virtual', 'entity', 'recipe', 'quality',
+                          'space-location', 'asteroid-chunk'))
+COMPARATORS = frozenset(('>', '<', '=', '≥', '≤', '≠'))
+DIRECTIONS = range(16)
+
+# Filters a constant combinator section can hold
+MAX_FILTERS = 1000
+
+# Fields of each type in the order the game writes them:
+# (field, accepted type(s), allowed values or None, required).
+# A type name in a list, e.g. ['Filter'], means a tuple of that type.
+SCHEMA = {
+    'Signal': (
+        ('type', str, SIGNAL_TYPES, False),
+        ('name', str, None, True),
+        ('quality', str, None, False),
+    ),
+    'Filter': (
+        ('index', int, None, True),
+        ('type', str, SIGNAL_TYPES, False),
+        ('name', str, None, True),
+        ('quality', str, None, False),
+        ('comparator', str, COMPARATORS, False),
+        ('count', int, None, False),
+    ),
+    'Section': (
+        ('index', int, None, True),
+        ('filters', ['Filter'], None, True),
+    ),
+    'Condition': (
+        ('first_signal', 'Signal', None, True),
+        ('constant', int, None, False),
+        ('second_signal', 'Signal', None, False),
+        ('comparator', str, COMPARATORS, True),
+        ('output_signal', 'Signal', None, False),
+        ('copy_count_from_input', bool, None, False),
+    ),
+    'Entity': (
+        ('entity_number', int, None, False),
+        ('name', str, None, True),
+        ('x', (int, float), None, True),
+        ('y', (int, float), None, True),
+        ('direction', int, DIRECTIONS, False),
+        ('quality', str, None, False),
+        ('sections', ['Section'], None, False),
+        ('decider', 'Condition', None, False),
+        ('extra', dict, None, False),
+    ),
+}
+
+# Keys an Entity writes itself, which its extra dict cannot repeat;
+# 'control_behavior' only clashes when sections or a decider are set
+_ENTITY_KEYS = frozenset(field for field, *_ in SCHEMA['Entity']).union(('position',))
+
+# '"key": ' prefixes per separator style, filled in by _compile()
+_KEYS = ({}, {})
+_NESTED_KEYS = ('position', 'control_behavior', 'sections', 'decider_conditions',
+                'blueprint', 'icons', 'signal', 'entities', 'wires', 'item', 'label',
+                'version')
+
+
+def _separators(compact):
+    return COMPACT_SEPARATORS if compact else DEFAULT_SEPARATORS
+
+
+def _number(value):
+    # int and float subclasses (IntEnum, ...) are written as the plain number
+    if isinstance(value, int):
+        return int.__repr__(value)
+    return float.__repr__(value)
+
+
+def _encode_value(value, compact):
+    # JSON text of a plain value, exactly as json.dumps would write it
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    return json.dumps(value, separators=_separators(compact), allow_nan=False)
+
+
+class _Value:
+    # Base for the value types; _check(), _write() and _write_compact()
+    # are generated from SCHEMA by _compile()
+    __slots__ = ()
+    _fields = ()
+
+    def _json(self, compact=False):
+        return self._write_compact() if compact else self._write()
+
+    def to_data(self):
+        """
+        Returns the object as plain JSON data.
+        """
+        return json.loads(self._write())
+
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self._fields
+                           if getattr(self, field) is not None)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._write() == other._write()
+
+    def __hash__(self):
+        return hash(self._write())
+
+
+def _missing(obj, field):
+    raise ValueError(f"{type(obj).__name__}.{field} is required")
+
+
+def _wrong_type(obj, field, value, types):
+    raise TypeError(f"{type(obj).__name__}.{field} must be "
+                    f"{' or '.join(t.__name__ for t in types)}, not {type(value).__name__}")
+
+
+def _wrong_item(obj, field, item, item_type):
+    raise TypeError(f"{type(obj).__name__}.{field} must hold {item_type.__name__} "
+                    f"objects, not {type(item).__name__}")
+
+
+def _bad_value(obj, field, value):
+    raise ValueError(f"{type(obj).__name__}.{field} cannot be {value!r}")
+
+
+def _bad_extra(obj, keys):
+    raise ValueError(f"{type(obj).__name__}.extra cannot hold {', '.join(sorted(keys))}; "
+                     f"set the Entity field instead")
+
+
+class Signal(_Value):
+    """
+    A signal: an item, fluid, virtual signal, ...
+
+    Args:
+        name: Signal name
+        type: Signal type; the game treats a missing type as 'item'
+        quality: Optional quality
+    """
+
+    __slots__ = ('type', 'name', 'quality')
+
+    def __init__(self, name, type=None, quality=None):
+        self.type = type
+        self.name = name
+        self.quality = quality
+        self._check()
+
+
+class Filter(_Value):
+    """
+    One slot of a constant combinator section.
+
+    Args:
+        index: Slot number, from 1
+        name: Signal name
+        quality: Signal quality
+        comparator: Quality comparator ('=' for exactly that quality)
+        count: Signal value
+        type: Signal type, None for items
+    """
+
+    __slots__ = ('index', 'type', 'name', 'quality', 'comparator', 'count')
+
+    def __init__(self, index, name, quality=DEFAULT_QUALITY, comparator='=', count=1,
+                 type=None):
+        self.index = index
+        self.type = type
+        self.name = name
+        self.quality = quality
+        self.comparator = comparator
+        self.count = count
+        self._check()
+
+
+class Section(_Value):
+    """
+    A constant combinator section (Factorio 2.0).
+
+    Args:
+        filters: Iterable of Filter
+        index: Section number, from 1
+
+    Raises:
+        ValueError: If there are more than MAX_FILTERS filters
+    """
+
+    __slots__ = ('index', 'filters')
+
+    def __init__(self, filters, index=1):
+        self.index = index
+        self.filters = tuple(filters)
+        if len(self.filters) > MAX_FILTERS:
+            raise ValueError(f"A section holds at most {MAX_FILTERS} filters, "
+                             f"got {len(self.filters)}")
+        self._check()
+
+
+class Condition(_Value):
+    """
+    A decider combinator's condition and output (the single-condition
+    decider_conditions format of Factorio 1.x).
+
+    Args:
+        first_signal: Signal compared
+        comparator: One of COMPARATORS
+        constant: Right-hand constant, or
+        second_signal: Right-hand signal
+        output_signal: Signal written while the condition holds
+        copy_count_from_input: Output the input value instead of 1
+    """
+
+    __slots__ = ('first_signal', 'constant', 'second_signal', 'comparator',
+                 'output_signal', 'copy_count_from_input')
+
+    def __init__(self, first_signal, comparator, constant=None, second_signal=None,
+                 output_signal=None, copy_count_from_input=None):
+        self.first_signal = first_signal
+        self.constant = constant
+        self.second_signal = second_signal
+        self.comparator = comparator
+        self.output_signal = output_signal
+        self.copy_count_from_input = copy_count_from_input
+        self._check()
+
+
+def _shared_json(value, compact, shared):
+    if shared:
+        text = shared.get(id(value))
+        if text is not None:
+            return text
+    return value._json(compact)
+
+
+class Entity:
+    """
+    An entity to place. Unlike the value types it may be edited (moved,
+    renumbered) after it is built; it is checked again and its JSON written
+    fresh each time it is serialized.
+
+    Args:
+        name: Entity name
+        x, y: Position
+        direction: 16-way direction, None to leave it out
+        quality: Entity quality, None for normal
+        sections: Iterable of Section, for constant combinators
+        decider: Condition, for decider combinators
+        extra: Dict of any other fields (tags, items, ...), written as is;
+            it cannot hold keys the entity writes itself
+        entity_number: Number, or None to let Blueprint.add() assign one
+
+    Raises:
+        TypeError, ValueError: If a field does not fit SCHEMA, a number is
+            not finite or extra repeats an entity key
+    """
+
+    __slots__ = ('entity_number', 'name', 'x', 'y', 'direction', 'quality',
+                 'sections', 'decider', 'extra')
+
+    def __init__(self, name, x, y, direction=None, quality=None, sections=None,
+                 decider=None, extra=None, entity_number=None):
+        self.entity_number = entity_number
+        self.name = name
+        self.x = x
+        self.y = y
+        self.direction = direction
+        self.quality = quality
+        self.sections = tuple(sections) if sections is not None else None
+        self.decider = decider
+        self.extra = extra
+        self._validate()
+
+    def _validate(self):
+        self._check()
+        extra = self.extra
+        if extra:
+            clash = set(_ENTITY_KEYS.intersection(extra))
+            if 'control_behavior' in extra and (self.sections is not None
+                                                or self.decider is not None):
+                clash.add('control_behavior')
+            if clash:
+                _bad_extra(self, clash)
+
+    def _json(self, compact=False, shared=None):
+        # `shared` maps id() of sections and conditions to their JSON text
+        self._validate()
+        keys = _KEYS[compact]
+        item_sep = _separators(compact)[0]
+        parts = []
+        if self.entity_number is not None:
+            parts.append(keys['entity_number'] + int.__repr__(self.entity_number))
+        parts.append(keys['name'] + encode_basestring_ascii(self.name))
+        parts.append(keys['position'] + '{' + keys['x'] + _number(self.x) + item_sep
+                     + keys['y'] + _number(self.y) + '}')
+        if self.direction is not None:
+            parts.append(keys['direction'] + int.__repr__(self.direction))
+        if self.quality is not None:
+            parts.append(keys['quality'] + encode_basestring_ascii(self.quality))
+        if self.sections is not None:
+            sections = item_sep.join([_shared_json(section, compact, shared)
+                                      for section in self.sections])
+            parts.append(keys['control_behavior'] + '{' + keys['sections'] + '{'
+                         + keys['sections'] + '[' + sections + ']}}')
+        elif self.decider is not None:
+            parts.append(keys['control_behavior'] + '{' + keys['decider_conditions']
+                         + _shared_json(self.decider, compact, shared) + '}')
+        if self.extra:
+            text = json.dumps(self.extra, separators=_separators(compact), allow_nan=False)
+            if len(text) > 2:
+                parts.append(text[1:-1])
+        return '{' + item_sep.join(parts) + '}'
+
+    def to_data(self):
+        """
+        Returns the entity as a plain dict, as decode_blueprint would.
+        """
+        return json.loads(self._json())
+
+    def __repr__(self):
+        return f"Entity({self.name!r}, {self.x!r}, {self.y!r}, number={self.entity_number!r})"
+
+
+class Blueprint:
+    """
+    Blueprint assembled from Entity objects and encoded without building
+    the blueprint as a dict.
+
+    Usage:
+        filters = product_filters(['iron-plate', 'copper-plate'], QUALITIES)
+        section = Section(filters)
+        bp = Blueprint(icons=[Signal('constant-combinator')])
+        for i in range(100):
+            bp.add(Entity('constant-combinator', i + 0.5, 0.5, sections=[section]))
+        blueprint_string = bp.encode()
+    """
+
+    __slots__ = ('entities', 'icons', 'wires', 'label', 'version', '_last_number')
+
+    def __init__(self, icons=(), label=None, version=DEFAULT_VERSION):
+        """
+        Args:
+            icons: Up to four Signals shown as the blueprint's icon
+            label: Optional label
+            version: Game version number written into the blueprint
+        """
+        self.entities = []
+        self.icons = tuple(icons)
+        self.wires = []
+        self.label = label
+        self.version = version
+        self._last_number = 0
+        for icon in self.icons:
+            if not isinstance(icon, Signal):
+                raise TypeError(f"Icons must be Signal objects, not {type(icon).__name__}")
+
+    def __len__(self):
+        return len(self.entities)
+
+    def add(self, entity):
+        """
+        Adds an entity, numbering it after the highest number added so
+        far if it has no entity_number.
+
+        Returns:
+            int: The entity's number
+        """
+        if not isinstance(entity, Entity):
+            raise TypeError(f"Expected an Entity, not {type(entity).__name__}")
+        if entity.entity_number is None:
+            entity.entity_number = self._last_number + 1
+        self._last_number = max(self._last_number, entity.entity_number)
+        self.entities.append(entity)
+        return entity.entity_number
+
+    def extend(self, entities):
+        """
+        Adds several entities; see add().
+        """
+        for entity in entities:
+            self.add(entity)
+
+    def wire(self, e1, c1, e2, c2):
+        """
+        Adds a Factorio 2.0 wire between two entity connectors.
+        """
+        self.wires.append([e1, c1, e2, c2])
+
+    def _shared(self, compact):
+        # Serializes each section or condition used by more than one entity
+        # once, keyed by id(); the map lives for one encode only
+        seen, shared = set(), {}
+        for entity in self.entities:
+            for value in entity.sections or (entity.decider,):
+                if value is None:
+                    continue
+                key = id(value)
+                if key not in seen:
+                    seen.add(key)
+                elif key not in shared:
+                    shared[key] = value._json(compact)
+        return shared
+
+    def iter_json(self, compact=False):
+        """
+        Writes the blueprint's JSON text piece by piece, one entity per
+        piece. Joined, the pieces equal json.dumps of the same data.
+
+        Yields:
+            str: Consecutive pieces of the JSON text
+        """
+        keys = _KEYS[compact]
+        item_sep = _separators(compact)[0]
+        icons = item_sep.join('{' + keys['signal'] + icon._json(compact) + item_sep
+                              + keys['index'] + str(i) + '}'
+                              for i, icon in enumerate(self.icons, 1))
+        yield ('{' + keys['blueprint'] + '{' + keys['icons'] + '[' + icons + ']'
+               + item_sep + keys['entities'] + '[')
+        shared = self._shared(compact)
+        for i, entity in enumerate(self.entities):
+            yield (item_sep if i else '') + entity._json(compact, shared)
+        tail = [']']
+        if self.wires:
+            tail.append(item_sep + keys['wires'] + _encode_value(self.wires, compact))
+        tail.append(item_sep + keys['item'] + '"blueprint"')
+        if self.label is not None:
+            tail.append(item_sep + keys['label'] + encode_basestring_ascii(self.label))
+        tail.append(item_sep + keys['version'] + repr(self.version) + '}}')
+        yield ''.join(tail)
+
+    def encode(self, version_byte='0', compact=False, workers=None):
+        """
+        Encodes the blueprint into a blueprint string.
+
+        Args:
+            version_byte: The version byte to use (default '0')
+            compact: Use (',', ':') JSON separators, as Factorio does
+            workers: Deflate on this many threads for very large blueprints
+
+        Returns:
+            str: The encoded blueprint string
+        """
+        return ''.join(iter_encoded_text(self.iter_json(compact), version_byte,
+                                         workers=workers))
+
+    def to_data(self):
+        """
+        Returns the blueprint as plain data, as decode_blueprint would.
+        """
+        return json.loads(''.join(self.iter_json()))
+
+
+def product_filters(names, qualities=(DEFAULT_QUALITY,), comparator='=', count=1,
+                    type=None, start=1):
+    """
+    Builds one filter per quality x name, qualities outermost, numbered
+    from `start`.
+
+    Returns:
+        tuple: Filter objects
+    """
+    return tuple(Filter(index, name, quality, comparator, count, type)
+                 for index, (quality, name) in enumerate(product(qualities, names), start))
+
+
+def _encoder(types, expr, compact):
+    # Source of the expression writing `expr` as JSON
+    if isinstance(types, list):
+        method = '_write_compact' if compact else '_write'
+        return (f"'[' + {_separators(compact)[0]!r}.join("
+                f"[item.{method}() for item in {expr}]) + ']'")
+    if isinstance(types, str):
+        return f'{expr}._write_compact()' if compact else f'{expr}._write()'
+    if types is str:
+        return f'_str({expr})'
+    if types is bool:
+        return f"('true' if {expr} else 'false')"
+    if types is int:
+        return f'_int({expr})'
+    if types in (float, (int, float)):
+        return f'_number({expr})'
+    return f'_dumps({expr}, separators={_separators(compact)!r}, allow_nan=False)'
+
+
+def _compile():
+    # Generates each type's _check(), _write() and _write_compact() from
+    # SCHEMA, with type tests and JSON keys inlined, and fills _KEYS
+    classes = {cls.__name__: cls for cls in (Signal, Filter, Section, Condition, Entity)}
+    for name, fields in SCHEMA.items():
+        cls = classes[name]
+        namespace = {'_str': encode_basestring_ascii, '_dumps': json.dumps,
+                     '_int': int.__repr__, '_number': _number,
+                     '_isfinite': math.isfinite,
+                     '_missing': _missing, '_wrong_type': _wrong_type,
+                     '_wrong_item': _wrong_item, '_bad_value': _bad_value}
+        check = ['def _check(self):']
+        for n, (field, types, choices, required) in enumerate(fields):
+            item_type = None
+            if isinstance(types, list):
+                # Sequence of objects: a tuple, checked item by item
+                types, item_type = tuple, classes[types[0]]
+            elif isinstance(types, str):
+                types = classes[types]
+            namespace[f'T{n}'] = types if isinstance(types, tuple) else (types,)
+            namespace[f'E{n}'] = item_type
+            namespace[f'C{n}'] = choices
+            check += [f'    value = self.{field}',
+                      '    if value is None:',
+                      f'        _missing(self, {field!r})' if required else '        pass',
+                      f'    elif value.__class__ not in T{n} and '
+                      f'(not isinstance(value, T{n}) or value.__class__ is bool):',
+                      f'        _wrong_type(self, {field!r}, value, T{n})']
+            if choices is not None:
+                check += [f'    elif value not in C{n}:',
+                          f'        _bad_value(self, {field!r}, value)']
+            if float in namespace[f'T{n}']:
+                # NaN and infinities have no JSON spelling
+                check += ['    elif value.__class__ is float and not _isfinite(value):',
+                          f'        _bad_value(self, {field!r}, value)']
+            if item_type is not None:
+                check += ['    else:',
+                          '        for item in value:',
+                          f'            if item.__class__ is not E{n} and '
+                          f'not isinstance(item, E{n}):',
+                          f'                _wrong_item(self, {field!r}, item, E{n})']
+        sources = ['\n'.join(check)]
+
+        if issubclass(cls, _Value):
+            for method, compact in (('_write', False), ('_write_compact', True)):
+                item_sep, key_sep = _separators(compact)
+                # One %-template per type: required fields are slots in it,
+                # optional ones are '' or their whole '"key": value' piece,
+                # separator included
+                template, values, leading = '', [], False
+                for field, types, _, required in fields:
+                    key = encode_basestring_ascii(field) + key_sep
+                    if required:
+                        template += (item_sep if leading else '') + key.replace('%', '%%') + '%s'
+                        values.append(_encoder(types, 'self.' + field, compact))
+                        leading = True
+                    else:
+                        piece = f'{item_sep}{key}' if leading else key
+                        value = _encoder(types, 'value', compact)
+                        if not leading:
+                            value += f' + {item_sep!r}'
+                        template += '%s'
+                        values.append(f"('' if (value := self.{field}) is None "
+                                      f"else {piece!r} + {value})")
+                namespace[f'{method.upper()}_TEMPLATE'] = '{' + template + '}'
+                write = [f'def {method}(self):',
+                         f'    return {method.upper()}_TEMPLATE % (',
+                         *(f'        {value},' for value in values),
+                         '    )']
+                sources.append('\n'.join(write))
+
+        exec('\n\n'.join(sources), namespace)
+        cls._check = namespace['_check']
+        if issubclass(cls, _Value):
+            cls._write = namespace['_write']
+            cls._write_compact = namespace['_write_compact']
+            cls._fields = tuple(field for field, *_ in fields)
+
+    for compact in (False, True):
+        key_sep = _separators(compact)[1]
+        names = {field for fields in SCHEMA.values() for field, *_ in fields}
+        for key in names.union(_NESTED_KEYS):
+            _KEYS[compact][key] = encode_basestring_ascii(key) + key_sep
+
+
+_compile()
+
+
+def _dict_blueprint(count, names, qualities):
+    # The hand-assembled equivalent: one dict literal per combinator
+    entities = []
+    for i in range(count):
+        entities.append({
+            "entity_number": i + 1,
+            "name": "constant-combinator",
+            "position": {"x": i % 100 + 0.5, "y": i // 100 + 0.5},
+            "direction": 12,
+            "control_behavior": {
+                "sections": {
+                    "sections": [{
+                        "index": 1,
+                        "filters": [
+                            {"index": j + 1, "name": name, "quality": quality,
+                             "comparator": "=", "count": 1}
+                            for j, (quality, name) in enumerate(product(qualities, names))
+                        ],
+                    }]
+                }
+            },
+        })
+    return {"blueprint": {"icons": [{"signal": {"name": "constant-combinator"}, "index": 1}],
+                          "entities": entities, "item": "blueprint",
+                          "version": DEFAULT_VERSION}}
+
+
+def _built_blueprint(count, names, qualities):
+    section = Section(product_filters(names, qualities))
+    bp = Blueprint(icons=[Signal('constant-combinator')])
+    for i in range(count):
+        bp.add(Entity('constant-combinator', i % 100 + 0.5, i // 100 + 0.5, direction=12,
+                      sections=[section]))
+    return bp
+
+
+def _measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    function()
+    return result, min(elapsed, time.perf_counter() - start), peak
+
+
+def main():
+    from blueprint_benchmark import ITEMS, QUALITIES
+    from blueprint_decoder import encode_blueprint
+
+    print("Blueprint Builder")
+    print("="*60)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"{count} constant combinators, {len(ITEMS) * len(QUALITIES)} filters each")
+
+    results = {}
+    for label, function in (
+            ('dict literals', lambda: encode_blueprint(_dict_blueprint(count, ITEMS, QUALITIES))),
+            ('builder', lambda: _built_blueprint(count, ITEMS, QUALITIES).encode())):
+        text, elapsed, peak = _measure(function)
+        results[label] = text
+        print(f"  {label:<14} {elapsed:7.3f}s  peak {peak / 2**20:7.1f} MiB")
+    same = results['dict literals'] == results['builder']
+    print(f"identical blueprint strings: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for blueprint decoding and encoding.
+Decodes are keyed on a hash of the blueprint string and encodes on a hash
+of the data's exact JSON text, key order included. A bounded in-memory
+LRU sits in front of an optional SQLite file shared across processes.
+Callers get private copies (or read-only frozen views), so editing a
+result never corrupts the cache.
+"""
+
+import hashlib
+import json
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+from blueprint_decoder import decode_blueprint, encode_blueprint
+from blueprint_stream import json_default
+
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def freeze(value):
+    """
+    Builds a read-only view of decoded blueprint data: dicts become
+    MappingProxyType objects and lists become tuples. encode_blueprint
+    accepts the result as-is.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class BlueprintCache:
+    """
+    Two-tier cache in front of decode_blueprint and encode_blueprint.
+
+    Counters for hits, disk hits, misses and evictions are kept in
+    self.stats.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path=None):
+        """
+        Args:
+            max_entries: Entries kept in memory before the least recently
+                used one is evicted
+            path: SQLite file for the on-disk tier (None for memory only)
+        """
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # (kind, key) -> cached value
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (kind, key))")
+            self._db.commit()
+
+    def _get(self, kind, key):
+        # Returns (value, tier) with tier 'memory', 'disk' or None
+        with self._lock:
+            value = self._memory.get((kind, key))
+            if value is not None:
+                self._memory.move_to_end((kind, key))
+                self.stats['hits'] += 1
+                return value, 'memory'
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM cache WHERE kind = ? AND key = ?",
+                    (kind, key)).fetchone()
+                if row is not None:
+                    self.stats['disk_hits'] += 1
+                    return row[0], 'disk'
+
+            self.stats['misses'] += 1
+            return None, None
+
+    def _put(self, kind, key, value, disk_value=None):
+        with self._lock:
+            self._memory[(kind, key)] = value
+            self._memory.move_to_end((kind, key))
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats['evictions'] += 1
+
+            if self._db is not None and disk_value is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (kind, key, value) VALUES (?, ?, ?)",
+                    (kind, key, disk_value))
+                self._db.commit()
+
+    def decode(self, blueprint_string, frozen=False):
+        """
+        Cached decode_blueprint.
+
+        Args:
+            blueprint_string: The encoded blueprint string
+            frozen: Return a shared read-only view (see freeze()) instead of
+                a private copy; faster, but the result cannot be edited
+
+        Returns:
+            tuple: (blueprint data, version byte), as decode_blueprint
+        """
+        key = _digest(blueprint_string)
+        cached, tier = self._get('decode', key)
+
+        if tier != 'memory':
+            if tier == 'disk':
+                version_byte, blueprint_data = cached[0], json.loads(cached[1:])
+                disk_value = None
+            else:
+                blueprint_data, version_byte = decode_blueprint(blueprint_string)
+                disk_value = version_byte + json.dumps(blueprint_data,
+                                                       separators=(',', ':'))
+            # [version byte, pickled data, frozen view once asked for]
+            cached = [version_byte,
+                      pickle.dumps(blueprint_data, pickle.HIGHEST_PROTOCOL), None]
+            self._put('decode', key, cached, disk_value)
+
+        version_byte, pickled, frozen_view = cached
+        if frozen:
+            if frozen_view is None:
+                frozen_view = cached[2] = freeze(pickle.loads(pickled))
+            return frozen_view, version_byte
+        # Unpickling a private copy is much cheaper than decoding again
+        return pickle.loads(pickled), version_byte
+
+    def encode(self, blueprint_data, version_byte='0'):
+        """
+        Cached encode_blueprint. The key is the data's JSON text in its own
+        key order, because the encoded string depends on that order; a hit
+        returns exactly what encode_blueprint would.
+
+        Returns:
+            str: The encoded blueprint string
+        """
+        key = _digest(version_byte + json.dumps(blueprint_data, separators=(',', ':'),
+                                                default=json_default))
+        cached, tier = self._get('encode', key)
+        if tier == 'disk':
+            self._put('encode', key, cached)
+        if tier is not None:
+            return cached
+
+        blueprint_string = encode_blueprint(blueprint_data, version_byte)
+        self._put('encode', key, blueprint_string, blueprint_string)
+        return blueprint_string
+
+    def clear(self, disk=False):
+        """
+        Empties the in-memory tier, and the on-disk tier too if asked.
+        """
+        with self._lock:
+            self._memory.clear()
+            if disk and self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def close(self):
+        """
+        Closes the on-disk store.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def main():
+    print("Blueprint Cache Benchmark")
+    print("="*60)
+
+    if len(sys.argv) > 1:
+        blueprint_string = sys.argv[1]
+    else:
+        from factorio_blueprint import create_decider_combinator_blueprint
+        blueprint_string = create_decider_combinator_blueprint()
+
+    cache = BlueprintCache()
+    rounds = 2000
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decode_blueprint(blueprint_string)
+    uncached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        cache.decode(blueprint_string)
+    copied = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        cache.decode(blueprint_string, frozen=True)
+    frozen = time.perf_counter() - start
+
+    print(f"{rounds} decodes of a {len(blueprint_string)}-character string")
+    print(f"  decode_blueprint: {uncached * 1e6 / rounds:8.1f} us each")
+    print(f"  cached copy:      {copied * 1e6 / rounds:8.1f} us each")
+    print(f"  cached frozen:    {frozen * 1e6 / rounds:8.1f} us each")
+    print(f"  stats: {cache.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Canonical form and content digest for blueprints.
+Two blueprints that only differ in key order, entity numbering, entity,
+wire, tile or icon order, in writing 1.0 for 1, or in spelling out an
+entity's default direction (0) or quality ('normal') or a 1.x wire's
+default circuit_id (1) get the same canonical JSON text and digest.
+Entities are ordered by position (then name, direction, quality and
+settings) and renumbered from 1 in that order; wires, copper links, 1.x
+connections and train references follow the new numbers. The digest is
+fed one entity at a time while the text is written, so no canonical copy
+of the blueprint is built.
+
+Other defaults, such as a signal's 'type': 'item' or a nested
+'quality': 'normal' inside entity settings, are hashed as written.
+"""
+
+import hashlib
+import json
+import sys
+import time
+from collections.abc import Mapping
+
+from blueprint_lazy import KINDS
+from blueprint_stream import json_default
+
+
+# How an integral float (1.0, -0.0, 1e+16) ends in compact JSON; a match
+# inside a string only costs a slower, still correct, pass
+_FLOAT_ENDINGS = ('.0,', '.0}', '.0]', 'e+')
+
+# Entities serialized per json.dumps call
+_BATCH = 512
+
+# Entity fields left out of the canonical form when they hold the default
+_ENTITY_DEFAULTS = (('direction', 0), ('quality', 'normal'))
+
+_dumps = json.JSONEncoder(sort_keys=True, separators=(',', ':'),
+                          default=json_default).encode
+
+
+def _normalize(value):
+    # Integral floats become ints, mappings plain dicts
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, Mapping):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if hasattr(value, 'to_json'):
+        return _normalize(json_default(value))
+    return value
+
+
+def canonical_json(value):
+    """
+    Serializes a plain value with sorted keys, compact separators and
+    integral floats written as ints, so equal data always gives the same
+    text whatever its key order.
+    """
+    text = _dumps(value)
+    if any(ending in text for ending in _FLOAT_ENDINGS):
+        text = _dumps(_normalize(value))
+    return text
+
+
+def _sort_key(entity):
+    position = entity.get('position') or {}
+    return (position.get('y', 0), position.get('x', 0), entity.get('name', ''),
+            entity.get('direction', 0), entity.get('quality', 'normal'))
+
+
+def _drop_defaults(entity):
+    # Removes default-valued fields from an entity copy, in place
+    for key, default in _ENTITY_DEFAULTS:
+        if key in entity and entity[key] == default:
+            del entity[key]
+    return entity
+
+
+def _settings(entity):
+    # An entity without its number and links, to order look-alikes
+    return canonical_json(_drop_defaults({key: value for key, value in entity.items()
+                                          if key not in ('entity_number', 'neighbours',
+                                                         'connections')}))
+
+
+def canonical_order(entities):
+    """
+    Orders entities for the canonical form.
+
+    Entities are sorted by position, name, direction and quality; only
+    entities equal on all of those are told apart by their other settings.
+
+    Args:
+        entities: Sequence of entity dicts (a list or an EntityTable)
+
+    Returns:
+        list: Indexes into entities, in canonical order
+    """
+    try:
+        keys = [(e['position']['y'], e['position']['x'], e['name'],
+                 e.get('direction', 0), e.get('quality', 'normal')) for e in entities]
+    except (KeyError, TypeError):
+        keys = [_sort_key(entity) for entity in entities]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    if len(set(keys)) == len(keys):
+        return order
+    # Break ties between entities at the same spot with the same name
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and keys[order[end]] == keys[order[start]]:
+            end += 1
+        if end - start > 1:
+            group = order[start:end]
+            texts = {i: _settings(entities[i]) for i in group}
+            order[start:end] = sorted(group, key=texts.__getitem__)
+        start = end
+    return order
+
+
+def _circuit_end(end, numbers):
+    # A renumbered 1.x wire end, without the default circuit_id
+    end = {**end, 'entity_id': numbers[end['entity_id']]}
+    if end.get('circuit_id') == 1:
+        del end['circuit_id']
+    return end
+
+
+def _connections(connections, numbers):
+    # 1.x wires, renumbered and sorted
+    result = {}
+    for point, colours in connections.items():
+        if isinstance(colours, (list, tuple)):
+            # Copper "Cu0"/"Cu1" lists
+            result[point] = sorted(
+                ({**c, 'entity_id': numbers[c['entity_id']]} for c in colours
+                 if c.get('entity_id') in numbers),
+                key=lambda c: (c['entity_id'], c.get('wire_id', 0)))
+            continue
+        result[point] = {
+            colour: sorted((_circuit_end(c, numbers) for c in targets
+                            if c.get('entity_id') in numbers),
+                           key=lambda c: (c['entity_id'], c.get('circuit_id', 1)))
+            for colour, targets in colours.items()}
+    return result
+
+
+def _iter_entities(entities, order, numbers):
+    # Canonical entity texts, a batch at a time
+    for start in range(0, len(order), _BATCH):
+        batch = []
+        for i in order[start:start + _BATCH]:
+            entity = _drop_defaults(dict(entities[i]))
+            entity['entity_number'] = numbers[entity.get('entity_number')]
+            if 'neighbours' in entity:
+                entity['neighbours'] = sorted(numbers[n] for n in entity['neighbours']
+                                              if n in numbers)
+            if 'connections' in entity:
+                entity['connections'] = _connections(entity['connections'], numbers)
+            batch.append(entity)
+        yield canonical_json(batch)[1:-1]
+
+
+def _wires(wires, numbers):
+    # 2.0 wires, renumbered, each written from its lower end, deduplicated
+    # and sorted
+    result = set()
+    for e1, c1, e2, c2 in wires:
+        if e1 not in numbers or e2 not in numbers:
+            continue
+        a, b = (numbers[e1], c1), (numbers[e2], c2)
+        if a > b:
+            a, b = b, a
+        result.add((*a, *b))
+    return [list(wire) for wire in sorted(result)]
+
+
+def _tiles(tiles):
+    cells = sorted((t['position']['y'], t['position']['x'], t['name']) for t in tiles)
+    return [{'name': name, 'position': {'x': x, 'y': y}} for y, x, name in cells]
+
+
+def _icons(icons):
+    return sorted(icons, key=lambda icon: icon.get('index', 0))
+
+
+def _iter_blueprint(bp):
+    entities = bp.get('entities') or []
+    order = canonical_order(entities)
+    numbers = {entities[i].get('entity_number'): n for n, i in enumerate(order, 1)}
+
+    yield '{'
+    for i, key in enumerate(sorted(bp)):
+        yield (',' if i else '') + _dumps(key) + ':'
+        value = bp[key]
+        if key == 'entities':
+            yield '['
+            for j, text in enumerate(_iter_entities(entities, order, numbers)):
+                yield (',' if j else '') + text
+            yield ']'
+        elif key == 'wires':
+            yield canonical_json(_wires(value, numbers))
+        elif key == 'tiles':
+            yield canonical_json(_tiles(value))
+        elif key == 'icons':
+            yield canonical_json(_icons(value))
+        elif key == 'schedules':
+            yield canonical_json([{**schedule,
+                          'locomotives': [numbers[n] for n in schedule.get('locomotives', [])
+                                          if n in numbers]}
+                         for schedule in value])
+        elif key == 'stock_connections':
+            yield canonical_json(sorted(({k: numbers.get(v, v) for k, v in link.items()}
+                                for link in value), key=lambda link: link.get('stock', 0)))
+        else:
+            yield canonical_json(value)
+    yield '}'
+
+
+def iter_canonical_json(blueprint_data):
+    """
+    Writes the canonical JSON text of a blueprint, planner or book piece
+    by piece: sorted keys, compact separators, integral floats as ints,
+    entities in canonical order and renumbered, book children by index.
+
+    Args:
+        blueprint_data: Decoded data or a LazyBlueprint; entity lists may
+            be EntityTables and tile lists TileLayers
+
+    Yields:
+        str: Consecutive pieces of the canonical JSON text
+    """
+    kind = next((k for k in KINDS if k in blueprint_data), None)
+    yield '{'
+    for i, key in enumerate(sorted(blueprint_data)):
+        yield (',' if i else '') + _dumps(key) + ':'
+        value = blueprint_data[key]
+        if key != kind:
+            yield canonical_json(value)
+        elif kind == 'blueprint':
+            yield from _iter_blueprint(value)
+        elif kind == 'blueprint_book':
+            yield '{'
+            for j, book_key in enumerate(sorted(value)):
+                yield (',' if j else '') + _dumps(book_key) + ':'
+                if book_key == 'blueprints':
+                    children = sorted(value['blueprints'], key=lambda c: c.get('index', 0))
+                    yield '['
+                    for n, child in enumerate(children):
+                        if n:
+                            yield ','
+                        yield from iter_canonical_json(child)
+                    yield ']'
+                elif book_key == 'icons':
+                    yield canonical_json(_icons(value['icons']))
+                else:
+                    yield canonical_json(value[book_key])
+            yield '}'
+        else:
+            yield canonical_json(value)
+    yield '}'
+
+
+def canonical_digest(blueprint_data, algorithm='sha256'):
+    """
+    Hashes a blueprint's canonical form, feeding the hash as the text is
+    written.
+
+    Args:
+        blueprint_data: Decoded data or a LazyBlueprint
+        algorithm: Any hashlib algorithm name
+
+    Returns:
+        str: Hex digest; equal for logically identical blueprints
+    """
+    digest = hashlib.new(algorithm)
+    for piece in iter_canonical_json(blueprint_data):
+        digest.update(piece.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def canonicalize(blueprint_data):
+    """
+    Returns the canonical form of a blueprint as new data; the input is
+    not changed.
+    """
+    return json.loads(''.join(iter_canonical_json(blueprint_data)))
+
+
+def _shuffled(blueprint_data, seed=1):
+    # The same blueprint with entities renumbered, reordered and some
+    # coordinates written as floats, as another tool might export it
+    import random
+    rng = random.Random(seed)
+    bp = blueprint_data['blueprint']
+    entities = [dict(e) for e in bp['entities']]
+    rng.shuffle(entities)
+    numbers = {e['entity_number']: n for n, e in enumerate(entities, 1000)}
+    for entity in entities:
+        entity['entity_number'] = numbers[entity['entity_number']]
+        x, y = entity['position']['x'], entity['position']['y']
+        entity['position'] = {'y': float(y), 'x': float(x)}
+    wires = [[numbers[w[2]], w[3], numbers[w[0]], w[1]] for w in bp.get('wires', [])]
+    rng.shuffle(wires)
+    shuffled = {key: value for key, value in reversed(list(bp.items()))}
+    shuffled.update(entities=entities, wires=wires)
+    return {'blueprint': shuffled}
+
+
+def main():
+    print("Blueprint Canonical Form")
+    print("="*60)
+
+    if len(sys.argv) > 1:
+        from blueprint_decoder import decode_blueprint
+        with open(sys.argv[1], 'r') as f:
+            blueprint_data = decode_blueprint(f.read().strip())[0]
+        start = time.perf_counter()
+        print(canonical_digest(blueprint_data))
+        print(f"  {time.perf_counter() - start:.3f}s")
+        return
+
+    from blueprint_benchmark import synthetic_blueprint
+    print("(no blueprint file given; using a generated blueprint)")
+    blueprint_data = synthetic_blueprint(100000, wired_deciders=2000)
+    entities = len(blueprint_data['blueprint']['entities'])
+    start = time.perf_counter()
+    digest = canonical_digest(blueprint_data)
+    elapsed = time.perf_counter() - start
+    print(f"{entities} entities: {digest}")
+    print(f"  digest: {elapsed:.3f}s")
+    other = canonical_digest(_shuffled(blueprint_data))
+    print(f"  reordered/renumbered copy digests the same: {other == digest}")
+
+
+if __name__ == "__main__":
+    main()
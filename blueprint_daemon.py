@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Long-running codec server speaking JSON Lines.
+Listens on a Unix domain socket (or stdin/stdout) so callers pay the
+interpreter start-up and imports once instead of per blueprint. Each line
+is a request such as {"id": 1, "op": "decode", "string": "0eNq..."} and
+gets one response line carrying the same id. Requests on a connection are
+pipelined: small ones are answered inline, large ones go to a process
+pool, and reading pauses while too many are in flight or unread.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import socket
+import stat
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from blueprint_decoder import decode_blueprint, encode_blueprint, summarize_blueprint
+
+
+OPERATIONS = ('decode', 'encode', 'summary', 'ping')
+
+DEFAULT_SOCKET = '/tmp/blueprint_daemon.sock'
+DEFAULT_MAX_PENDING = 64         # requests in flight per connection
+INLINE_LIMIT = 64 * 1024         # request lines up to this size skip the pool
+INLINE_INFLATED_LIMIT = 1024 * 1024  # ...unless their blueprint inflates past this
+MAX_LINE = 512 * 1024 * 1024     # longest request line accepted
+
+
+def handle_request(request):
+    """
+    Runs one request.
+
+    Args:
+        request: Dict with 'op' and the op's fields:
+            decode:  'string'
+            encode:  'data', optional 'version_byte'
+            summary: 'string' or 'data'
+            ping:    nothing
+
+    Returns:
+        dict: Response fields ('result', and 'version_byte' for decode)
+    """
+    op = request.get('op')
+    if op == 'decode':
+        blueprint_data, version_byte = decode_blueprint(request['string'])
+        return {'result': blueprint_data, 'version_byte': version_byte}
+    if op == 'encode':
+        return {'result': encode_blueprint(request['data'],
+                                           request.get('version_byte', '0'))}
+    if op == 'summary':
+        if 'data' in request:
+            blueprint_data = request['data']
+        else:
+            blueprint_data = decode_blueprint(request['string'])[0]
+        return {'result': summarize_blueprint(blueprint_data)}
+    if op == 'ping':
+        return {'result': 'pong'}
+    raise ValueError(f"Unknown op: {op!r}")
+
+
+def _parse(line):
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+    return request
+
+
+def process_request(request):
+    """
+    Runs a parsed request and serializes the response line. Errors are
+    reported in the response, never raised.
+
+    Args:
+        request: Request dict
+
+    Returns:
+        bytes: One JSON response, newline-terminated
+    """
+    try:
+        response = {'id': request.get('id'), 'ok': True, **handle_request(request)}
+    except Exception as e:
+        return _error_line(request.get('id'), f"{type(e).__name__}: {e}")
+    return _encode_line(response)
+
+
+def process_line(line):
+    """
+    Parses a request line and answers it with process_request().
+
+    Args:
+        line: One JSON request (bytes or str)
+
+    Returns:
+        bytes: One JSON response, newline-terminated
+    """
+    try:
+        request = _parse(line)
+    except Exception as e:
+        return _error_line(None, f"{type(e).__name__}: {e}")
+    return process_request(request)
+
+
+# CodecClient writes the id last; other clients usually write it first
+_ID = re.compile(rb'"id"\s*:\s*(-?\d+|"[^"\\]*")')
+_ID_WINDOW = 256
+
+
+def _line_id(line):
+    # Best-effort id of an unparsed request line, for error replies
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+    for part in (line[-_ID_WINDOW:], line[:_ID_WINDOW]):
+        match = _ID.search(part)
+        if match:
+            return json.loads(match.group(1))
+    return None
+
+
+def _inflates_past(request, limit):
+    # Whether a request's blueprint string inflates past limit bytes; only
+    # the first limit + 1 bytes are ever inflated
+    try:
+        blueprint_string = request.get('string')
+        if not isinstance(blueprint_string, str):
+            return False
+        compressed = base64.b64decode(blueprint_string.strip()[1:])
+        data = zlib.decompressobj().decompress(compressed, limit + 1)
+    except (ValueError, zlib.error):
+        # Malformed; answered inline with the error
+        return False
+    return len(data) > limit
+
+
+def _encode_line(response):
+    return json.dumps(response, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _error_line(request_id, message):
+    return _encode_line({'id': request_id, 'ok': False, 'error': message})
+
+
+class CodecServer:
+    """
+    Serves JSON Lines requests over any number of connections.
+    """
+
+    def __init__(self, workers=None, max_pending=DEFAULT_MAX_PENDING,
+                 inline_limit=INLINE_LIMIT, inline_inflated_limit=INLINE_INFLATED_LIMIT):
+        """
+        Args:
+            workers: Worker processes for large requests (default: CPU
+                count; 0 answers everything inline)
+            max_pending: Requests in flight or waiting to be written, per
+                connection, before reading pauses
+            inline_limit: Request lines up to this many bytes are answered
+                on the event loop, skipping the round trip to a worker
+            inline_inflated_limit: Short lines whose blueprint inflates past
+                this many bytes still go to a worker
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending
+        self.inline_limit = inline_limit
+        self.inline_inflated_limit = inline_inflated_limit
+        self._pool = None
+
+    def _get_pool(self):
+        # Started on first use, so small-request-only clients never pay for it
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def _pooled(self, function, argument, request_id):
+        # Runs on the pool; a pool broken by a dead worker (e.g. killed
+        # for memory) is dropped so the next request starts a fresh one
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, function, argument)
+        except BrokenProcessPool:
+            if self._pool is pool:
+                self._pool = None
+                pool.shutdown(wait=False)
+            return _error_line(request_id, "Worker process died while answering "
+                                           "the request")
+
+    async def dispatch(self, line):
+        """
+        Answers one request line, inline or on the worker pool. Short lines
+        are parsed here once; long ones are parsed by the worker.
+        """
+        if self.workers == 0:
+            return process_line(line)
+        if len(line) > self.inline_limit:
+            return await self._pooled(process_line, line, _line_id(line))
+        try:
+            request = _parse(line)
+        except Exception as e:
+            return _error_line(None, f"{type(e).__name__}: {e}")
+        if _inflates_past(request, self.inline_inflated_limit):
+            return await self._pooled(process_request, request, request.get('id'))
+        return process_request(request)
+
+    async def serve_connection(self, reader, writer):
+        """
+        Handles one connection until the peer stops sending.
+
+        Responses are written as they complete, so they may come back out
+        of order; match them up by id. A request keeps its slot until its
+        response has been written, so a peer that stops reading stalls its
+        own requests instead of piling up responses.
+        """
+        slots = asyncio.Semaphore(self.max_pending)
+        # (response line, whether it holds a slot); at most max_pending
+        # slot holders exist, which bounds the queue
+        responses = asyncio.Queue()
+        tasks = set()
+
+        async def answer(line):
+            try:
+                data = await self.dispatch(line)
+            except Exception as e:
+                # Every request gets a reply, whatever went wrong
+                data = _error_line(_line_id(line), f"{type(e).__name__}: {e}")
+            except BaseException:
+                slots.release()
+                raise
+            responses.put_nowait((data, True))
+
+        async def write_responses():
+            connected = True
+            while True:
+                data, holds_slot = await responses.get()
+                if data is None:
+                    return
+                try:
+                    if connected:
+                        writer.write(data)
+                        # Waits while the peer is not reading its responses
+                        await writer.drain()
+                except ConnectionError:
+                    # Keep releasing slots so the reader can finish
+                    connected = False
+                finally:
+                    if holds_slot:
+                        slots.release()
+
+        writing = asyncio.create_task(write_responses())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_LINE; the stream cannot be resynced
+                    responses.put_nowait((_error_line(
+                        None, f"Request line longer than {MAX_LINE} bytes"), False))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # Backpressure: stop reading until a slot frees up
+                await slots.acquire()
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            responses.put_nowait((None, False))
+            await writing
+            writer.close()
+
+    async def serve_unix(self, path=DEFAULT_SOCKET):
+        """
+        Listens on a Unix domain socket until cancelled. A socket file left
+        behind by a server that is gone is replaced.
+
+        Raises:
+            FileExistsError: If the path is not a socket, or a server is
+                still listening on it
+        """
+        _remove_stale_socket(path)
+        server = await asyncio.start_unix_server(self.serve_connection, path,
+                                                 limit=MAX_LINE)
+        print(f"Listening on {path}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    async def serve_stdio(self):
+        """
+        Serves a single connection over stdin/stdout.
+        """
+        await self.serve_connection(_StdinReader(), _StdoutWriter())
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def _remove_stale_socket(path):
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Nobody is listening: left over from a server that exited
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f"A server is already listening on {path}")
+
+
+class _StdinReader:
+    # Line reader over stdin that works for pipes, files and terminals
+    async def readline(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+
+class _StdoutWriter:
+    # Writer over stdout with the StreamWriter methods serve_connection uses
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        sys.stdout.buffer.flush()
+
+
+class CodecClient:
+    """
+    Thin blocking client for a CodecServer on a Unix socket.
+
+    Usage:
+        with CodecClient() as client:
+            blueprint_data, version_byte = client.decode(blueprint_string)
+            strings = client.pipeline([{'op': 'encode', 'data': d} for d in datas])
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._file = self._sock.makefile('rwb')
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def _send(self, request):
+        self._next_id += 1
+        request = dict(request, id=self._next_id)
+        self._file.write(json.dumps(request, separators=(',', ':')).encode('utf-8') + b'\n')
+        return self._next_id
+
+    def _receive(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        return json.loads(line)
+
+    def pipeline(self, requests):
+        """
+        Sends many requests before reading any response.
+
+        Args:
+            requests: Request dicts ({'op': ..., ...}) without ids
+
+        Returns:
+            list: Response dicts, in the order of the requests
+
+        Raises:
+            ConnectionError: If the server rejects the connection's input
+                as a whole (e.g. a request line that is too long)
+        """
+        ids = [self._send(request) for request in requests]
+        self._file.flush()
+        by_id = {}
+        for _ in ids:
+            response = self._receive()
+            if response.get('id') is None and not response.get('ok'):
+                raise ConnectionError(response.get('error', "Server rejected the request"))
+            by_id[response['id']] = response
+        return [by_id[request_id] for request_id in ids]
+
+    def request(self, op, **fields):
+        """
+        Sends one request and returns its result.
+
+        Raises:
+            ValueError: If the server reports an error
+        """
+        response = self.pipeline([dict(fields, op=op)])[0]
+        if not response['ok']:
+            raise ValueError(response['error'])
+        return response
+
+    def decode(self, blueprint_string):
+        response = self.request('decode', string=blueprint_string)
+        return response['result'], response['version_byte']
+
+    def encode(self, blueprint_data, version_byte='0'):
+        return self.request('encode', data=blueprint_data,
+                            version_byte=version_byte)['result']
+
+    def summary(self, blueprint_string):
+        return self.request('summary', string=blueprint_string)['result']
+
+
+def _run_server(args):
+    server = CodecServer(args.workers, args.max_pending)
+    try:
+        if args.stdio:
+            asyncio.run(server.serve_stdio())
+        else:
+            asyncio.run(server.serve_unix(args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def _run_client(args):
+    blueprint_string = args.string if args.string else sys.stdin.read().strip()
+    with CodecClient(args.socket) as client:
+        if args.op == 'encode':
+            response = client.request('encode', data=json.loads(blueprint_string))
+        else:
+            response = client.request(args.op, string=blueprint_string)
+        print(json.dumps(response['result'], indent=2))
+
+        if args.repeat:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                client.request('summary', string=blueprint_string)
+            elapsed = time.perf_counter() - start
+            print(f"{args.repeat} summary round trips: "
+                  f"{elapsed * 1e3 / args.repeat:.3f} ms each", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blueprint codec daemon and client.")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the daemon")
+    serve.add_argument('--stdio', action='store_true',
+                       help="serve stdin/stdout instead of the socket")
+    serve.add_argument('-j', '--workers', type=int, default=None,
+                       help="worker processes for large requests (default: CPU count)")
+    serve.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                       help=f"requests in flight per connection (default: {DEFAULT_MAX_PENDING})")
+
+    client = commands.add_parser('client', help="send one request to a running daemon")
+    client.add_argument('op', choices=('decode', 'encode', 'summary'))
+    client.add_argument('string', nargs='?',
+                        help="blueprint string, or JSON data for encode (default: stdin)")
+    client.add_argument('--repeat', type=int, default=0,
+                        help="also time this many summary round trips")
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        _run_server(args)
+    else:
+        _run_client(args)
+
+
+if __name__ == "__main__":
+    main()
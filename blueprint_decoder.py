@@ -10,13 +10,17 @@ import zlib
 import base64
 import sys
 
+from blueprint_stream import encode_blueprint_stream
+from codec_profile import CodecProfiler, stage
 
-def decode_blueprint(blueprint_string):
+
+def decode_blueprint(blueprint_string, profiler=None):
     """
     Decodes a Factorio blueprint string into a Python dictionary.
     
     Args:
         blueprint_string: The encoded blueprint string from Factorio
+        profiler: Optional CodecProfiler to record each stage
         
     Returns:
         dict: The decoded blueprint data
@@ -26,88 +30,142 @@ def decode_blueprint(blueprint_string):
     encoded_data = blueprint_string[1:]
     
     # Decode from base64
-    compressed_data = base64.b64decode(encoded_data)
+    with stage(profiler, 'base64', len(encoded_data)) as record:
+        compressed_data = base64.b64decode(encoded_data)
+        record.bytes_out = len(compressed_data)
     
     # Decompress with zlib
-    json_string = zlib.decompress(compressed_data).decode('utf-8')
+    with stage(profiler, 'inflate', len(compressed_data)) as record:
+        json_bytes = zlib.decompress(compressed_data)
+        record.bytes_out = len(json_bytes)
+    
+    with stage(profiler, 'utf8', len(json_bytes)) as record:
+        json_string = json_bytes.decode('utf-8')
+        record.bytes_out = len(json_string)
     
     # Parse JSON
-    blueprint_data = json.loads(json_string)
+    with stage(profiler, 'json', len(json_string)):
+        blueprint_data = json.loads(json_string)
     
     return blueprint_data, version_byte
 
 
-def encode_blueprint(blueprint_data, version_byte='0'):
+def encode_blueprint(blueprint_data, version_byte='0', profiler=None):
     """
     Encodes a blueprint dictionary back into a Factorio blueprint string.
     
     Args:
         blueprint_data: The blueprint data as a Python dictionary
         version_byte: The version byte to use (default '0')
+        profiler: Optional CodecProfiler to record each stage
         
     Returns:
         str: The encoded blueprint string
     """
-    # Convert to JSON string
-    json_string = json.dumps(blueprint_data)
-    
-    # Compress with zlib
-    compressed = zlib.compress(json_string.encode('utf-8'))
-    
-    # Encode to base64
-    encoded = base64.b64encode(compressed).decode('utf-8')
-    
-    # Add version byte
-    blueprint_string = version_byte + encoded
-    
-    return blueprint_string
+    # Serialize, compress and base64-encode piece by piece, so the JSON text
+    # and compressed bytes are never held as whole copies
+    return encode_blueprint_stream(blueprint_data, version_byte=version_byte,
+                                   profiler=profiler)
+
+
+def summarize_blueprint(blueprint_data):
+    """
+    Collects the facts print_blueprint_summary shows into a dictionary.
+
+    Args:
+        blueprint_data: The decoded blueprint data
+
+    Returns:
+        dict: Type, label, version and entity/tile/blueprint counts
+    """
+    summary = {}
+
+    if 'blueprint' in blueprint_data:
+        bp = blueprint_data['blueprint']
+        summary['type'] = 'blueprint'
+        if 'label' in bp:
+            summary['label'] = bp['label']
+
+        if 'entities' in bp:
+            summary['entities'] = len(bp['entities'])
+
+            # Count entity types (an EntityTable counts its name column)
+            if hasattr(bp['entities'], 'name_counts'):
+                entity_types = bp['entities'].name_counts()
+            else:
+                entity_types = {}
+                for entity in bp['entities']:
+                    name = entity.get('name', 'unknown')
+                    entity_types[name] = entity_types.get(name, 0) + 1
+            summary['entity_types'] = dict(sorted(entity_types.items()))
+
+        if 'tiles' in bp:
+            summary['tiles'] = len(bp['tiles'])
+        if 'version' in bp:
+            summary['version'] = bp['version']
+
+    elif 'blueprint_book' in blueprint_data:
+        book = blueprint_data['blueprint_book']
+        summary['type'] = 'blueprint_book'
+        if 'label' in book:
+            summary['label'] = book['label']
+        if 'blueprints' in book:
+            summary['blueprints'] = len(book['blueprints'])
+
+    return summary
 
 
 def print_blueprint_summary(blueprint_data):
     """
     Prints a summary of what's in the blueprint.
     """
+    summary = summarize_blueprint(blueprint_data)
+
     print("\n" + "="*60)
     print("BLUEPRINT SUMMARY")
     print("="*60)
     
-    if 'blueprint' in blueprint_data:
-        bp = blueprint_data['blueprint']
-        
+    if summary.get('type') == 'blueprint':
         # Print label if it exists
-        if 'label' in bp:
-            print(f"Label: {bp['label']}")
+        if 'label' in summary:
+            print(f"Label: {summary['label']}")
         
         # Print entities
-        if 'entities' in bp:
-            print(f"\nEntities: {len(bp['entities'])}")
-            
-            # Count entity types
-            entity_types = {}
-            for entity in bp['entities']:
-                name = entity.get('name', 'unknown')
-                entity_types[name] = entity_types.get(name, 0) + 1
+        if 'entities' in summary:
+            print(f"\nEntities: {summary['entities']}")
             
             print("\nEntity breakdown:")
-            for entity_type, count in sorted(entity_types.items()):
+            for entity_type, count in summary['entity_types'].items():
                 print(f"  - {entity_type}: {count}")
         
         # Print tiles if they exist
-        if 'tiles' in bp:
-            print(f"\nTiles: {len(bp['tiles'])}")
+        if 'tiles' in summary:
+            print(f"\nTiles: {summary['tiles']}")
         
         # Print version
-        if 'version' in bp:
-            print(f"\nVersion: {bp['version']}")
+        if 'version' in summary:
+            print(f"\nVersion: {summary['version']}")
     
-    elif 'blueprint_book' in blueprint_data:
-        book = blueprint_data['blueprint_book']
+    elif summary.get('type') == 'blueprint_book':
         print("Type: Blueprint Book")
-        if 'label' in book:
-            print(f"Label: {book['label']}")
-        if 'blueprints' in book:
-            print(f"Contains {len(book['blueprints'])} blueprints")
-    
+        if 'label' in summary:
+            print(f"Label: {summary['label']}")
+        if 'blueprints' in summary:
+            print(f"Contains {summary['blueprints']} blueprints")
+
+        # Totals over every blueprint inside, including nested books
+        from blueprint_stats import collect_stats
+        totals = collect_stats(blueprint_data)['totals']
+        print(f"\nBlueprints (all levels): {totals['blueprints']}")
+        print(f"Nested books: {totals['books']}")
+        print(f"Entities: {totals['entities']}")
+        if totals['entity_counts']:
+            print("\nEntity breakdown:")
+            for entity_type, count in sorted(totals['entity_counts'].items()):
+                print(f"  - {entity_type}: {count}")
+        if totals['tile_area']:
+            print(f"\nTiles: {totals['tile_area']}")
+
     print("="*60 + "\n")
 
 
@@ -130,19 +188,43 @@ def load_from_file(filename):
     return data
 
 
+def print_profile(profiler, flags):
+    """
+    Prints and/or writes the per-stage breakdown requested on the command line.
+    """
+    for flag in flags:
+        if flag == '--profile':
+            print("\nCodec Profile:")
+            print(profiler.format_table())
+        elif flag.startswith('--profile-json='):
+            path = flag.split('=', 1)[1]
+            if path == '-':
+                print(profiler.to_json())
+            else:
+                with open(path, 'w') as f:
+                    f.write(profiler.to_json())
+                print(f"Profile written to: {path}")
+
+
 def main():
     print("Factorio Blueprint Decoder/Encoder")
     print("="*60)
     
-    if len(sys.argv) > 1:
+    # --profile prints a per-stage breakdown; --profile-json=PATH writes it
+    # as JSON ('-' for stdout)
+    args = [a for a in sys.argv[1:] if not a.startswith('--profile')]
+    profile_flags = [a for a in sys.argv[1:] if a.startswith('--profile')]
+    profiler = CodecProfiler(trace_memory=True) if profile_flags else None
+    
+    if args:
         # If argument provided, treat it as blueprint string or filename
-        arg = sys.argv[1]
+        arg = args[0]
         
         if arg.endswith('.json'):
             # Load from file and encode
             print(f"Loading from file: {arg}")
             blueprint_data = load_from_file(arg)
-            blueprint_string = encode_blueprint(blueprint_data)
+            blueprint_string = encode_blueprint(blueprint_data, profiler=profiler)
             print("\nEncoded Blueprint String:")
             print("-"*60)
             print(blueprint_string)
@@ -150,7 +232,7 @@ def main():
         else:
             # Decode blueprint string
             print("Decoding blueprint string...")
-            blueprint_data, version_byte = decode_blueprint(arg)
+            blueprint_data, version_byte = decode_blueprint(arg, profiler=profiler)
             
             print_blueprint_summary(blueprint_data)
             
@@ -166,11 +248,17 @@ def main():
             print(f"\nYou can now edit '{filename}' and run:")
             print(f"  python3 {sys.argv[0]} {filename}")
             print("to re-encode it back to a blueprint string.")
+        
+        if profiler is not None:
+            print_profile(profiler, profile_flags)
     else:
         # Interactive mode
         print("\nUsage:")
         print(f"  Decode: python3 {sys.argv[0]} <blueprint_string>")
         print(f"  Encode: python3 {sys.argv[0]} <blueprint_file.json>")
+        print("  Batch:  python3 blueprint_batch.py <directory | strings.txt | ->")
+        print("  Add --profile for a per-stage timing breakdown, or")
+        print("  --profile-json=<file | -> to write it as JSON")
         print("\nExample blueprint string:")
         example = "0eJyVUdtKxEAM/ZVlnl3Yrq6rPizob4gM0zargc6FTKZYSv/dTFrQBxF8muSc5OQkM5t2KJAIA5un3WywiyFL9DqbjO/BDYrylEACgwze3OxMcF7zHjrsgfZd9C0Gx5HMIjSGHj6Fb5Y3ySAwMsKmqtlkQ/EtUK35W07YFLP0x6BOquxBwKm+dVaPBN1GV0L8M8XBtvDhRoykXZuwFbJXrazwFSmz/WXPEYmLYD+8rVX7Z12wHomdnmyd6ZMj9SuVl9oWC6fyT+2XTTtNYrQEtleK3mIQIam6uiHDsuhJ9R+k8fvvBByB8nqH40Nzd348nk/Nqbm9PyzLF/gIndQ="
         print(f"\n  python3 {sys.argv[0]} '{example}'")
@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+"""
+Structural diff and patch between two versions of a blueprint.
+Entities are matched by name and position through a hash index, so
+renumbering does not show up as a change, and the remaining entities are
+paired by their settings to detect moves. Both passes are linear in the
+number of entities. The patch is plain JSON: entities and wire ends are
+addressed by [name, x, y], never by entity_number, so it applies to any
+copy of the old blueprint. Book children are matched on their canonical
+digest (blueprint_canonical.py), then by label, then by kind and slot.
+
+Entities are assumed to be unique per name and position. Power pole
+'neighbours' of Factorio 1.x blueprints are not diffed.
+"""
+
+import argparse
+import copy
+import json
+import sys
+import time
+from collections import Counter
+
+from blueprint_canonical import canonical_digest, canonical_json
+from blueprint_lazy import KINDS
+from circuit_sim import iter_circuit_wires
+from wire_graph import WireGraph
+
+
+# Entity keys that are not settings: identity, placement and wires
+_NOT_SETTINGS = frozenset(('entity_number', 'position', 'connections', 'neighbours'))
+_BLUEPRINT_CONTENT = ('entities', 'wires', 'tiles')
+
+
+def entity_key(entity):
+    """
+    Returns the (name, x, y) key entities are matched by.
+    """
+    position = entity.get('position') or {}
+    return entity.get('name'), position.get('x', 0), position.get('y', 0)
+
+
+def _settings(entity):
+    return {k: v for k, v in entity.items() if k not in _NOT_SETTINGS}
+
+
+def _kind(data):
+    return next((kind for kind in KINDS if kind in data), None)
+
+
+def _content_hash(child):
+    # Book children hash without their slot index; renumbered or
+    # reordered entities hash the same
+    return canonical_digest({k: v for k, v in child.items() if k != 'index'})
+
+
+def _diff_fields(old, new, skip):
+    # {'set': {...}, 'unset': [...]} for the top-level keys that differ
+    changed = {k: v for k, v in new.items()
+               if k not in skip and (k not in old or old[k] != v)}
+    removed = [k for k in old if k not in skip and k not in new]
+    result = {}
+    if changed:
+        result['set'] = changed
+    if removed:
+        result['unset'] = removed
+    return result
+
+
+def _apply_fields(target, fields):
+    target.update(copy.deepcopy(fields.get('set', {})))
+    for key in fields.get('unset', []):
+        target.pop(key, None)
+
+
+def _wire_pairs(bp):
+    # Wires as ((entity, connector), (entity, connector)) in either format
+    if 'wires' in bp:
+        return (((w[0], w[1]), (w[2], w[3])) for w in bp['wires'])
+    return iter_circuit_wires(bp.get('entities', []), [])
+
+
+def _wire_set(bp, key_of):
+    # Wires with entity numbers replaced by keys, each direction folded
+    wires = set()
+    for (e1, c1), (e2, c2) in _wire_pairs(bp):
+        k1, k2 = key_of.get(e1), key_of.get(e2)
+        if k1 is None or k2 is None:
+            continue
+        a, b = (*k1, c1), (*k2, c2)
+        if a != b:
+            wires.add((a, b) if a <= b else (b, a))
+    return wires
+
+
+def _links(bp):
+    # Entity number -> its sorted wires as (connector, neighbour name,
+    # dx, dy, neighbour connector); unchanged when a wired group moves
+    by_number = {e.get('entity_number'): entity_key(e) for e in bp.get('entities', [])}
+    links = {}
+    for (e1, c1), (e2, c2) in _wire_pairs(bp):
+        k1, k2 = by_number.get(e1), by_number.get(e2)
+        if k1 is None or k2 is None:
+            continue
+        links.setdefault(e1, []).append((c1, k2[0], k2[1] - k1[1], k2[2] - k1[2], c2))
+        links.setdefault(e2, []).append((c2, k1[0], k1[1] - k2[1], k1[2] - k2[2], c1))
+    return {number: tuple(sorted(set(ends))) for number, ends in links.items()}
+
+
+def _signature(entity, links):
+    settings = canonical_json(_settings(entity))
+    if links is None:
+        return settings
+    return settings, links.get(entity.get('entity_number'), ())
+
+
+def _pair_moves(new_entities, old_entities, new_links, old_links, votes):
+    # Pairs entities with equal settings (and wiring, given links).
+    # Unambiguous pairs go first and add to `votes` for how far things
+    # moved; where several look-alikes compete, the one sitting at a
+    # popular displacement wins.
+    old_by_signature = {}
+    for entity in old_entities:
+        old_by_signature.setdefault(_signature(entity, old_links), {})[entity_key(entity)] = entity
+    signed = [(entity, _signature(entity, new_links)) for entity in new_entities]
+    new_counts = Counter(signature for _, signature in signed)
+
+    pairs, pending = [], []
+    for entity, signature in signed:
+        group = old_by_signature.get(signature)
+        if group and len(group) == 1 and new_counts[signature] == 1:
+            before = group.popitem()[1]
+            pairs.append((before, entity))
+            (_, x, y), (_, old_x, old_y) = entity_key(entity), entity_key(before)
+            votes[x - old_x, y - old_y] += 1
+        else:
+            pending.append((entity, signature))
+
+    shifts = [shift for shift, _ in votes.most_common(4)]
+    unmatched = []
+    for entity, signature in pending:
+        group = old_by_signature.get(signature)
+        if not group:
+            unmatched.append(entity)
+            continue
+        name, x, y = entity_key(entity)
+        before = None
+        for dx, dy in shifts:
+            before = group.pop((name, x - dx, y - dy), None)
+            if before is not None:
+                break
+        if before is None:
+            before = group.pop(next(iter(group)))
+        pairs.append((before, entity))
+    remaining = [entity for group in old_by_signature.values() for entity in group.values()]
+    return pairs, unmatched, remaining
+
+
+def _tile_map(bp):
+    return {(t['position']['x'], t['position']['y']): t['name'] for t in bp.get('tiles', [])}
+
+
+def diff_blueprint(old, new):
+    """
+    Diffs the 'blueprint' bodies of two single blueprints.
+
+    Args:
+        old, new: Decoded blueprint bodies (the dicts under 'blueprint')
+
+    Returns:
+        dict: Patch sections 'fields', 'entities', 'wires' and 'tiles';
+            sections without changes are left out
+    """
+    old_entities = old.get('entities', [])
+    new_entities = new.get('entities', [])
+
+    # Pass 1: same name at the same position
+    by_key = {}
+    for entity in old_entities:
+        by_key.setdefault(entity_key(entity), []).append(entity)
+    changes = []
+    old_key_to_new = {}          # old number -> key in the new blueprint
+    unmatched_new = []
+    for entity in new_entities:
+        key = entity_key(entity)
+        candidates = by_key.get(key)
+        if not candidates:
+            unmatched_new.append(entity)
+            continue
+        before = candidates.pop(0)
+        old_key_to_new[before.get('entity_number')] = key
+        fields = _diff_fields(before, entity, _NOT_SETTINGS)
+        if fields:
+            changes.append([list(key), fields.get('set', {}), fields.get('unset', [])])
+
+    # Pass 2: what is left pairs up by identical settings (a move); first
+    # also requiring the same wiring around it, so look-alike combinators
+    # of a group moved together keep their own wires
+    old_links, new_links = _links(old), _links(new)
+    remaining = [e for candidates in by_key.values() for e in candidates]
+    moves, votes = [], Counter()
+    for wired in (True, False):
+        pairs, unmatched_new, remaining = _pair_moves(
+            unmatched_new, remaining,
+            new_links if wired else None, old_links if wired else None, votes)
+        for before, entity in pairs:
+            key = entity_key(entity)
+            old_key_to_new[before.get('entity_number')] = key
+            moves.append([list(entity_key(before)), [key[1], key[2]]])
+    removes = [list(entity_key(e)) for e in remaining]
+
+    patch = {}
+    fields = _diff_fields(old, new, _BLUEPRINT_CONTENT)
+    if fields:
+        patch['fields'] = fields
+    entities = {}
+    for name, items in (('remove', removes), ('move', moves), ('change', changes),
+                        ('add', [{k: v for k, v in e.items()
+                                  if k not in ('entity_number', 'connections')}
+                                 for e in unmatched_new])):
+        if items:
+            entities[name] = items
+    if entities:
+        patch['entities'] = entities
+
+    # Wires compared in terms of the new keys; wires of removed entities
+    # go with them
+    new_key_of = {e.get('entity_number'): entity_key(e) for e in new_entities}
+    old_wires = _wire_set(old, old_key_to_new)
+    new_wires = _wire_set(new, new_key_of)
+    wires = {}
+    if old_wires - new_wires:
+        wires['remove'] = [[list(a), list(b)] for a, b in sorted(old_wires - new_wires)]
+    if new_wires - old_wires:
+        wires['add'] = [[list(a), list(b)] for a, b in sorted(new_wires - old_wires)]
+    if wires:
+        patch['wires'] = wires
+
+    old_tiles, new_tiles = _tile_map(old), _tile_map(new)
+    tiles = {}
+    removed = [list(p) for p in old_tiles if p not in new_tiles]
+    placed = [[name, x, y] for (x, y), name in new_tiles.items() if old_tiles.get((x, y)) != name]
+    if removed:
+        tiles['remove'] = removed
+    if placed:
+        tiles['set'] = placed
+    if tiles:
+        patch['tiles'] = tiles
+    return patch
+
+
+def diff_book(old, new):
+    """
+    Diffs the 'blueprint_book' bodies of two books.
+
+    Children with identical content are matched by hash wherever they
+    moved to; the rest pair up by kind and label, then by kind and slot
+    (their index, or else their position), and are diffed recursively.
+
+    Returns:
+        dict: Patch with 'fields' and 'children', one entry per new child:
+            {'from': old position} to reuse (and maybe 'patch') a child,
+            or {'add': child} for a new one; old children that are not
+            referenced are removed. Both are left out when unchanged.
+    """
+    old_children = old.get('blueprints', [])
+    new_children = new.get('blueprints', [])
+
+    by_hash = {}
+    for position, child in enumerate(old_children):
+        by_hash.setdefault(_content_hash(child), []).append(position)
+    entries = [None] * len(new_children)
+    used = set()
+    identical = set()
+    for i, child in enumerate(new_children):
+        positions = by_hash.get(_content_hash(child))
+        if positions:
+            entries[i] = {'from': positions.pop(0)}
+            used.add(entries[i]['from'])
+            identical.add(i)
+
+    by_label = {}
+    for position, child in enumerate(old_children):
+        if position not in used:
+            kind = _kind(child)
+            label = (child.get(kind) or {}).get('label') if kind else None
+            by_label.setdefault((kind, label), []).append(position)
+    for i, child in enumerate(new_children):
+        if entries[i] is not None:
+            continue
+        kind = _kind(child)
+        positions = by_label.get((kind, (child.get(kind) or {}).get('label') if kind else None))
+        if positions:
+            entries[i] = {'from': positions.pop(0)}
+            used.add(entries[i]['from'])
+
+    # Relabelled children: same kind, preferably the same slot
+    by_kind = {}
+    for position, child in enumerate(old_children):
+        if position not in used:
+            slots = by_kind.setdefault(_kind(child), {})
+            slot = child.get('index', position)
+            slots[slot if slot not in slots else (None, position)] = position
+    for i, child in enumerate(new_children):
+        if entries[i] is not None:
+            continue
+        slots = by_kind.get(_kind(child))
+        if slots:
+            slot = child.get('index', i)
+            entries[i] = {'from': slots.pop(slot if slot in slots else next(iter(slots)))}
+        else:
+            entries[i] = {'add': {k: v for k, v in child.items() if k != 'index'}}
+
+    for i, entry in enumerate(entries):
+        if 'from' in entry and i not in identical:
+            child_patch = diff(old_children[entry['from']], new_children[i])
+            if child_patch:
+                entry['patch'] = child_patch
+
+    patch = {}
+    for i, child in enumerate(new_children):
+        if 'index' in child:
+            entries[i]['index'] = child['index']
+    unchanged = len(old_children) == len(new_children) and all(
+        entry.get('from') == i and 'patch' not in entry
+        and old_children[i].get('index') == new_children[i].get('index')
+        for i, entry in enumerate(entries))
+    if not unchanged:
+        patch['children'] = entries
+    fields = _diff_fields(old, new, ('blueprints',))
+    if fields:
+        patch['fields'] = fields
+    return patch
+
+
+def diff(old_data, new_data):
+    """
+    Diffs two decoded blueprint strings of any kind.
+
+    Args:
+        old_data, new_data: Decoded blueprint data
+
+    Returns:
+        dict: The patch; {} when nothing changed
+    """
+    kind = _kind(old_data)
+    if kind != _kind(new_data) or kind not in ('blueprint', 'blueprint_book'):
+        return {} if old_data == new_data else {'replace': new_data}
+    body = diff_blueprint if kind == 'blueprint' else diff_book
+    patch = body(old_data[kind], new_data[kind])
+    return {kind: patch} if patch else {}
+
+
+def _apply_blueprint(bp, patch):
+    entities = bp.get('entities', [])
+    legacy = 'wires' not in bp and any('connections' in e for e in entities)
+    # 1.x wires live on the entities, so edits go through a wire graph
+    graph = WireGraph({'blueprint': bp}) if legacy else None
+
+    by_key = {}
+    for entity in entities:
+        by_key.setdefault(entity_key(entity), entity)
+
+    def lookup(key):
+        entity = by_key.get(tuple(key))
+        if entity is None:
+            raise ValueError(f"Patch does not apply: no {key[0]} at ({key[1]}, {key[2]})")
+        return entity
+
+    section = patch.get('entities', {})
+    removed = set()
+    for key in section.get('remove', []):
+        number = lookup(key)['entity_number']
+        del by_key[tuple(key)]
+        removed.add(number)
+        if graph is not None:
+            graph.remove_entity(number)
+    # Moves may swap places, so all are lifted before any is put down
+    moving = [(lookup(key), to) for key, to in section.get('move', [])]
+    for key, _ in section.get('move', []):
+        del by_key[tuple(key)]
+    for entity, (x, y) in moving:
+        entity['position'] = dict(entity.get('position') or {}, x=x, y=y)
+        by_key[entity_key(entity)] = entity
+    for key, values, unset in section.get('change', []):
+        entity = lookup(key)
+        entity.update(copy.deepcopy(values))
+        for name in unset:
+            entity.pop(name, None)
+
+    entities = [e for e in entities if e['entity_number'] not in removed]
+    next_number = max((e['entity_number'] for e in entities), default=0) + 1
+    for added in section.get('add', []):
+        entity = copy.deepcopy(added)
+        entity['entity_number'] = next_number
+        next_number += 1
+        entities.append(entity)
+        by_key[entity_key(entity)] = entity
+        if graph is not None:
+            graph.add_entity(entity)
+    bp['entities'] = entities
+
+    wires = patch.get('wires', {})
+
+    def ends(wire):
+        (*a, c1), (*b, c2) = wire
+        return lookup(a)['entity_number'], c1, lookup(b)['entity_number'], c2
+
+    if graph is not None:
+        for wire in wires.get('remove', []):
+            graph.remove_wire(*ends(wire))
+        for wire in wires.get('add', []):
+            graph.add_wire(*ends(wire))
+        graph.to_blueprint()
+    elif 'wires' in bp or wires:
+        dropped = set()
+        for wire in wires.get('remove', []):
+            e1, c1, e2, c2 = ends(wire)
+            dropped.update(((e1, c1, e2, c2), (e2, c2, e1, c1)))
+        kept = [w for w in bp.get('wires', [])
+                if w[0] not in removed and w[2] not in removed and tuple(w[:4]) not in dropped]
+        kept.extend(list(ends(wire)) for wire in wires.get('add', []))
+        if kept:
+            bp['wires'] = kept
+        else:
+            bp.pop('wires', None)
+
+    tiles = patch.get('tiles')
+    if tiles:
+        placed = _tile_map(bp)
+        for x, y in tiles.get('remove', []):
+            placed.pop((x, y), None)
+        for name, x, y in tiles.get('set', []):
+            placed[(x, y)] = name
+        if placed:
+            bp['tiles'] = [{'name': name, 'position': {'x': x, 'y': y}}
+                           for (x, y), name in placed.items()]
+        else:
+            bp.pop('tiles', None)
+
+    _apply_fields(bp, patch.get('fields', {}))
+
+
+def _apply_book(book, patch):
+    if 'children' in patch:
+        old_children = book.get('blueprints', [])
+        children = []
+        for entry in patch['children']:
+            if 'add' in entry:
+                child = copy.deepcopy(entry['add'])
+            else:
+                child = old_children[entry['from']]
+                if 'patch' in entry:
+                    apply_patch(child, entry['patch'])
+            if 'index' in entry:
+                child['index'] = entry['index']
+            children.append(child)
+        book['blueprints'] = children
+    _apply_fields(book, patch.get('fields', {}))
+
+
+def apply_patch(blueprint_data, patch):
+    """
+    Applies a patch from diff() to the old blueprint data, in place.
+
+    Entities keep their numbers; added ones are numbered after the
+    highest existing number.
+
+    Returns:
+        dict: The same blueprint data
+
+    Raises:
+        ValueError: If an entity the patch refers to is not there
+    """
+    if 'replace' in patch:
+        blueprint_data.clear()
+        blueprint_data.update(copy.deepcopy(patch['replace']))
+    elif 'blueprint' in patch:
+        _apply_blueprint(blueprint_data['blueprint'], patch['blueprint'])
+    elif 'blueprint_book' in patch:
+        _apply_book(blueprint_data['blueprint_book'], patch['blueprint_book'])
+    return blueprint_data
+
+
+def summarize_patch(patch, counts=None):
+    """
+    Counts the changes in a patch, including those in book children.
+
+    Returns:
+        dict: Counters such as 'entities.add', 'wires.remove',
+            'children.add'
+    """
+    counts = {} if counts is None else counts
+
+    def count(name, amount):
+        if amount:
+            counts[name] = counts.get(name, 0) + amount
+
+    if 'replace' in patch:
+        count('replaced', 1)
+    body = patch.get('blueprint', {})
+    for section in ('entities', 'wires', 'tiles'):
+        for name, items in body.get(section, {}).items():
+            count(f"{section}.{name}", len(items))
+    book = patch.get('blueprint_book', {})
+    for entry in book.get('children', []):
+        if 'add' in entry:
+            count('children.add', 1)
+        elif 'patch' in entry:
+            count('children.change', 1)
+            summarize_patch(entry['patch'], counts)
+    for fields in (body.get('fields'), book.get('fields')):
+        if fields:
+            count('fields', len(fields.get('set', {})) + len(fields.get('unset', [])))
+    return counts
+
+
+def main():
+    from blueprint_benchmark import synthetic_blueprint
+    from blueprint_decoder import decode_blueprint
+
+    parser = argparse.ArgumentParser(description="Diff two blueprint strings.")
+    parser.add_argument('old', nargs='?', help="file with the old blueprint string")
+    parser.add_argument('new', nargs='?', help="file with the new blueprint string")
+    parser.add_argument('--json', action='store_true', help="print the patch as JSON")
+    args = parser.parse_args()
+
+    print("Blueprint Diff", file=sys.stderr)
+    print("="*60, file=sys.stderr)
+
+    if args.old and args.new:
+        with open(args.old, 'r') as f:
+            old_data = decode_blueprint(f.read().strip())[0]
+        with open(args.new, 'r') as f:
+            new_data = decode_blueprint(f.read().strip())[0]
+    else:
+        print("(no blueprint files given; diffing a generated blueprint against "
+              "an edited copy)", file=sys.stderr)
+        old_data = synthetic_blueprint(entities=100000, wired_deciders=2000)
+        new_data = copy.deepcopy(old_data)
+        entities = new_data['blueprint']['entities']
+        entities.reverse()
+        numbers = {}
+        for number, entity in enumerate(entities, 1):
+            numbers[entity['entity_number']] = number
+            entity['entity_number'] = number
+        for wire in new_data['blueprint'].get('wires', []):
+            wire[0], wire[2] = numbers[wire[0]], numbers[wire[2]]
+        for entity in entities[:100]:
+            entity['position'] = dict(entity['position'], y=entity['position']['y'] - 1000)
+        for entity in entities[100:200]:
+            entity['direction'] = (entity.get('direction', 0) + 4) % 16
+        del entities[200:300]
+
+    start = time.perf_counter()
+    patch = diff(old_data, new_data)
+    elapsed = time.perf_counter() - start
+    print(f"Diffed in {elapsed:.3f}s", file=sys.stderr)
+    for name, value in sorted(summarize_patch(patch).items()):
+        print(f"  {name}: {value}", file=sys.stderr)
+
+    patched = copy.deepcopy(old_data)
+    start = time.perf_counter()
+    apply_patch(patched, patch)
+    elapsed = time.perf_counter() - start
+    leftover = diff(patched, new_data)
+    print(f"Applied in {elapsed:.3f}s; "
+          f"{'matches the new version' if not leftover else 'DOES NOT match the new version'}",
+          file=sys.stderr)
+    if args.json:
+        print(json.dumps(patch, separators=(',', ':')))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,9 @@ to programmatically manipulate Factorio blueprints.
 
 import sys
 sys.path.insert(0, '/home/claude')
+from blueprint_builder import Blueprint, Condition, Entity, Signal
 from blueprint_decoder import decode_blueprint, encode_blueprint
+from spatial_index import SpatialIndex
 import json
 
 
@@ -62,53 +64,28 @@ def example_add_multiple_combinators():
     """
     Example: Create a blueprint with multiple decider combinators.
     """
-    blueprint_data = {
-        "blueprint": {
-            "icons": [
-                {
-                    "signal": {
-                        "type": "item",
-                        "name": "decider-combinator"
-                    },
-                    "index": 1
-                }
-            ],
-            "entities": [],
-            "item": "blueprint",
-            "version": 281479275151360
-        }
-    }
+    blueprint = Blueprint(icons=[Signal('decider-combinator', type='item')],
+                          version=281479275151360)
+    each = Signal('signal-each', type='virtual')
+    
+    # Track placed entities so each new one can be checked for collisions
+    index = SpatialIndex()
     
     # Add 5 decider combinators in a row
     for i in range(5):
-        combinator = {
-            "entity_number": i + 1,
-            "name": "decider-combinator",
-            "position": {
-                "x": i * 2,  # Space them 2 tiles apart
-                "y": 0
-            },
-            "direction": 0,
-            "control_behavior": {
-                "decider_conditions": {
-                    "first_signal": {
-                        "type": "virtual",
-                        "name": f"signal-{i}"
-                    },
-                    "constant": i * 10,
-                    "comparator": ">",
-                    "output_signal": {
-                        "type": "virtual",
-                        "name": "signal-each"
-                    },
-                    "copy_count_from_input": True
-                }
-            }
-        }
-        blueprint_data['blueprint']['entities'].append(combinator)
+        if not index.can_place("decider-combinator", i * 2, 0):
+            continue
+        
+        condition = Condition(Signal(f'signal-{i}', type='virtual'), '>', constant=i * 10,
+                              output_signal=each, copy_count_from_input=True)
+        # Space them 2 tiles apart
+        combinator = Entity('decider-combinator', i * 2, 0, direction=0, decider=condition,
+                            entity_number=i + 1)
+        blueprint.add(combinator)
+        index.add(combinator.to_data())
     
     # Encode
-    blueprint_string = encode_blueprint(blueprint_data)
+    blueprint_string = blueprint.encode()
     
     print("Created blueprint with 5 decider combinators:")
     print(blueprint_string)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Lazy, on-demand views of blueprint books.
+The blueprint string is inflated once, then the JSON text is scanned for
+the byte span of every child blueprint together with its label and icons.
+A child is only parsed into dicts when its contents are read, and nested
+books are indexed the same way the first time they are opened, so listing
+a huge book costs a fraction of the time and memory of a full decode.
+"""
+
+import base64
+import json
+import re
+import sys
+import time
+import zlib
+from collections.abc import Mapping
+
+from blueprint_stream import DEFAULT_MAX_INFLATED_SIZE
+
+
+# Keys holding the body of a blueprint-like object
+KINDS = ('blueprint', 'blueprint_book', 'upgrade_planner', 'deconstruction_planner')
+
+# Unrolled loops: every character can match only one way, so a failed
+# match backtracks in linear time. From 3.11 the loops are also made
+# possessive, which skips the backtracking bookkeeping (about 3x faster)
+_P = b'+' if sys.version_info >= (3, 11) else b''
+_STRING = rb'"[^"\\]*' + _P + rb'(?:\\.[^"\\]*' + _P + rb')*' + _P + rb'"'
+_PLAIN = rb'[^"{}\[\]]*' + _P
+# Bracket nesting the single-regex skip handles; deeper values fall back
+# to counting brackets one at a time
+_BALANCED_DEPTH = 16
+
+
+def _balanced_pattern(depth):
+    # A bracketed value nested at most `depth` levels, matched in C
+    pattern = rb'[{\[]' + _PLAIN + rb'(?:' + _STRING + _PLAIN + rb')*' + _P + rb'[}\]]'
+    for _ in range(depth - 1):
+        pattern = (rb'[{\[]' + _PLAIN + rb'(?:(?:' + _STRING + rb'|' + pattern + rb')'
+                   + _PLAIN + rb')*' + _P + rb'[}\]]')
+    return re.compile(pattern)
+
+
+_BALANCED = _balanced_pattern(_BALANCED_DEPTH)
+_SKIP = re.compile(_PLAIN + rb'(?:' + _STRING + _PLAIN + rb')*' + _P)
+_STRING_RE = re.compile(_STRING)
+_SCALAR = re.compile(rb'[^\s,\]}]+')
+_WHITESPACE = re.compile(rb'\s*')
+
+_OPEN_OBJECT, _OPEN_ARRAY = ord('{'), ord('[')
+_CLOSE_OBJECT, _CLOSE_ARRAY = ord('}'), ord(']')
+_QUOTE, _COLON, _COMMA = ord('"'), ord(':'), ord(',')
+
+
+def inflate_blueprint(blueprint_string, max_inflated_size=DEFAULT_MAX_INFLATED_SIZE):
+    """
+    Decodes a blueprint string as far as its JSON bytes.
+
+    Args:
+        blueprint_string: The encoded blueprint string (str or bytes)
+        max_inflated_size: Largest amount of inflated JSON to accept, in bytes
+            (None for no limit)
+
+    Returns:
+        tuple: (JSON bytes, version byte)
+    """
+    if isinstance(blueprint_string, bytes):
+        blueprint_string = blueprint_string.decode('ascii')
+    blueprint_string = blueprint_string.strip()
+    version_byte = blueprint_string[0]
+    compressed = base64.b64decode(blueprint_string[1:])
+
+    decompressor = zlib.decompressobj()
+    limit = 0 if max_inflated_size is None else max_inflated_size + 1
+    data = decompressor.decompress(compressed, limit)
+    if max_inflated_size is not None and len(data) > max_inflated_size:
+        raise ValueError(f"Blueprint inflates past {max_inflated_size} bytes")
+    if not decompressor.eof:
+        raise ValueError("Truncated blueprint string")
+    return data, version_byte
+
+
+def _skip_brackets(data, pos):
+    # Slow path for values nested deeper than _BALANCED handles
+    depth = 0
+    skip = _SKIP.match
+    while True:
+        pos = skip(data, pos).end()
+        c = data[pos]
+        pos += 1
+        if c == _QUOTE:
+            raise ValueError(f"Unterminated string at byte {pos - 1}")
+        if c == _OPEN_OBJECT or c == _OPEN_ARRAY:
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _skip_value(data, pos):
+    # Returns the end of the JSON value starting at pos
+    c = data[pos]
+    if c == _OPEN_OBJECT or c == _OPEN_ARRAY:
+        m = _BALANCED.match(data, pos)
+        return m.end() if m is not None else _skip_brackets(data, pos)
+    m = (_STRING_RE if c == _QUOTE else _SCALAR).match(data, pos)
+    if m is None:
+        raise ValueError(f"Invalid JSON value at byte {pos}")
+    return m.end()
+
+
+def _scan(data, start, descend, path=()):
+    """
+    Indexes the members of the object or array opening at data[start].
+
+    Members whose path satisfies descend(path) are indexed the same way;
+    all other values are skipped without being parsed.
+
+    Returns:
+        tuple: ({key or index: (start, end, members or None)}, end)
+    """
+    ws = _WHITESPACE.match
+    is_object = data[start] == _OPEN_OBJECT
+    close = _CLOSE_OBJECT if is_object else _CLOSE_ARRAY
+    members = {}
+    pos = ws(data, start + 1).end()
+    if data[pos] == close:
+        return members, pos + 1
+
+    index = 0
+    while True:
+        if is_object:
+            m = _STRING_RE.match(data, pos)
+            if m is None:
+                raise ValueError(f"Expected object key at byte {pos}")
+            key = json.loads(m.group())
+            pos = ws(data, m.end()).end()
+            if data[pos] != _COLON:
+                raise ValueError(f"Expected ':' at byte {pos}")
+            pos = ws(data, pos + 1).end()
+        else:
+            key = index
+            index += 1
+
+        member_path = path + (key,)
+        if data[pos] in (_OPEN_OBJECT, _OPEN_ARRAY) and descend(member_path):
+            sub, end = _scan(data, pos, descend, member_path)
+        else:
+            sub, end = None, _skip_value(data, pos)
+        members[key] = (pos, end, sub)
+
+        pos = ws(data, end).end()
+        c = data[pos]
+        if c == close:
+            return members, pos + 1
+        if c != _COMMA:
+            raise ValueError(f"Expected ',' or closing bracket at byte {pos}")
+        pos = ws(data, pos + 1).end()
+
+
+def _descend_children(path):
+    # Relative to a blueprints list: each entry and the body inside it
+    return len(path) == 1 or (len(path) == 2 and path[1] in KINDS)
+
+
+def _descend_document(path):
+    # Relative to a document or book entry: the body, and for a book its
+    # blueprints list down to each child's body
+    if not path or path[0] not in KINDS:
+        return False
+    if len(path) == 1:
+        return True
+    if path[0] != 'blueprint_book' or path[1] != 'blueprints':
+        return False
+    return len(path) == 2 or _descend_children(path[2:])
+
+
+def _index(data, start, descend):
+    try:
+        return _scan(data, start, descend)
+    except IndexError:
+        raise ValueError("Truncated JSON document") from None
+
+
+class LazyObject(Mapping):
+    """
+    Read-only mapping over one JSON object inside the inflated text.
+
+    Values are parsed from their byte span each time they are read, so
+    editing a returned value does not change the view; use load() for an
+    editable copy of the whole object.
+    """
+
+    def __init__(self, data, start, end, members):
+        self._data = data
+        self.span = (start, end)
+        self._members = members
+        self._views = {}
+
+    def __getitem__(self, key):
+        if key in self._views:
+            return self._views[key]
+        start, end, sub = self._members[key]
+        return json.loads(self._data[start:end])
+
+    def __contains__(self, key):
+        return key in self._members
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def get_span(self, key):
+        """
+        Returns the (start, end) byte span of a member's value.
+        """
+        start, end, sub = self._members[key]
+        return start, end
+
+    def raw(self, key):
+        """
+        Returns the JSON text of a member's value, as bytes.
+        """
+        start, end = self.get_span(key)
+        return self._data[start:end]
+
+    def load(self):
+        """
+        Parses the whole object into plain dicts and lists.
+        """
+        start, end = self.span
+        return json.loads(self._data[start:end])
+
+    def to_json(self):
+        # Lets encode_blueprint serialize the view; nested lazy views are
+        # converted as the encoder reaches them
+        return {key: self[key] for key in self._members}
+
+
+class LazyBook(LazyObject):
+    """
+    The blueprint_book body of a LazyBlueprint. ['blueprints'] is a list of
+    LazyBlueprint children, indexed the first time it is read.
+    """
+
+    def __getitem__(self, key):
+        if key == 'blueprints' and key not in self._views and key in self._members:
+            start, end, sub = self._members[key]
+            if sub is None:
+                sub, end = _index(self._data, start, _descend_children)
+            self._views[key] = [LazyBlueprint(self._data, s, e, m)
+                                for s, e, m in sub.values()]
+        return super().__getitem__(key)
+
+
+class LazyBlueprint(LazyObject):
+    """
+    Lazy view of a blueprint string, or of one entry of a book.
+
+    Behaves like the dict decode_blueprint returns ({"blueprint": {...}},
+    {"blueprint_book": {...}}, ...), so summarize_blueprint and
+    encode_blueprint accept it directly. The label, icons and list of
+    children come from the index; entities and tiles are only parsed when
+    read.
+
+    Usage:
+        book = LazyBlueprint.from_string(blueprint_string)
+        for child in book.children:
+            print(child.index, child.kind, child.label)
+        data = book.children[3].load()
+    """
+
+    def __init__(self, data, start, end, members, version_byte=None):
+        super().__init__(data, start, end, members)
+        self.version_byte = version_byte
+        self.kind = next((key for key in members if key in KINDS), None)
+
+        if self.kind is not None:
+            body_start, body_end, body = members[self.kind]
+            if body is not None:
+                view = LazyBook if self.kind == 'blueprint_book' else LazyObject
+                self._views[self.kind] = view(data, body_start, body_end, body)
+
+    @classmethod
+    def from_string(cls, blueprint_string, max_inflated_size=DEFAULT_MAX_INFLATED_SIZE):
+        """
+        Inflates a blueprint string and indexes it.
+
+        Args:
+            blueprint_string: The encoded blueprint string (str or bytes)
+            max_inflated_size: Largest amount of inflated JSON to accept,
+                in bytes (None for no limit)
+
+        Returns:
+            LazyBlueprint: The indexed view
+        """
+        data, version_byte = inflate_blueprint(blueprint_string, max_inflated_size)
+        return cls.from_json(data, version_byte)
+
+    @classmethod
+    def from_json(cls, data, version_byte=None):
+        """
+        Indexes already inflated blueprint JSON (str or bytes).
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        start = _WHITESPACE.match(data).end()
+        if start >= len(data) or data[start] != _OPEN_OBJECT:
+            raise ValueError("Blueprint JSON must be an object")
+        members, end = _index(data, start, _descend_document)
+        return cls(data, start, end, members, version_byte)
+
+    @property
+    def body(self):
+        """
+        The view of the blueprint/book/planner body, or None.
+        """
+        return self._views.get(self.kind)
+
+    def _body_value(self, key, default=None):
+        body = self.body
+        if body is None or key not in body:
+            return default
+        return body[key]
+
+    @property
+    def is_book(self):
+        return self.kind == 'blueprint_book'
+
+    @property
+    def index(self):
+        """
+        Slot of this entry in its parent book (None at the top level).
+        """
+        return self.get('index')
+
+    @property
+    def label(self):
+        return self._body_value('label')
+
+    @property
+    def description(self):
+        return self._body_value('description')
+
+    @property
+    def icons(self):
+        return self._body_value('icons', [])
+
+    @property
+    def children(self):
+        """
+        The book's entries as LazyBlueprint views (empty for non-books).
+        """
+        if not self.is_book:
+            return []
+        return self._body_value('blueprints', [])
+
+    def walk(self, depth=0):
+        """
+        Walks this entry and every entry of nested books, depth first.
+
+        Yields:
+            tuple: (depth, LazyBlueprint)
+        """
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+
+def main():
+    from blueprint_decoder import decode_blueprint
+
+    print("Lazy Blueprint Book Listing")
+    print("="*60)
+
+    if len(sys.argv) < 2:
+        print("\nUsage:")
+        print(f"  python3 {sys.argv[0]} <blueprint_string_file>")
+        return
+
+    with open(sys.argv[1], 'r') as f:
+        blueprint_string = f.read()
+
+    start = time.perf_counter()
+    book = LazyBlueprint.from_string(blueprint_string)
+    for depth, entry in book.walk():
+        index = '' if entry.index is None else entry.index
+        print(f"{'  ' * depth}{index!s:>4} {entry.kind:<24} {entry.label or ''}")
+    lazy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decode_blueprint(blueprint_string)
+    full = time.perf_counter() - start
+    print(f"\nLazy listing: {lazy:.3f}s, full decode: {full:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Indexed local blueprint library backed by SQLite.
+Ingests blueprint strings, books and JSON files written by save_to_file,
+stores every child blueprint once under the digest of its canonical form
+(blueprint_canonical.py, so renumbered or reordered copies count as one),
+and keeps an inverted index of entity names, signals, item/quality pairs
+and label words, so searches never decode anything. Files are only
+re-read when their size or modification time changes.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+
+from blueprint_canonical import iter_canonical_json
+from blueprint_lazy import KINDS, LazyBlueprint
+
+
+DEFAULT_LIBRARY = 'blueprint_library.db'
+
+# Keys under which blueprint JSON holds a {"type", "name", "quality"} signal
+SIGNAL_KEYS = ('signal', 'first_signal', 'second_signal', 'output_signal')
+DEFAULT_QUALITY = 'normal'
+
+_WORD = re.compile(r'\w+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blueprints (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    label TEXT,
+    entities INTEGER NOT NULL,
+    tiles INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL,
+    blueprint_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (term, blueprint_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS entries (
+    source_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    blueprint_id INTEGER NOT NULL,
+    PRIMARY KEY (source_id, path)
+);
+CREATE INDEX IF NOT EXISTS entries_blueprint ON entries (blueprint_id);
+"""
+
+
+def _add(terms, term):
+    terms[term] = terms.get(term, 0) + 1
+
+
+def _add_item(terms, name, quality):
+    _add(terms, f"item:{name}")
+    _add(terms, f"item:{name}@{quality or DEFAULT_QUALITY}")
+    _add(terms, f"quality:{quality or DEFAULT_QUALITY}")
+
+
+def _collect_signals(value, terms):
+    # Finds signals and filter lists anywhere inside entity settings
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in SIGNAL_KEYS and isinstance(item, dict) and 'name' in item:
+                _add(terms, f"signal:{item['name']}")
+                if item.get('quality'):
+                    _add_item(terms, item['name'], item['quality'])
+            elif key == 'filters' and isinstance(item, list):
+                for entry in item:
+                    if isinstance(entry, dict) and 'name' in entry:
+                        _add(terms, f"signal:{entry['name']}")
+                        _add_item(terms, entry['name'], entry.get('quality'))
+            elif isinstance(item, (dict, list)):
+                _collect_signals(item, terms)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_signals(item, terms)
+
+
+def index_terms(kind, body):
+    """
+    Lists the search terms of one blueprint.
+
+    Terms look like 'entity:decider-combinator', 'signal:signal-A',
+    'item:bob-ruby-4', 'item:bob-ruby-4@rare', 'quality:rare',
+    'label:smelting' and 'kind:blueprint'.
+
+    Args:
+        kind: 'blueprint', 'upgrade_planner', ...
+        body: The blueprint body (the dict under the kind key)
+
+    Returns:
+        dict: Term -> number of occurrences
+    """
+    terms = {}
+    _add(terms, f"kind:{kind}")
+    for word in _WORD.findall(str(body.get('label') or '').lower()):
+        _add(terms, f"label:{word}")
+    for entity in body.get('entities') or []:
+        name = entity.get('name')
+        if name is not None:
+            _add(terms, f"entity:{name}")
+            _add_item(terms, name, entity.get('quality'))
+        for key, value in entity.items():
+            if isinstance(value, (dict, list)):
+                _collect_signals(value, terms)
+    _collect_signals(body.get('icons') or [], terms)
+    for key in ('settings', 'filters'):
+        # Upgrade and deconstruction planners
+        if key in body:
+            _collect_signals({key: body[key]}, terms)
+    return terms
+
+
+def _iter_leaves(entry, path=()):
+    # Walks a decoded or lazy blueprint down to its non-book entries
+    if 'blueprint_book' in entry:
+        children = entry['blueprint_book'].get('blueprints') or []
+        for position, child in enumerate(children):
+            yield from _iter_leaves(child, path + (child.get('index', position),))
+    else:
+        yield path, entry
+
+
+class BlueprintLibrary:
+    """
+    SQLite store of deduplicated blueprints with an inverted index.
+
+    Usage:
+        library = BlueprintLibrary('library.db')
+        library.ingest_directory('exports/')
+        for row in library.search(entity='decider-combinator', signal='signal-A'):
+            print(row['hash'], row['label'])
+    """
+
+    def __init__(self, path=DEFAULT_LIBRARY):
+        """
+        Args:
+            path: SQLite file (':memory:' for a throwaway library)
+        """
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _source_id(self, name, size=None, mtime_ns=None):
+        self._db.execute(
+            "INSERT INTO sources (name, size, mtime_ns) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET size = excluded.size, "
+            "mtime_ns = excluded.mtime_ns", (name, size, mtime_ns))
+        source_id = self._db.execute("SELECT id FROM sources WHERE name = ?",
+                                     (name,)).fetchone()[0]
+        # Re-ingesting a source replaces what it held before
+        self._db.execute("DELETE FROM entries WHERE source_id = ?", (source_id,))
+        return source_id
+
+    def _add_blueprint(self, entry):
+        # Stores one non-book entry; returns (blueprint id, newly added)
+        if hasattr(entry, 'load'):
+            entry = entry.load()
+        kind = next((key for key in entry if key in KINDS), None)
+        if kind is None:
+            raise ValueError("Entry holds no blueprint")
+        body = entry[kind]
+        text = ''.join(iter_canonical_json({kind: body}))
+        # Same value as blueprint_canonical.canonical_digest()
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        row = self._db.execute("SELECT id FROM blueprints WHERE hash = ?",
+                               (digest,)).fetchone()
+        if row is not None:
+            return row[0], False
+
+        cursor = self._db.execute(
+            "INSERT INTO blueprints (hash, kind, label, entities, tiles, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (digest, kind, body.get('label'), len(body.get('entities') or []),
+             len(body.get('tiles') or []), zlib.compress(text.encode('utf-8'))))
+        blueprint_id = cursor.lastrowid
+        self._db.executemany(
+            "INSERT INTO terms (term, blueprint_id, count) VALUES (?, ?, ?)",
+            ((term, blueprint_id, count)
+             for term, count in index_terms(kind, body).items()))
+        return blueprint_id, True
+
+    def _ingest(self, blueprint_data, source_id, prefix=()):
+        added = duplicates = 0
+        for path, entry in _iter_leaves(blueprint_data, prefix):
+            blueprint_id, new = self._add_blueprint(entry)
+            added += new
+            duplicates += not new
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (source_id, path, blueprint_id) "
+                "VALUES (?, ?, ?)",
+                (source_id, '/'.join(map(str, path)), blueprint_id))
+        return added, duplicates
+
+    def ingest_string(self, blueprint_string, source=None):
+        """
+        Adds every blueprint of a string (children of books one by one).
+
+        Args:
+            blueprint_string: The encoded blueprint string
+            source: Name recorded for the string (default: its hash)
+
+        Returns:
+            tuple: (blueprints added, duplicates skipped)
+        """
+        if source is None:
+            source = 'string:' + hashlib.sha256(blueprint_string.encode('ascii')).hexdigest()
+        with self._db:
+            source_id = self._source_id(source)
+            return self._ingest(LazyBlueprint.from_string(blueprint_string), source_id)
+
+    def ingest_file(self, path, force=False):
+        """
+        Adds the blueprints of a file, unless it is unchanged since the
+        last ingest. '.json' files hold blueprint data; any other file holds
+        blueprint strings, one per line.
+
+        Args:
+            path: The file to read
+            force: Re-read the file even if it looks unchanged
+
+        Returns:
+            tuple: (blueprints added, duplicates skipped), or None if the
+                file was skipped
+        """
+        name = os.path.abspath(path)
+        info = os.stat(path)
+        if not force:
+            row = self._db.execute("SELECT size, mtime_ns FROM sources WHERE name = ?",
+                                   (name,)).fetchone()
+            if row is not None and tuple(row) == (info.st_size, info.st_mtime_ns):
+                return None
+
+        added = duplicates = 0
+        with self._db:
+            source_id = self._source_id(name, info.st_size, info.st_mtime_ns)
+            with open(path, 'r') as f:
+                if path.endswith('.json'):
+                    added, duplicates = self._ingest(json.load(f), source_id)
+                else:
+                    for number, line in enumerate(f, 1):
+                        line = line.strip()
+                        if not line:
+                            continue
+                        # Entries of a line are filed under its line number
+                        counts = self._ingest(LazyBlueprint.from_string(line),
+                                              source_id, (number,))
+                        added += counts[0]
+                        duplicates += counts[1]
+        return added, duplicates
+
+    def ingest_directory(self, directory, force=False):
+        """
+        Ingests every file of a directory tree, skipping unchanged files.
+        A file that cannot be read only fails itself.
+
+        Returns:
+            dict: Counts of files read, files skipped, blueprints added,
+                duplicates and failed files, and 'errors', a list of
+                (path, exception) pairs for the failed files
+        """
+        totals = {'files': 0, 'unchanged': 0, 'added': 0, 'duplicates': 0, 'failed': 0,
+                  'errors': []}
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    counts = self.ingest_file(path, force)
+                except Exception as e:
+                    # A bad file (corrupt string, broken JSON, ...) only
+                    # fails itself; its transaction was rolled back
+                    totals['errors'].append((path, e))
+                    totals['failed'] += 1
+                    continue
+                if counts is None:
+                    totals['unchanged'] += 1
+                    continue
+                totals['files'] += 1
+                totals['added'] += counts[0]
+                totals['duplicates'] += counts[1]
+        return totals
+
+    def prune(self):
+        """
+        Deletes blueprints no source refers to any more.
+
+        Returns:
+            int: Number of blueprints deleted
+        """
+        with self._db:
+            orphans = "SELECT id FROM blueprints WHERE id NOT IN (SELECT blueprint_id FROM entries)"
+            self._db.execute(f"DELETE FROM terms WHERE blueprint_id IN ({orphans})")
+            return self._db.execute(f"DELETE FROM blueprints WHERE id IN ({orphans})").rowcount
+
+    def search(self, entity=None, signal=None, item=None, quality=None,
+               label=None, kind=None, limit=None):
+        """
+        Finds blueprints matching every given condition.
+
+        Args:
+            entity: Entity name, or a list of names that must all appear
+            signal: Signal name, or a list of them
+            item: Item name, or a list of them; combined with quality it
+                matches item/quality pairs
+            quality: Quality name
+            label: Words that must all appear in the label
+            kind: 'blueprint', 'upgrade_planner', ...
+            limit: Maximum number of results
+
+        Returns:
+            list: Dicts with id, hash, kind, label, entities and tiles
+        """
+        def names(value):
+            if value is None:
+                return []
+            return [value] if isinstance(value, str) else list(value)
+
+        terms = [f"entity:{name}" for name in names(entity)]
+        terms += [f"signal:{name}" for name in names(signal)]
+        if quality is not None and item is not None:
+            terms += [f"item:{name}@{quality}" for name in names(item)]
+        else:
+            terms += [f"item:{name}" for name in names(item)]
+            if quality is not None:
+                terms.append(f"quality:{quality}")
+        if label is not None:
+            terms += [f"label:{word}" for word in _WORD.findall(label.lower())]
+        if kind is not None:
+            terms.append(f"kind:{kind}")
+
+        sql = "SELECT id, hash, kind, label, entities, tiles FROM blueprints"
+        if terms:
+            matches = " INTERSECT ".join(
+                ["SELECT blueprint_id FROM terms WHERE term = ?"] * len(terms))
+            sql += f" WHERE id IN ({matches})"
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._db.execute(sql, terms)]
+
+    def _data(self, blueprint_hash):
+        row = self._db.execute("SELECT data FROM blueprints WHERE hash = ?",
+                               (blueprint_hash,)).fetchone()
+        if row is None:
+            raise KeyError(blueprint_hash)
+        return row[0]
+
+    def get(self, blueprint_hash):
+        """
+        Returns the stored blueprint data ({"blueprint": {...}}).
+
+        The library keeps one canonical copy per blueprint (see
+        blueprint_canonical.py), so this is the canonical form, not the
+        JSON as ingested: entities are ordered by position and renumbered,
+        wires remapped and sorted, and default fields left out.
+        """
+        return json.loads(zlib.decompress(self._data(blueprint_hash)))
+
+    def get_string(self, blueprint_hash):
+        """
+        Returns the stored (canonical) blueprint as a blueprint string,
+        without re-compressing it.
+        """
+        return '0' + base64.b64encode(self._data(blueprint_hash)).decode('ascii')
+
+    def resolve(self, prefix):
+        """
+        Lists the full hashes starting with a (shortened) hash.
+        """
+        return [row[0] for row in self._db.execute(
+            "SELECT hash FROM blueprints WHERE hash LIKE ? ORDER BY hash",
+            (prefix + '%',))]
+
+    def sources_of(self, blueprint_hash):
+        """
+        Lists where a blueprint was found as (source, path in book) pairs.
+        """
+        return [tuple(row) for row in self._db.execute(
+            "SELECT sources.name, entries.path FROM entries "
+            "JOIN sources ON sources.id = entries.source_id "
+            "JOIN blueprints ON blueprints.id = entries.blueprint_id "
+            "WHERE blueprints.hash = ? ORDER BY sources.name, entries.path",
+            (blueprint_hash,))]
+
+    def stats(self):
+        """
+        Counts blueprints, index terms, sources and entries.
+        """
+        return {table: self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('blueprints', 'terms', 'sources', 'entries')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local blueprint library.")
+    parser.add_argument('--db', default=DEFAULT_LIBRARY,
+                        help=f"library file (default: {DEFAULT_LIBRARY})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help="add files or directories")
+    ingest.add_argument('paths', nargs='+')
+    ingest.add_argument('--force', action='store_true',
+                        help="re-read files even if unchanged")
+
+    search = commands.add_parser('search', help="find blueprints")
+    search.add_argument('--entity', action='append')
+    search.add_argument('--signal', action='append')
+    search.add_argument('--item', action='append')
+    search.add_argument('--quality')
+    search.add_argument('--label')
+    search.add_argument('--limit', type=int)
+
+    get = commands.add_parser('get', help="print a blueprint string by hash")
+    get.add_argument('hash')
+
+    args = parser.parse_args()
+    library = BlueprintLibrary(args.db)
+    try:
+        if args.command == 'ingest':
+            start = time.perf_counter()
+            for path in args.paths:
+                if os.path.isdir(path):
+                    totals = library.ingest_directory(path, args.force)
+                    for failed, error in totals.pop('errors'):
+                        print(f"Skipping {failed}: {type(error).__name__}: {error}",
+                              file=sys.stderr)
+                else:
+                    counts = library.ingest_file(path, args.force)
+                    totals = {'unchanged': 1} if counts is None else {
+                        'files': 1, 'added': counts[0], 'duplicates': counts[1]}
+                print(f"{path}: {totals}")
+            print(f"Done in {time.perf_counter() - start:.2f}s; library: {library.stats()}")
+        elif args.command == 'search':
+            start = time.perf_counter()
+            rows = library.search(args.entity, args.signal, args.item, args.quality,
+                                  args.label, limit=args.limit)
+            elapsed = time.perf_counter() - start
+            for row in rows:
+                print(f"{row['hash'][:16]}  {row['kind']:<12} {row['entities']:6d} entities  "
+                      f"{row['label'] or ''}")
+            print(f"{len(rows)} matches in {elapsed * 1000:.1f} ms", file=sys.stderr)
+        else:
+            matches = library.resolve(args.hash)
+            if len(matches) != 1:
+                print(f"{len(matches)} blueprints match {args.hash!r}", file=sys.stderr)
+                sys.exit(1)
+            print(library.get_string(matches[0]))
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    main()
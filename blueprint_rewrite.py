@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Rule-based mass edits over blueprint libraries.
+A list of rules (rename an entity or signal, swap a quality, replace a
+decider comparator or constant, delete entities) is compiled into lookup
+tables and applied in one pass over each blueprint's entities. Inputs are
+the same as blueprint_batch.py (a directory, a file with one string per
+line, or stdin); strings whose JSON cannot contain anything a rule looks
+for are not parsed, and blueprints no rule touched are passed through
+without re-encoding. --dry-run only counts the hits per rule.
+
+Rules are JSON objects:
+    {"op": "rename_entity", "from": "assembling-machine-2", "to": "assembling-machine-3"}
+    {"op": "rename_signal", "from": "bob-ruby-4", "to": "gem-ruby", "type": "item"}
+    {"op": "swap_quality", "from": "normal", "to": "rare"}
+    {"op": "replace_comparator", "from": ">", "to": "≥"}
+    {"op": "replace_constant", "to": 100, "from": 50, "signal": "signal-A"}
+    {"op": "delete_entity", "name": "small-lamp"}
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from blueprint_batch import iter_inputs
+from blueprint_decoder import encode_blueprint
+from blueprint_lazy import KINDS, inflate_blueprint
+from circuit_sim import DEFAULT_QUALITY
+
+
+OPERATIONS = ('rename_entity', 'rename_signal', 'swap_quality', 'replace_comparator',
+              'replace_constant', 'delete_entity')
+
+# Entity keys that never hold signals or items
+_PLAIN_KEYS = frozenset(('entity_number', 'name', 'position', 'direction', 'quality',
+                         'connections', 'neighbours'))
+
+_CHUNKS_PER_WORKER = 8
+
+
+def describe_rule(rule):
+    """
+    Returns a short text for a rule, as used in hit reports.
+    """
+    op = rule.get('op')
+    if op == 'delete_entity':
+        return f"delete_entity {rule.get('name')}"
+    if op == 'replace_constant':
+        target = f" ({rule['signal']})" if rule.get('signal') else ''
+        old = rule.get('from', '*')
+        return f"replace_constant {old} -> {rule.get('to')}{target}"
+    kind = f" [{rule['type']}]" if rule.get('type') else ''
+    return f"{op} {rule.get('from')} -> {rule.get('to')}{kind}"
+
+
+def _needles(text):
+    # The ways a JSON string value can appear in the inflated bytes
+    return {json.dumps(text).encode(), json.dumps(text, ensure_ascii=False).encode('utf-8')}
+
+
+class Rewriter:
+    """
+    Rules compiled into lookup tables for a single pass per blueprint.
+
+    Rules are applied to the values the blueprint had when the pass
+    started, so chains (a -> b, b -> c) do not cascade.
+
+    Usage:
+        rewriter = Rewriter([{"op": "rename_signal", "from": "a", "to": "b"}])
+        hits = rewriter.rewrite(blueprint_data)    # edits in place
+        new_string, hits = rewriter.rewrite_string(blueprint_string)
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules: List of rule dicts (see the module docstring)
+
+        Raises:
+            ValueError: If a rule is malformed, or two rules claim the same
+                value
+        """
+        self.rules = [dict(rule) for rule in rules]
+        self.labels = [describe_rule(rule) for rule in self.rules]
+        self._entities = {}       # old entity name -> (new, rule)
+        self._signals = {}        # (old name, type or None) -> (new, rule)
+        self._qualities = {}      # old quality -> (new, rule)
+        self._comparators = {}    # old comparator -> (new, rule)
+        self._constants = []      # (old or None, signal or None, new, rule)
+        self._deletes = {}        # entity name -> rule
+        self._needles = set()     # byte strings, one of which must be present
+        self._always = False      # True when the JSON cannot be prefiltered
+
+        for index, rule in enumerate(self.rules):
+            self._compile(index, rule)
+
+    def _claim(self, table, key, value, index):
+        if key in table:
+            raise ValueError(f"Rule {index + 1} ({self.labels[index]}) overlaps "
+                             f"rule {table[key][-1] + 1}")
+        table[key] = value
+
+    def _compile(self, index, rule):
+        op = rule.get('op')
+        if op not in OPERATIONS:
+            raise ValueError(f"Rule {index + 1}: unknown op {op!r} "
+                             f"(expected one of {', '.join(OPERATIONS)})")
+        if op == 'delete_entity':
+            if not isinstance(rule.get('name'), str):
+                raise ValueError(f"Rule {index + 1}: delete_entity needs a 'name'")
+            if rule['name'] in self._deletes or rule['name'] in self._entities:
+                raise ValueError(f"Rule {index + 1}: {rule['name']} is already rewritten")
+            self._deletes[rule['name']] = index
+            self._needles |= _needles(rule['name'])
+            return
+        if 'to' not in rule:
+            raise ValueError(f"Rule {index + 1}: {op} needs a 'to'")
+        new = rule['to']
+        if op == 'replace_constant':
+            if not isinstance(new, int) or isinstance(new, bool):
+                raise ValueError(f"Rule {index + 1}: constants must be integers")
+            self._constants.append((rule.get('from'), rule.get('signal'), new, index))
+            self._needles.add(b'"decider_conditions"')
+            return
+        old = rule.get('from')
+        if not isinstance(old, str) or not isinstance(new, str) or old == new:
+            raise ValueError(f"Rule {index + 1}: {op} needs different 'from' and 'to' names")
+        if op == 'rename_entity':
+            if old in self._deletes:
+                raise ValueError(f"Rule {index + 1}: {old} is already deleted")
+            self._claim(self._entities, old, (new, index), index)
+            self._needles |= _needles(old)
+        elif op == 'rename_signal':
+            self._claim(self._signals, (old, rule.get('type')), (new, index), index)
+            self._needles |= _needles(old)
+        elif op == 'swap_quality':
+            self._claim(self._qualities, old, (new, index), index)
+            self._needles |= _needles(old)
+            # Entities leave normal quality out, so it cannot be searched for
+            self._always |= old == DEFAULT_QUALITY
+        else:
+            self._claim(self._comparators, old, (new, index), index)
+            self._needles.add(b'"decider_conditions"')
+
+    def might_match(self, json_bytes):
+        """
+        Tells, without parsing, whether any rule could apply to a
+        blueprint's JSON text. False means rewrite() would find nothing.
+        """
+        if self._always:
+            return True
+        return any(needle in json_bytes for needle in self._needles)
+
+    # -- the pass --
+
+    def rewrite(self, blueprint_data):
+        """
+        Applies the rules to a blueprint, book or planner, in place.
+
+        Returns:
+            Counter: Hits per rule index
+        """
+        hits = Counter()
+        self._entry(blueprint_data, hits)
+        return hits
+
+    def _entry(self, entry, hits):
+        kind = next((k for k in KINDS if k in entry), None)
+        if kind is None:
+            return
+        body = entry[kind]
+        if 'icons' in body:
+            self._values(body['icons'], hits)
+        if kind == 'blueprint':
+            self._blueprint(body, hits)
+        elif kind == 'blueprint_book':
+            for child in body.get('blueprints', []):
+                self._entry(child, hits)
+
+    def _blueprint(self, bp, hits):
+        deleted = set()
+        entities = bp.get('entities') or []
+        for entity in entities:
+            name = entity.get('name')
+            if name in self._deletes:
+                hits[self._deletes[name]] += 1
+                deleted.add(entity.get('entity_number'))
+                continue
+            if name in self._entities:
+                entity['name'], rule = self._entities[name]
+                hits[rule] += 1
+            if self._qualities:
+                quality = entity.get('quality', DEFAULT_QUALITY)
+                if quality in self._qualities:
+                    entity['quality'], rule = self._qualities[quality]
+                    hits[rule] += 1
+            for key, value in entity.items():
+                if key not in _PLAIN_KEYS and isinstance(value, (dict, list)):
+                    if key == 'items' and isinstance(value, dict):
+                        # Factorio 1.x: {"speed-module": 2}
+                        entity[key] = self._item_counts(value, hits)
+                    else:
+                        self._values(value, hits)
+        if deleted:
+            bp['entities'] = [e for e in entities if e.get('entity_number') not in deleted]
+            _drop_references(bp, deleted)
+
+    def _values(self, value, hits):
+        # Walks entity settings: every {"name": ...} is a signal or item
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, (dict, list)):
+                    self._values(item, hits)
+            return
+        name = value.get('name')
+        if name is not None and self._signals:
+            target = (self._signals.get((name, value.get('type', 'item')))
+                      or self._signals.get((name, None)))
+            if target is not None:
+                value['name'], rule = target
+                hits[rule] += 1
+        quality = value.get('quality')
+        if quality is not None and quality in self._qualities:
+            value['quality'], rule = self._qualities[quality]
+            hits[rule] += 1
+        for key, item in value.items():
+            if key == 'decider_conditions' and isinstance(item, dict):
+                self._decider(item, hits)
+            if isinstance(item, (dict, list)):
+                self._values(item, hits)
+
+    def _item_counts(self, items, hits):
+        result = {}
+        for name, count in items.items():
+            target = self._signals.get((name, 'item')) or self._signals.get((name, None))
+            if target is not None:
+                name, rule = target
+                hits[rule] += 1
+            result[name] = result.get(name, 0) + count
+        return result
+
+    def _decider(self, conditions, hits):
+        # 1.x keeps one condition in place, 2.0 a list of them
+        for condition in conditions.get('conditions', [conditions]):
+            comparator = condition.get('comparator')
+            if comparator in self._comparators:
+                condition['comparator'], rule = self._comparators[comparator]
+                hits[rule] += 1
+            if 'constant' not in condition or 'second_signal' in condition:
+                continue
+            signal = (condition.get('first_signal') or {}).get('name')
+            for old, wanted, new, rule in self._constants:
+                if (old is None or condition['constant'] == old) and \
+                        (wanted is None or signal == wanted):
+                    condition['constant'] = new
+                    hits[rule] += 1
+                    break
+
+    # -- strings --
+
+    def rewrite_string(self, blueprint_string, dry_run=False):
+        """
+        Applies the rules to a blueprint string.
+
+        The string is only parsed if might_match() says a rule could
+        apply, and only re-encoded if a rule did.
+
+        Returns:
+            tuple: (blueprint string, Counter of hits per rule index); the
+                string is the input itself when nothing changed or on a
+                dry run
+        """
+        json_bytes, version_byte = inflate_blueprint(blueprint_string)
+        if not self.might_match(json_bytes):
+            return blueprint_string, Counter()
+        blueprint_data = json.loads(json_bytes)
+        del json_bytes
+        hits = self.rewrite(blueprint_data)
+        if not hits or dry_run:
+            return blueprint_string, hits
+        return encode_blueprint(blueprint_data, version_byte), hits
+
+    def report(self, hits):
+        """
+        Returns {rule description: hits} for every rule, in rule order.
+        """
+        return {f"{i + 1}. {label}": hits.get(i, 0) for i, label in enumerate(self.labels)}
+
+
+def _drop_references(bp, deleted):
+    # Removes wires, copper links and train schedule entries that point at
+    # deleted entities
+    if 'wires' in bp:
+        bp['wires'] = [w for w in bp['wires'] if w[0] not in deleted and w[2] not in deleted]
+    for entity in bp.get('entities', []):
+        if 'neighbours' in entity:
+            entity['neighbours'] = [n for n in entity['neighbours'] if n not in deleted]
+            if not entity['neighbours']:
+                del entity['neighbours']
+        connections = entity.get('connections')
+        if not connections:
+            continue
+        for key, point in list(connections.items()):
+            if isinstance(point, list):
+                # Copper "Cu0"/"Cu1" lists
+                point = [c for c in point if c.get('entity_id') not in deleted]
+            else:
+                point = {colour: kept for colour, targets in point.items()
+                         if (kept := [c for c in targets
+                                      if c.get('entity_id') not in deleted])}
+            if point:
+                connections[key] = point
+            else:
+                del connections[key]
+        if not connections:
+            del entity['connections']
+    for schedule in bp.get('schedules', []):
+        schedule['locomotives'] = [n for n in schedule.get('locomotives', [])
+                                   if n not in deleted]
+
+
+# -- batches --
+
+_worker_rewriter = None
+
+
+def _init_worker(rules):
+    global _worker_rewriter
+    _worker_rewriter = Rewriter(rules)
+
+
+def rewrite_item(item, rewriter, dry_run=False, in_place=False):
+    """
+    Rewrites one batch item from blueprint_batch.iter_inputs().
+
+    Args:
+        item: (label, kind, payload) tuple
+        rewriter: Compiled Rewriter
+        dry_run: Only count hits
+        in_place: Write changed files back ('string_file' and 'json_file'
+            items only)
+
+    Returns:
+        dict: Result record with 'ok', 'changed', 'hits' (by rule, only
+            rules that applied) and, unless dry_run, 'result' (the blueprint string)
+    """
+    label, kind, payload = item
+    record = {"source": label}
+    try:
+        if kind == 'json_file':
+            with open(payload, 'r') as f:
+                blueprint_data = json.load(f)
+            hits = rewriter.rewrite(blueprint_data)
+            result = encode_blueprint(blueprint_data) if hits and not dry_run else None
+            if hits and in_place and not dry_run:
+                with open(payload, 'w') as f:
+                    json.dump(blueprint_data, f, indent=2)
+        else:
+            if kind == 'string_file':
+                with open(payload, 'r') as f:
+                    payload = f.read().strip()
+            result, hits = rewriter.rewrite_string(payload, dry_run)
+            if hits and in_place and not dry_run and kind == 'string_file':
+                with open(label, 'w') as f:
+                    f.write(result + "\n")
+        record['changed'] = bool(hits) and not dry_run
+        record['hits'] = {label: count for label, count in rewriter.report(hits).items()
+                          if count}
+        if not dry_run:
+            record['result'] = result
+        record['ok'] = True
+    except Exception as e:
+        record['ok'] = False
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _rewrite_line(args):
+    index, item, dry_run, in_place = args
+    record = rewrite_item(item, _worker_rewriter, dry_run, in_place)
+    hits = record.get('hits', {})
+    record = {"index": index, **record}
+    return json.dumps(record), record['ok'], hits
+
+
+def run_rewrite(items, rules, out, workers=None, chunksize=16, dry_run=False,
+                in_place=False):
+    """
+    Applies rules to batch items and writes JSON Lines results in input
+    order.
+
+    Args:
+        items: Iterable of (label, kind, payload) tuples
+        rules: List of rule dicts
+        out: Text file to write the JSON lines to (None to skip them)
+        workers: Number of worker processes (default: CPU count; 1 runs
+            everything in this process)
+        chunksize: Items sent to a worker per dispatch
+        dry_run: Only count hits
+        in_place: Write changed files back
+
+    Returns:
+        tuple: (items, changed items, failures, {rule description: hits})
+    """
+    rewriter = Rewriter(rules)
+    workers = workers or os.cpu_count() or 1
+    jobs = ((index, item, dry_run, in_place) for index, item in enumerate(items))
+    totals = Counter()
+    counts = Counter()
+
+    def write(results):
+        for line, ok, hits in results:
+            if out is not None:
+                out.write(line + "\n")
+            counts['items'] += 1
+            counts['failed'] += not ok
+            counts['changed'] += bool(hits)
+            totals.update(hits)
+
+    if workers == 1:
+        global _worker_rewriter
+        _worker_rewriter = rewriter
+        write(map(_rewrite_line, jobs))
+    else:
+        window = workers * chunksize * _CHUNKS_PER_WORKER
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(rewriter.rules,)) as pool:
+            while True:
+                batch = list(islice(jobs, window))
+                if not batch:
+                    break
+                write(pool.map(_rewrite_line, batch, chunksize=chunksize))
+    report = {label: totals[label] for label in rewriter.report(Counter())}
+    return counts['items'], counts['changed'], counts['failed'], report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Apply rename/quality/condition/delete rules to many blueprints.")
+    parser.add_argument('rules', help="JSON file with a list of rules")
+    parser.add_argument('source',
+                        help="directory, file with one string per line, or '-' for stdin")
+    parser.add_argument('-o', '--output',
+                        help="JSON Lines file to write (default: stdout)")
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help="only report how often each rule would apply")
+    parser.add_argument('--in-place', action='store_true',
+                        help="write changed files in a directory back")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=16,
+                        help="items per worker dispatch (default: 16)")
+    args = parser.parse_args()
+
+    with open(args.rules, 'r') as f:
+        rules = json.load(f)
+    try:
+        Rewriter(rules)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.dry_run and not args.output:
+        out = None
+    else:
+        out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        total, changed, failed, report = run_rewrite(
+            iter_inputs(args.source), rules, out, args.workers, args.chunksize,
+            args.dry_run, args.in_place)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+
+    verb = "would change" if args.dry_run else "changed"
+    print(f"{total} blueprints, {changed} {verb}, {failed} failed", file=sys.stderr)
+    for label, count in report.items():
+        print(f"  {count:8d}  {label}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
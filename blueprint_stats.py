@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Recursive statistics for blueprints and nested blueprint books.
+One pass over each blueprint's entities, tiles and wires counts entities,
+qualities, requested items, tiles, red/green/copper wires, the bounding
+box and the bill of materials. Book totals are folded up from the
+children. Input can be decoded data, a LazyBlueprint (each child is only
+parsed while its numbers are taken) or a stream of book entries, and
+large books are spread over a process pool. Results are plain JSON.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from blueprint_lazy import KINDS, LazyBlueprint
+from blueprint_stream import iter_blueprints
+from circuit_sim import DEFAULT_QUALITY, is_circuit_wire, iter_circuit_wires
+from spatial_index import direction_count, footprint
+from tile_layer import TileLayer
+
+
+# Entities and tiles placed with an item of another name: (item, count)
+PLACED_BY = {
+    'straight-rail': ('rail', 1),
+    'half-diagonal-rail': ('rail', 2),
+    'curved-rail-a': ('rail', 3),
+    'curved-rail-b': ('rail', 3),
+    'elevated-straight-rail': ('rail', 1),
+    'elevated-half-diagonal-rail': ('rail', 2),
+    'elevated-curved-rail-a': ('rail', 3),
+    'elevated-curved-rail-b': ('rail', 3),
+    'curved-rail': ('rail', 4),                 # Factorio 1.x
+    'stone-path': ('stone-brick', 1),
+    'hazard-concrete-left': ('hazard-concrete', 1),
+    'hazard-concrete-right': ('hazard-concrete', 1),
+    'refined-hazard-concrete-left': ('refined-hazard-concrete', 1),
+    'refined-hazard-concrete-right': ('refined-hazard-concrete', 1),
+}
+
+# Fields summed into book totals
+_COUNT_FIELDS = ('entities', 'tile_area')
+_TABLE_FIELDS = ('entity_counts', 'quality_counts', 'item_counts', 'tile_counts',
+                 'wires', 'bill_of_materials')
+
+_CHUNKS_PER_WORKER = 8
+
+
+def _item_key(name, quality=None):
+    # "name" for normal quality, "name@quality" otherwise
+    if quality is None or quality == DEFAULT_QUALITY:
+        return name
+    return f"{name}@{quality}"
+
+
+def _requested_items(items):
+    # (name, quality, count) of the items an entity asks for: modules,
+    # fuel, ammo, equipment
+    if isinstance(items, dict):
+        # Factorio 1.x: {"speed-module": 2}
+        for name, count in items.items():
+            yield name, None, count
+        return
+    for request in items or []:
+        item = request.get('id') or {}
+        placed = request.get('items') or {}
+        count = sum(slot.get('count', 1) for slot in placed.get('in_inventory', []))
+        count += placed.get('grid_count', 0)
+        yield item.get('name'), item.get('quality'), count
+
+
+def _grow(box, left, top, right, bottom):
+    if box is None:
+        return [left, top, right, bottom]
+    box[0], box[1] = min(box[0], left), min(box[1], top)
+    box[2], box[3] = max(box[2], right), max(box[3], bottom)
+    return box
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else value
+
+
+def blueprint_stats(bp):
+    """
+    Computes the statistics of one blueprint body.
+
+    Args:
+        bp: The dict under 'blueprint' (entities may be an EntityTable,
+            tiles a TileLayer)
+
+    Returns:
+        dict: 'entities', 'entity_counts', 'quality_counts',
+            'item_counts' (items requested by entities), 'tile_area',
+            'tile_counts', 'wires' (red/green/copper), 'bounding_box'
+            ([left, top, right, bottom] or None), 'size' and
+            'bill_of_materials'; items of other qualities are keyed
+            "name@quality"
+    """
+    entity_counts, quality_counts = Counter(), Counter()
+    item_counts, materials = Counter(), Counter()
+    box = None
+    legacy_wires, legacy_copper = set(), set()
+
+    directions = direction_count(bp.get('version'))
+    entities = bp.get('entities') or []
+    for entity in entities:
+        name = entity.get('name', 'unknown')
+        quality = entity.get('quality', DEFAULT_QUALITY)
+        entity_counts[name] += 1
+        quality_counts[quality] += 1
+        item, count = PLACED_BY.get(name, (name, 1))
+        materials[_item_key(item, quality)] += count
+
+        position = entity.get('position')
+        if isinstance(position, dict):
+            box = _grow(box, *footprint(name, position.get('x', 0), position.get('y', 0),
+                                        entity.get('direction', 0), directions=directions))
+        if 'items' in entity:
+            for item, item_quality, count in _requested_items(entity['items']):
+                key = _item_key(item, item_quality)
+                item_counts[key] += count
+                materials[key] += count
+        # Factorio 1.x keeps wires on both ends, so they are deduplicated
+        if 'connections' in entity:
+            for a, b in iter_circuit_wires([entity], []):
+                legacy_wires.add((a, b) if a <= b else (b, a))
+        for other in entity.get('neighbours') or []:
+            number = entity.get('entity_number')
+            legacy_copper.add((min(number, other), max(number, other)))
+
+    tiles = bp.get('tiles') or []
+    if isinstance(tiles, TileLayer):
+        tile_counts = Counter(tiles.name_counts())
+        bounds = tiles.bounds()
+        if bounds is not None:
+            box = _grow(box, *bounds)
+        for tile in tiles.extras:
+            position = tile['position']
+            box = _grow(box, position['x'], position['y'],
+                        position['x'] + 1, position['y'] + 1)
+    else:
+        tile_counts = Counter()
+        for tile in tiles:
+            tile_counts[tile.get('name', 'unknown')] += 1
+            position = tile['position']
+            box = _grow(box, position['x'], position['y'],
+                        position['x'] + 1, position['y'] + 1)
+    for name, count in tile_counts.items():
+        item, per_tile = PLACED_BY.get(name, (name, 1))
+        materials[item] += count * per_tile
+
+    wires = Counter()
+    for wire in bp.get('wires') or []:
+        if is_circuit_wire(wire[1], wire[3]):
+            wires['red' if wire[1] % 2 else 'green'] += 1
+        else:
+            wires['copper'] += 1
+    for (_, connector), _ in legacy_wires:
+        wires['red' if connector % 2 else 'green'] += 1
+    wires['copper'] += len(legacy_copper)
+
+    stats = {
+        'type': 'blueprint',
+        'entities': sum(entity_counts.values()),
+        'entity_counts': entity_counts,
+        'quality_counts': quality_counts,
+        'item_counts': item_counts,
+        'tile_area': sum(tile_counts.values()),
+        'tile_counts': tile_counts,
+        'wires': wires,
+        'bounding_box': [_number(v) for v in box] if box else None,
+        'size': [_number(box[2] - box[0]), _number(box[3] - box[1])] if box else [0, 0],
+        'bill_of_materials': materials,
+    }
+    if 'label' in bp:
+        stats['label'] = bp['label']
+    return _finish(stats)
+
+
+def _finish(stats):
+    # Counters become plain dicts sorted by key, for stable JSON
+    for field in _TABLE_FIELDS:
+        if field in stats:
+            stats[field] = dict(sorted((k, v) for k, v in stats[field].items() if v))
+    return stats
+
+
+def _new_totals():
+    totals = {'blueprints': 0, 'books': 0}
+    totals.update((field, 0) for field in _COUNT_FIELDS)
+    totals.update((field, Counter()) for field in _TABLE_FIELDS)
+    return totals
+
+
+def _accumulate(totals, stats):
+    # Adds a child's numbers (a blueprint's own, or a book's totals)
+    if stats['type'] == 'blueprint':
+        source = stats
+        totals['blueprints'] += 1
+    elif stats['type'] == 'blueprint_book':
+        source = stats['totals']
+        totals['blueprints'] += source['blueprints']
+        totals['books'] += 1 + source['books']
+    else:
+        return
+    for field in _COUNT_FIELDS:
+        totals[field] += source[field]
+    for field in _TABLE_FIELDS:
+        totals[field].update(source[field])
+
+
+def _body_from_json(raw):
+    # Parses a blueprint body from its JSON bytes, tiles straight into a
+    # TileLayer
+    if b'"tiles"' not in raw:
+        return json.loads(raw)
+    view = LazyBlueprint.from_json(raw)
+    return {key: TileLayer.from_json(view.raw(key)) if key == 'tiles' else view[key]
+            for key in view}
+
+
+def _stats_job(payload):
+    # Worker entry point: a blueprint body, as data or JSON bytes
+    if isinstance(payload, bytes):
+        payload = _body_from_json(payload)
+    return blueprint_stats(payload)
+
+
+def _map(function, items, workers, chunksize):
+    # In-order map over a process pool, submitting a bounded window of
+    # items at a time so big payloads are not all queued at once
+    if workers <= 1:
+        yield from map(function, items)
+        return
+    items = iter(items)
+    window = workers * chunksize * _CHUNKS_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(items, window))
+            if not batch:
+                break
+            yield from pool.map(function, batch, chunksize=chunksize)
+
+
+def _plan(entry, jobs):
+    # Skeleton of the result; blueprint bodies are queued in `jobs` and
+    # their stats filled in afterwards
+    kind = next((k for k in KINDS if k in entry), None)
+    node = {'type': kind or 'unknown'}
+    if 'index' in entry:
+        node['index'] = entry['index']
+    if kind == 'blueprint':
+        if isinstance(entry, LazyBlueprint):
+            # Only the JSON bytes travel; the child is parsed where used
+            jobs.append(entry.raw('blueprint'))
+        else:
+            jobs.append(entry['blueprint'])
+        node['job'] = len(jobs) - 1
+    elif kind is not None:
+        body = entry[kind]
+        if 'label' in body:
+            node['label'] = body['label']
+        if kind == 'blueprint_book':
+            node['children'] = [_plan(child, jobs) for child in body.get('blueprints', [])]
+    return node
+
+
+def _fill(node, results):
+    if 'job' in node:
+        stats = results[node.pop('job')]
+        node.update(stats)
+    elif 'children' in node:
+        totals = _new_totals()
+        for child in node['children']:
+            _fill(child, results)
+            _accumulate(totals, child)
+        node['totals'] = _finish(totals)
+    return node
+
+
+def collect_stats(blueprint_data, workers=1, chunksize=4):
+    """
+    Computes statistics for a blueprint, planner or (nested) book.
+
+    Args:
+        blueprint_data: Decoded data, or a LazyBlueprint view
+        workers: Processes to spread the blueprints over (1 works here)
+        chunksize: Blueprints sent to a worker at a time
+
+    Returns:
+        dict: A blueprint's stats (see blueprint_stats), or for a book
+            its 'label', 'children' (each with its own stats and 'index')
+            and 'totals' over every blueprint inside, however deep
+    """
+    jobs = []
+    tree = _plan(blueprint_data, jobs)
+    results = list(_map(_stats_job, jobs, workers if len(jobs) > 1 else 1, chunksize))
+    return _fill(tree, results)
+
+
+def stream_stats(source, workers=1, chunksize=4):
+    """
+    Computes statistics for a book read one child at a time with
+    iter_blueprints, so neither the whole JSON text nor the dict tree is
+    held in memory. The book's own label is not seen in this mode.
+
+    Args:
+        source: Blueprint string, or a file-like object opened on one
+        workers: Processes to spread the children over
+        chunksize: Children sent to a worker at a time
+
+    Returns:
+        dict: As collect_stats; a string holding a lone blueprint gives
+            that blueprint's stats
+    """
+    entries = iter_blueprints(source)
+    first = next(entries, None)
+    if first is None:
+        return {'type': 'blueprint_book', 'children': [], 'totals': _finish(_new_totals())}
+    second = next(entries, None)
+    if second is None and 'index' not in first:
+        return collect_stats(first)
+
+    def all_entries():
+        yield first
+        if second is not None:
+            yield second
+            yield from entries
+
+    children = list(_map(collect_stats, all_entries(), workers, chunksize))
+    totals = _new_totals()
+    for child in children:
+        _accumulate(totals, child)
+    return {'type': 'blueprint_book', 'children': children, 'totals': _finish(totals)}
+
+
+def main():
+    from blueprint_benchmark import synthetic_book
+    from blueprint_decoder import decode_blueprint, encode_blueprint
+
+    parser = argparse.ArgumentParser(description="Blueprint and book statistics as JSON.")
+    parser.add_argument('path', nargs='?', help="file with a blueprint string")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="worker processes (default: 1)")
+    parser.add_argument('--mode', choices=('lazy', 'stream', 'full'), default='lazy',
+                        help="read the string lazily (default), as a stream of "
+                             "book entries, or fully decoded")
+    parser.add_argument('--totals', action='store_true',
+                        help="print only the overall totals of a book")
+    args = parser.parse_args()
+
+    if args.path is None:
+        print("Blueprint Statistics", file=sys.stderr)
+        print("="*60, file=sys.stderr)
+        print("(no blueprint file given; comparing modes on a generated book)",
+              file=sys.stderr)
+        blueprint_string = encode_blueprint(synthetic_book(6, depth=2, entities=5000))
+        results = {}
+        for mode, run in (
+                ('full', lambda: collect_stats(decode_blueprint(blueprint_string)[0])),
+                ('lazy', lambda: collect_stats(LazyBlueprint.from_string(blueprint_string))),
+                ('stream', lambda: stream_stats(blueprint_string)),
+                ('lazy, workers', lambda: collect_stats(
+                    LazyBlueprint.from_string(blueprint_string), workers=os.cpu_count() or 1))):
+            start = time.perf_counter()
+            results[mode] = run()['totals']
+            print(f"  {mode:<14} {time.perf_counter() - start:.3f}s", file=sys.stderr)
+        assert all(totals == results['full'] for totals in results.values())
+        totals = results['full']
+        print(f"{totals['blueprints']} blueprints in {totals['books']} nested books, "
+              f"{totals['entities']} entities; all modes agree", file=sys.stderr)
+        return
+
+    if args.mode == 'stream':
+        with open(args.path, 'r') as f:
+            stats = stream_stats(f, args.workers)
+    else:
+        with open(args.path, 'r') as f:
+            blueprint_string = f.read().strip()
+        if args.mode == 'lazy':
+            blueprint_data = LazyBlueprint.from_string(blueprint_string)
+        else:
+            blueprint_data = decode_blueprint(blueprint_string)[0]
+        stats = collect_stats(blueprint_data, args.workers)
+    if args.totals and 'totals' in stats:
+        stats = stats['totals']
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""
+Streaming decoder and encoder for very large Factorio blueprint strings.
+Base64 text is decoded, inflated and parsed in chunks, so a blueprint book
+can be walked one child blueprint at a time without holding the whole
+string, the compressed bytes and the full JSON document in memory at once.
+Encoding runs the same pipeline in reverse, from JSON pieces through
+deflate and base64 straight into a file or string.
+"""
+
+import base64
+import codecs
+import json
+import re
+import sys
+import zlib
+from collections.abc import Mapping
+
+from codec_profile import stage
+from parallel_deflate import iter_parallel_deflate
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_INFLATED_SIZE = 1024 * 1024 * 1024  # 1 GiB of JSON text
+
+# Separators used by json.dumps by default, and the compact form Factorio
+# itself exports
+DEFAULT_SEPARATORS = (', ', ': ')
+COMPACT_SEPARATORS = (',', ':')
+
+# Lists longer than this are serialized element by element
+_SPLIT_LENGTH = 64
+# How far below a container to look for such a list before dumping it
+# whole; deep enough to reach entities from a blueprint book
+_SPLIT_DEPTH = 5
+
+# Path of the child list inside a blueprint book
+BOOK_PATH = ('blueprint_book', 'blueprints')
+
+# Everything up to the next bracket outside a string. Stops early at the
+# '"' of a string that runs past the end of the text buffered so far.
+_SKIP = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+_SCALAR = re.compile(r'[^\s,\]}]+')
+_WHITESPACE = re.compile(r'\s*')
+
+
+class JsonSplitter:
+    """
+    Incremental JSON parser that emits complete values at chosen paths.
+
+    Containers whose path satisfies descend(path) are walked key by key.
+    Every other value is buffered on its own and emitted as (path, value)
+    once it is complete. Paths are tuples of object keys and array indexes,
+    with () for the document itself.
+    """
+
+    def __init__(self, descend):
+        self._descend = descend
+        self._buf = ''
+        self._stack = []       # [kind, path, key or index] per walked container
+        self._state = 'value'
+        self._capture = None   # [pieces, depth, path] while buffering a value
+
+    def feed(self, text, final=False):
+        """
+        Feeds the next piece of JSON text into the parser.
+
+        Args:
+            text: The next chunk of the document
+            final: True once the whole document has been fed
+
+        Returns:
+            list: (path, value) pairs completed by this chunk
+        """
+        buf = self._buf + text if self._buf else text
+        n = len(buf)
+        pos = 0
+        events = []
+
+        while True:
+            if self._capture is not None:
+                pos = self._continue_capture(buf, pos, events)
+                if self._capture is not None:
+                    break
+                continue
+
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos >= n:
+                break
+            c = buf[pos]
+            state = self._state
+
+            if state == 'end':
+                raise ValueError(f"Unexpected data after JSON document: {c!r}")
+
+            if state == 'key':
+                if c == '}' and self._stack[-1][0] == '{':
+                    self._close(pos)
+                    pos += 1
+                    continue
+                if c != '"':
+                    raise ValueError(f"Expected object key, got {c!r}")
+                m = _STRING.match(buf, pos)
+                if m is None:
+                    break
+                self._stack[-1][2] = json.loads(m.group())
+                self._state = 'colon'
+                pos = m.end()
+                continue
+
+            if state == 'colon':
+                if c != ':':
+                    raise ValueError(f"Expected ':', got {c!r}")
+                self._state = 'value'
+                pos += 1
+                continue
+
+            if state == 'after':
+                frame = self._stack[-1]
+                if c == ',':
+                    if frame[0] == '[':
+                        frame[2] += 1
+                        self._state = 'value'
+                    else:
+                        self._state = 'key'
+                    pos += 1
+                    continue
+                if c in '}]':
+                    self._close(pos, c)
+                    pos += 1
+                    continue
+                raise ValueError(f"Expected ',' or closing bracket, got {c!r}")
+
+            # state is 'value' or 'items' (first slot of an array)
+            if state == 'items' and c == ']':
+                self._close(pos)
+                pos += 1
+                continue
+
+            path = self._value_path()
+            if c in '{[':
+                if self._descend(path):
+                    self._stack.append([c, path, 0 if c == '[' else None])
+                    self._state = 'items' if c == '[' else 'key'
+                    pos += 1
+                else:
+                    self._capture = [[], 0, path]
+                continue
+
+            if c == '"':
+                m = _STRING.match(buf, pos)
+                if m is None:
+                    break
+            else:
+                m = _SCALAR.match(buf, pos)
+                if m is None:
+                    raise ValueError(f"Unexpected character {c!r}")
+                if m.end() == n and not final:
+                    # A number may continue in the next chunk
+                    break
+            events.append((path, json.loads(m.group())))
+            self._finish_value()
+            pos = m.end()
+
+        self._buf = buf[pos:]
+
+        if final and (self._buf.strip() or self._state != 'end'):
+            raise ValueError("Truncated JSON document")
+
+        return events
+
+    def _value_path(self):
+        if not self._stack:
+            return ()
+        kind, path, slot = self._stack[-1]
+        return path + (slot,)
+
+    def _close(self, pos, bracket=None):
+        kind = self._stack[-1][0]
+        if bracket is not None and bracket != {'{': '}', '[': ']'}[kind]:
+            raise ValueError(f"Mismatched {bracket!r} at offset {pos}")
+        self._stack.pop()
+        self._finish_value()
+
+    def _finish_value(self):
+        self._state = 'after' if self._stack else 'end'
+
+    def _continue_capture(self, buf, pos, events):
+        pieces, depth, path = self._capture
+        start = pos
+        skip = _SKIP.match
+        n = len(buf)
+
+        while True:
+            pos = skip(buf, pos).end()
+            if pos >= n:
+                pieces.append(buf[start:])
+                self._capture[1] = depth
+                return n
+
+            c = buf[pos]
+            if c == '"':
+                # Keep the unfinished string for the next chunk
+                pieces.append(buf[start:pos])
+                self._capture[1] = depth
+                return pos
+
+            pos += 1
+            if c in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    pieces.append(buf[start:pos])
+                    self._capture = None
+                    events.append((path, json.loads(''.join(pieces))))
+                    self._finish_value()
+                    return pos
+
+
+def _iter_source(source, chunk_size):
+    if isinstance(source, (str, bytes)):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+    else:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_json_text(source, max_inflated_size=DEFAULT_MAX_INFLATED_SIZE,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Decodes a blueprint string incrementally into JSON text.
+
+    Args:
+        source: The blueprint string (str or bytes), or a file-like object
+            opened on it
+        max_inflated_size: Largest amount of inflated JSON to accept, in bytes
+            (None for no limit)
+        chunk_size: Number of characters to read from the source at a time
+
+    Yields:
+        str: Consecutive chunks of the blueprint JSON
+    """
+    decompressor = zlib.decompressobj()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    inflated = 0
+    pending = ''
+    seen_version = False
+
+    def inflate(data):
+        nonlocal inflated
+        while data:
+            # Bound each step so a tiny input cannot balloon in one call
+            out = decompressor.decompress(data, chunk_size * 4)
+            inflated += len(out)
+            if max_inflated_size is not None and inflated > max_inflated_size:
+                raise ValueError(
+                    f"Blueprint inflates past {max_inflated_size} bytes")
+            text = utf8.decode(out)
+            if text:
+                yield text
+            data = decompressor.unconsumed_tail
+
+    for chunk in _iter_source(source, chunk_size):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('ascii')
+        chunk = ''.join(chunk.split())
+        if not seen_version:
+            if not chunk:
+                continue
+            # Remove the version byte (first character, usually '0')
+            chunk = chunk[1:]
+            seen_version = True
+
+        # Base64 decodes in groups of 4 characters; carry the remainder
+        pending += chunk
+        usable = len(pending) - len(pending) % 4
+        if not usable:
+            continue
+        compressed = base64.b64decode(pending[:usable], validate=True)
+        pending = pending[usable:]
+        yield from inflate(compressed)
+
+    if pending:
+        yield from inflate(base64.b64decode(pending, validate=True))
+
+    tail = decompressor.flush()
+    if not decompressor.eof:
+        raise ValueError("Truncated blueprint string")
+    text = utf8.decode(tail, final=True)
+    if text:
+        yield text
+
+
+def _descend_book(path):
+    return path == () or path == BOOK_PATH[:1] or path == BOOK_PATH
+
+
+def iter_blueprints(source, max_inflated_size=DEFAULT_MAX_INFLATED_SIZE,
+                    chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the blueprints of a blueprint book one at a time.
+
+    Only one child is parsed into a dictionary at any moment, so peak memory
+    follows the largest child rather than the whole book. Nested books are
+    yielded as a single child. A string holding a lone blueprint (or any
+    other top-level object) yields that object once.
+
+    Args:
+        source: The blueprint string (str or bytes), or a file-like object
+            opened on it
+        max_inflated_size: Largest amount of inflated JSON to accept, in bytes
+            (None for no limit)
+        chunk_size: Number of characters to read from the source at a time
+
+    Yields:
+        dict: Each entry of blueprint_book.blueprints, e.g.
+            {"blueprint": {...}, "index": 0}
+    """
+    splitter = JsonSplitter(_descend_book)
+
+    def entries(events):
+        for path, value in events:
+            if len(path) == 3 and path[:2] == BOOK_PATH:
+                yield value
+            elif len(path) == 1 and path[0] != BOOK_PATH[0]:
+                yield {path[0]: value}
+
+    for text in iter_json_text(source, max_inflated_size, chunk_size):
+        yield from entries(splitter.feed(text))
+    yield from entries(splitter.feed('', final=True))
+
+
+def _to_json(value):
+    # Objects such as EntityTable provide to_json(), returning plain data or
+    # an iterator over the items of a JSON array
+    data = value.to_json()
+    if isinstance(data, (dict, list, str, int, float, bool)) or data is None:
+        return data
+    return list(data)
+
+
+def json_default(value):
+    """
+    json 'default' hook for the extra types blueprint data may hold:
+    objects with to_json() (EntityTable, StampedList) and read-only
+    mappings such as the frozen views from blueprint_cache.
+    """
+    if hasattr(value, 'to_json'):
+        return _to_json(value)
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _should_split(value, depth=0):
+    if isinstance(value, list):
+        if len(value) > _SPLIT_LENGTH:
+            return True
+        if depth < _SPLIT_DEPTH:
+            return any(_should_split(v, depth + 1) for v in value
+                       if not isinstance(v, (str, int, float)))
+        return False
+    if isinstance(value, dict):
+        if depth < _SPLIT_DEPTH:
+            for v in value.values():
+                if not isinstance(v, (str, int, float)) and _should_split(v, depth + 1):
+                    return all(isinstance(k, str) for k in value)
+        return False
+    return hasattr(value, 'to_json')
+
+
+def iter_json_pieces(value, compact=False):
+    """
+    Serializes a value to JSON piece by piece.
+
+    Small values go through json.dumps in one call; only dicts and lists
+    holding long lists are walked, so the joined output is exactly what
+    json.dumps would produce with the same separators. Objects with a
+    to_json() method, such as EntityTable, are converted as they are
+    reached.
+
+    Args:
+        value: The blueprint data (or any JSON-compatible value)
+        compact: Use (',', ':') separators instead of json.dumps' defaults
+
+    Yields:
+        str: Consecutive pieces of the JSON text
+    """
+    item_sep, key_sep = COMPACT_SEPARATORS if compact else DEFAULT_SEPARATORS
+    dumps = json.JSONEncoder(separators=(item_sep, key_sep),
+                             default=json_default).encode
+
+    def walk(value, depth=0):
+        if not _should_split(value, depth):
+            yield dumps(value)
+        elif isinstance(value, dict):
+            yield '{'
+            for i, (key, item) in enumerate(value.items()):
+                yield (item_sep if i else '') + dumps(key) + key_sep
+                yield from walk(item)
+            yield '}'
+        else:
+            if not isinstance(value, list):
+                value = value.to_json()
+                if isinstance(value, dict):
+                    yield from walk(value)
+                    return
+            # Items of a long list (entities, tiles, book children) get a
+            # shallower check, enough to reach a child blueprint's entities
+            item_depth = _SPLIT_DEPTH - 3
+            yield '['
+            for i, item in enumerate(value):
+                if i:
+                    yield item_sep
+                yield from walk(item, item_depth)
+            yield ']'
+
+    return walk(value)
+
+
+def iter_encoded_text(pieces, version_byte='0', level=zlib.Z_DEFAULT_COMPRESSION,
+                      strategy=zlib.Z_DEFAULT_STRATEGY,
+                      chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                      profiler=None):
+    """
+    Deflates and base64-encodes JSON text pieces into a blueprint string.
+
+    Args:
+        pieces: Iterable of JSON text pieces, e.g. from iter_json_pieces()
+        version_byte: The version byte to use (default '0')
+        level: zlib compression level, 0-9 or -1 for zlib's default
+        strategy: zlib strategy, e.g. zlib.Z_FILTERED or zlib.Z_RLE
+        chunk_size: Amount of JSON text to gather before each deflate call
+        workers: Deflate on this many threads (see parallel_deflate.py);
+            None or 1 for the single-threaded zlib stream
+        profiler: Optional CodecProfiler; stages add up across chunks
+
+    Yields:
+        str: Consecutive chunks of the blueprint string
+    """
+    pending = bytearray()
+
+    def encode(compressed, final=False):
+        pending.extend(compressed)
+        # Base64 encodes in groups of 3 bytes; carry the remainder
+        usable = len(pending) if final else len(pending) - len(pending) % 3
+        if not usable:
+            return ''
+        with stage(profiler, 'base64', usable) as record:
+            encoded = base64.b64encode(pending[:usable]).decode('ascii')
+            record.bytes_out = len(encoded)
+        del pending[:usable]
+        return encoded
+
+    yield version_byte
+
+    if workers and workers > 1:
+        # The pool pulls the JSON pieces itself, so with a profiler the
+        # 'deflate' stage includes serialization time here
+        compressed_chunks = iter_parallel_deflate(pieces, level, strategy, workers)
+        if profiler is not None:
+            compressed_chunks = profiler.wrap_iter('deflate', compressed_chunks)
+        for compressed in compressed_chunks:
+            text = encode(compressed)
+            if text:
+                yield text
+        text = encode(b'', final=True)
+        if text:
+            yield text
+        return
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS,
+                                  zlib.DEF_MEM_LEVEL, strategy)
+
+    def deflate(batch, size, final=False):
+        with stage(profiler, 'utf8', size) as record:
+            data = ''.join(batch).encode('utf-8')
+            record.bytes_out = len(data)
+        with stage(profiler, 'deflate', len(data)) as record:
+            compressed = compressor.compress(data)
+            if final:
+                compressed += compressor.flush()
+            record.bytes_out = len(compressed)
+        return encode(compressed, final)
+
+    pieces = iter(pieces)
+    done = False
+    while not done:
+        # Gather about chunk_size characters of JSON per deflate call
+        with stage(profiler, 'json') as record:
+            batch = []
+            size = 0
+            for piece in pieces:
+                batch.append(piece)
+                size += len(piece)
+                if size >= chunk_size:
+                    break
+            else:
+                done = True
+            record.bytes_out = size
+        text = deflate(batch, size, final=done)
+        if text:
+            yield text
+
+
+def encode_blueprint_stream(blueprint_data, sink=None, version_byte='0',
+                            compact=False, level=zlib.Z_DEFAULT_COMPRESSION,
+                            strategy=zlib.Z_DEFAULT_STRATEGY, workers=None,
+                            profiler=None):
+    """
+    Encodes a blueprint dictionary without building the full JSON text,
+    compressed bytes or base64 string as whole copies.
+
+    With the default settings the result is identical to the original
+    json.dumps + zlib.compress + base64 pipeline.
+
+    Args:
+        blueprint_data: The blueprint data as a Python dictionary
+        sink: File-like object to write the string to (None to return it)
+        version_byte: The version byte to use (default '0')
+        compact: Use (',', ':') JSON separators, as Factorio does
+        level: zlib compression level, 0-9 or -1 for zlib's default
+        strategy: zlib strategy, e.g. zlib.Z_FILTERED or zlib.Z_RLE
+        workers: Deflate on this many threads for very large blueprints
+        profiler: Optional CodecProfiler to record each stage
+
+    Returns:
+        str: The encoded blueprint string, or the number of characters
+            written when a sink is given
+    """
+    chunks = iter_encoded_text(iter_json_pieces(blueprint_data, compact),
+                               version_byte, level, strategy,
+                               workers=workers, profiler=profiler)
+    if sink is None:
+        return ''.join(chunks)
+
+    written = 0
+    for chunk in chunks:
+        sink.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def main():
+    print("Factorio Blueprint Stream Reader")
+    print("="*60)
+
+    if len(sys.argv) < 2:
+        print("\nUsage:")
+        print(f"  python3 {sys.argv[0]} <blueprint_string_file>")
+        return
+
+    with open(sys.argv[1], 'r') as f:
+        for i, entry in enumerate(iter_blueprints(f)):
+            kind = next((k for k in entry if k != 'index'), 'unknown')
+            body = entry.get(kind, {})
+            label = body.get('label', '')
+            entities = len(body.get('entities', []))
+            print(f"{i:5d}  {kind:<24} {entities:7d} entities  {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+"""
+PNG thumbnails for blueprint previews.
+Entities are drawn as their footprints in a per-name colour, tiles as one
+rectangle fill per horizontal run (straight from TileLayer bitmaps), and
+circuit and copper wires optionally as lines. Pixels live in a NumPy array
+when NumPy is installed and in one bytearray per row otherwise; the PNG
+encoder only needs zlib. Thumbnails are cached on disk under the
+blueprint's canonical digest, so a blueprint that was already drawn, under
+any entity numbering or key order, is not drawn again, and whole libraries
+are rendered on a process pool.
+"""
+
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from blueprint_batch import iter_inputs
+from blueprint_canonical import canonical_digest
+from blueprint_decoder import decode_blueprint
+from blueprint_lazy import KINDS
+from circuit_sim import is_circuit_wire, iter_circuit_wires
+from spatial_index import direction_count, footprint
+from tile_layer import TileLayer
+
+
+DEFAULT_SIZE = 256
+
+# Largest scale for small blueprints, in pixels per tile
+MAX_SCALE = 32
+
+# Bumped whenever drawing changes, so cached thumbnails are redrawn
+RENDER_VERSION = 1
+
+BACKGROUND = (40, 40, 40)
+UNKNOWN_TILE = (90, 90, 90)
+WIRE_COLOURS = {'red': (220, 50, 50), 'green': (60, 200, 60), 'copper': (205, 130, 60)}
+
+NAME_COLOURS = {
+    # Belts and logistics
+    'transport-belt': (200, 170, 40),
+    'underground-belt': (170, 140, 30),
+    'splitter': (220, 190, 60),
+    'fast-transport-belt': (200, 60, 50),
+    'fast-underground-belt': (170, 50, 40),
+    'fast-splitter': (220, 80, 70),
+    'express-transport-belt': (50, 140, 210),
+    'express-underground-belt': (40, 110, 180),
+    'express-splitter': (70, 160, 230),
+    'turbo-transport-belt': (120, 200, 80),
+    'inserter': (190, 170, 60),
+    'fast-inserter': (70, 130, 200),
+    'long-handed-inserter': (200, 80, 70),
+    'bulk-inserter': (100, 180, 90),
+    'stack-inserter': (100, 180, 90),
+    # Circuits
+    'constant-combinator': (150, 60, 60),
+    'decider-combinator': (170, 120, 60),
+    'arithmetic-combinator': (80, 120, 170),
+    'selector-combinator': (120, 90, 160),
+    'small-lamp': (230, 230, 160),
+    'power-switch': (120, 120, 120),
+    # Power
+    'small-electric-pole': (130, 100, 60),
+    'medium-electric-pole': (150, 150, 160),
+    'big-electric-pole': (160, 160, 170),
+    'substation': (170, 170, 180),
+    'solar-panel': (40, 60, 120),
+    'accumulator': (110, 110, 140),
+    # Production
+    'assembling-machine-1': (140, 140, 110),
+    'assembling-machine-2': (100, 130, 150),
+    'assembling-machine-3': (120, 150, 110),
+    'electric-furnace': (160, 90, 70),
+    'steel-furnace': (150, 110, 90),
+    'stone-furnace': (140, 120, 100),
+    'electric-mining-drill': (120, 110, 80),
+    'chemical-plant': (90, 140, 120),
+    'oil-refinery': (110, 110, 110),
+    'beacon': (60, 90, 150),
+    'lab': (90, 120, 160),
+    'roboport': (130, 110, 160),
+    # Fluids and rails
+    'pipe': (80, 100, 140),
+    'pipe-to-ground': (70, 90, 130),
+    'storage-tank': (100, 120, 150),
+    'pump': (90, 110, 150),
+    'straight-rail': (130, 130, 130),
+    'curved-rail-a': (130, 130, 130),
+    'curved-rail-b': (130, 130, 130),
+    'rail-signal': (210, 210, 80),
+    'rail-chain-signal': (90, 170, 220),
+    'train-stop': (200, 60, 60),
+    # Defence
+    'stone-wall': (150, 150, 140),
+    'gate': (170, 160, 120),
+    'gun-turret': (180, 150, 80),
+    'laser-turret': (200, 80, 80),
+    # Tiles
+    'stone-path': (110, 105, 95),
+    'concrete': (120, 120, 118),
+    'refined-concrete': (140, 140, 138),
+    'hazard-concrete-left': (160, 140, 50),
+    'hazard-concrete-right': (160, 140, 50),
+    'refined-hazard-concrete-left': (180, 160, 60),
+    'refined-hazard-concrete-right': (180, 160, 60),
+    'landfill': (100, 85, 60),
+}
+
+
+def name_colour(name, colours=NAME_COLOURS):
+    """
+    Returns the RGB colour for an entity or tile name: from the table, or
+    a stable muted colour derived from the name.
+    """
+    colour = colours.get(name)
+    if colour is None:
+        h = zlib.crc32((name or '').encode('utf-8'))
+        colour = (80 + (h & 0x7f), 80 + ((h >> 8) & 0x7f), 80 + ((h >> 16) & 0x7f))
+    return colour
+
+
+class Canvas:
+    """
+    RGB pixel buffer with rectangle fills and lines.
+
+    Backed by a NumPy array when NumPy is installed and by one bytearray
+    per pixel row otherwise; both fill whole row slices at a time.
+    """
+
+    def __init__(self, width, height, background=BACKGROUND, use_numpy=None):
+        self.width = width
+        self.height = height
+        self.numpy = np is not None if use_numpy is None else use_numpy
+        if self.numpy:
+            self.pixels = np.empty((height, width, 3), np.uint8)
+            self.pixels[:] = background
+        else:
+            row = bytes(background) * width
+            self.rows = [bytearray(row) for _ in range(height)]
+
+    def fill(self, x0, y0, x1, y1, colour):
+        """
+        Fills the pixels x0 <= x < x1, y0 <= y < y1, clipped to the canvas.
+        """
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        if self.numpy:
+            self.pixels[y0:y1, x0:x1] = colour
+            return
+        span = bytes(colour) * (x1 - x0)
+        start, end = x0 * 3, x1 * 3
+        for row in self.rows[y0:y1]:
+            row[start:end] = span
+
+    def line(self, x0, y0, x1, y1, colour):
+        """
+        Draws a one pixel wide line between two pixel centres.
+        """
+        steps = max(abs(x1 - x0), abs(y1 - y0))
+        if self.numpy:
+            xs = np.rint(np.linspace(x0, x1, steps + 1)).astype(np.intp)
+            ys = np.rint(np.linspace(y0, y1, steps + 1)).astype(np.intp)
+            inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+            self.pixels[ys[inside], xs[inside]] = colour
+            return
+        colour = bytes(colour)
+        for step in range(steps + 1):
+            t = step / steps if steps else 0
+            x = round(x0 + (x1 - x0) * t)
+            y = round(y0 + (y1 - y0) * t)
+            if 0 <= x < self.width and 0 <= y < self.height:
+                self.rows[y][x * 3:x * 3 + 3] = colour
+
+    def scanlines(self):
+        """
+        Returns the image as PNG scanlines (filter byte 0 before each row).
+        """
+        if self.numpy:
+            rows = np.zeros((self.height, self.width * 3 + 1), np.uint8)
+            rows[:, 1:] = self.pixels.reshape(self.height, self.width * 3)
+            return rows.tobytes()
+        return b''.join(b'\x00' + row for row in self.rows)
+
+    def to_png(self, level=6):
+        """
+        Encodes the canvas as an RGB PNG.
+        """
+        return encode_png(self.width, self.height, self.scanlines(), level)
+
+
+def _chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data)))
+
+
+def encode_png(width, height, scanlines, level=6):
+    """
+    Builds an 8-bit RGB PNG from filtered scanlines.
+
+    Args:
+        width, height: Image size in pixels
+        scanlines: Rows of 3 * width bytes, each preceded by a filter byte
+        level: zlib compression level
+
+    Returns:
+        bytes: The PNG file
+    """
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', header)
+            + _chunk(b'IDAT', zlib.compress(scanlines, level)) + _chunk(b'IEND', b''))
+
+
+def _bounds(entities, layer, directions):
+    # Tile-space box around every entity footprint and tile
+    box = None
+    for entity in entities:
+        position = entity.get('position')
+        if not position:
+            continue
+        left, top, right, bottom = footprint(entity.get('name'), position.get('x', 0),
+                                             position.get('y', 0), entity.get('direction', 0),
+                                             directions=directions)
+        if box is None:
+            box = [left, top, right, bottom]
+        else:
+            box[0], box[1] = min(box[0], left), min(box[1], top)
+            box[2], box[3] = max(box[2], right), max(box[3], bottom)
+    tile_box = layer.bounds() if layer is not None else None
+    for tile in (layer.extras if layer is not None else ()):
+        position = tile['position']
+        x, y = position['x'], position['y']
+        tile_box = (min(tile_box[0], x), min(tile_box[1], y), max(tile_box[2], x + 1),
+                    max(tile_box[3], y + 1)) if tile_box else (x, y, x + 1, y + 1)
+    if tile_box is not None:
+        if box is None:
+            box = list(tile_box)
+        else:
+            box[0], box[1] = min(box[0], tile_box[0]), min(box[1], tile_box[1])
+            box[2], box[3] = max(box[2], tile_box[2]), max(box[3], tile_box[3])
+    return box
+
+
+def _wires(bp, entities):
+    # (entity, entity, colour) for every wire
+    wires = bp.get('wires') or []
+    for (e1, c1), (e2, c2) in iter_circuit_wires(entities, wires):
+        yield e1, e2, 'red' if c1 % 2 else 'green'
+    for wire in wires:
+        if not is_circuit_wire(wire[1], wire[3]):
+            yield wire[0], wire[2], 'copper'
+    for entity in entities:
+        for other in entity.get('neighbours') or []:
+            if entity.get('entity_number', 0) < other:
+                yield entity['entity_number'], other, 'copper'
+
+
+def render_blueprint(bp, size=DEFAULT_SIZE, wires=False, colours=NAME_COLOURS,
+                     use_numpy=None):
+    """
+    Draws one blueprint body as a PNG.
+
+    Args:
+        bp: The dict under 'blueprint' (tiles may be a TileLayer)
+        size: Longest side of the image, in pixels
+        wires: Also draw circuit and copper wires
+        colours: Name -> RGB table; names not in it get a derived colour
+        use_numpy: Force the NumPy (True) or pure Python (False) canvas
+
+    Returns:
+        bytes: The PNG file
+    """
+    entities = bp.get('entities') or []
+    tiles = bp.get('tiles') or []
+    layer = None
+    if tiles:
+        layer = tiles if isinstance(tiles, TileLayer) else TileLayer.from_tiles(tiles)
+
+    directions = direction_count(bp.get('version'))
+    box = _bounds(entities, layer, directions) or [0, 0, 1, 1]
+    left, top = box[0], box[1]
+    span_x, span_y = max(box[2] - left, 1), max(box[3] - top, 1)
+    scale = min(size / span_x, size / span_y, MAX_SCALE)
+    canvas = Canvas(max(1, math.ceil(span_x * scale)), max(1, math.ceil(span_y * scale)),
+                    use_numpy=use_numpy)
+
+    def pixels(x0, y0, x1, y1):
+        # Tile-space box -> pixel box, at least one pixel across
+        px0, py0 = int((x0 - left) * scale), int((y0 - top) * scale)
+        return (px0, py0, max(px0 + 1, int((x1 - left) * scale)),
+                max(py0 + 1, int((y1 - top) * scale)))
+
+    if layer is not None:
+        tile_colours = {}
+        for name, y, x0, x1 in layer.runs():
+            colour = tile_colours.get(name)
+            if colour is None:
+                colour = tile_colours[name] = name_colour(name, colours) \
+                    if name in colours else UNKNOWN_TILE
+            canvas.fill(*pixels(x0, y, x1, y + 1), colour)
+
+    entity_colours = {}
+    centres = {}
+    for entity in entities:
+        position = entity.get('position')
+        if not position:
+            continue
+        name = entity.get('name')
+        colour = entity_colours.get(name)
+        if colour is None:
+            colour = entity_colours[name] = name_colour(name, colours)
+        x0, y0, x1, y1 = pixels(*footprint(name, position.get('x', 0), position.get('y', 0),
+                                           entity.get('direction', 0), directions=directions))
+        if x1 - x0 >= 4 and y1 - y0 >= 4:
+            # Leave a gap so neighbouring entities stay apart
+            x0, y0, x1, y1 = x0 + 1, y0 + 1, x1 - 1, y1 - 1
+        canvas.fill(x0, y0, x1, y1, colour)
+        if wires and 'entity_number' in entity:
+            centres[entity['entity_number']] = ((x0 + x1 - 1) // 2, (y0 + y1 - 1) // 2)
+
+    if wires:
+        for e1, e2, colour in _wires(bp, entities):
+            if e1 in centres and e2 in centres:
+                canvas.line(*centres[e1], *centres[e2], WIRE_COLOURS[colour])
+
+    return canvas.to_png()
+
+
+def iter_leaf_blueprints(blueprint_data, path=()):
+    """
+    Yields (path, body) for every blueprint in a blueprint or (nested)
+    book; path lists the child positions leading to it.
+    """
+    kind = next((k for k in KINDS if k in blueprint_data), None)
+    if kind == 'blueprint':
+        yield path, blueprint_data['blueprint']
+    elif kind == 'blueprint_book':
+        for position, child in enumerate(blueprint_data['blueprint_book'].get('blueprints', [])):
+            yield from iter_leaf_blueprints(child, path + (position,))
+
+
+class ThumbnailCache:
+    """
+    Directory of thumbnails keyed by canonical blueprint digest and render
+    settings: <directory>/<digest[:2]>/<digest>-<settings>.png. Files are
+    written atomically, so several processes can share one directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest, size=DEFAULT_SIZE, wires=False):
+        settings = f"v{RENDER_VERSION}-{size}{'w' if wires else ''}"
+        return os.path.join(self.directory, digest[:2], f"{digest}-{settings}.png")
+
+    def get(self, digest, size=DEFAULT_SIZE, wires=False):
+        """
+        Returns a cached PNG, or None.
+        """
+        try:
+            with open(self.path(digest, size, wires), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest, png, size=DEFAULT_SIZE, wires=False):
+        """
+        Stores a PNG; returns its path.
+        """
+        path = self.path(digest, size, wires)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(temp, path)
+        except BaseException:
+            # Do not leave a partial file behind (disk full, interrupted, ...)
+            try:
+                os.unlink(temp)
+            except OSError:
+                pass
+            raise
+        return path
+
+
+def thumbnail(bp, cache, size=DEFAULT_SIZE, wires=False):
+    """
+    Returns the cached thumbnail of a blueprint body, drawing and caching
+    it first if needed.
+
+    Returns:
+        tuple: (path of the PNG, digest, True if it was already cached)
+    """
+    digest = canonical_digest({'blueprint': bp})
+    path = cache.path(digest, size, wires)
+    if os.path.exists(path):
+        return path, digest, True
+    return cache.put(digest, render_blueprint(bp, size, wires), size, wires), digest, False
+
+
+# -- batches --
+
+_CHUNKS_PER_WORKER = 8
+
+
+def render_item(item, cache_dir, size=DEFAULT_SIZE, wires=False):
+    """
+    Thumbnails every blueprint in one batch item from
+    blueprint_batch.iter_inputs().
+
+    Returns:
+        dict: Result record with 'ok' and 'thumbnails', one entry per
+            blueprint: 'path' (positions inside books), 'label', 'hash',
+            'file' and 'cached'
+    """
+    label, kind, payload = item
+    record = {"source": label}
+    try:
+        if kind == 'json_file':
+            with open(payload, 'r') as f:
+                blueprint_data = json.load(f)
+        else:
+            if kind == 'string_file':
+                with open(payload, 'r') as f:
+                    payload = f.read().strip()
+            blueprint_data = decode_blueprint(payload)[0]
+        cache = ThumbnailCache(cache_dir)
+        thumbnails = []
+        for path, bp in iter_leaf_blueprints(blueprint_data):
+            file, digest, cached = thumbnail(bp, cache, size, wires)
+            thumbnails.append({"path": list(path), "label": bp.get('label'),
+                               "hash": digest, "file": file, "cached": cached})
+        record['thumbnails'] = thumbnails
+        record['ok'] = True
+    except Exception as e:
+        record['ok'] = False
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _render_line(args):
+    index, item, cache_dir, size, wires = args
+    record = {"index": index, **render_item(item, cache_dir, size, wires)}
+    drawn = sum(not t['cached'] for t in record.get('thumbnails', []))
+    return json.dumps(record), record['ok'], len(record.get('thumbnails', [])), drawn
+
+
+def run_thumbnails(items, cache_dir, out=None, workers=None, chunksize=16,
+                   size=DEFAULT_SIZE, wires=False):
+    """
+    Thumbnails batch items into a cache directory, writing JSON Lines
+    records in input order.
+
+    Args:
+        items: Iterable of (label, kind, payload) tuples
+        cache_dir: ThumbnailCache directory
+        out: Text file for the JSON lines (None to skip them)
+        workers: Number of worker processes (default: CPU count; 1 runs
+            everything in this process)
+        chunksize: Items sent to a worker per dispatch
+        size, wires: As for render_blueprint
+
+    Returns:
+        tuple: (items, thumbnails, thumbnails drawn, failures)
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = ((index, item, cache_dir, size, wires) for index, item in enumerate(items))
+    totals = [0, 0, 0, 0]
+
+    def write(results):
+        for line, ok, count, drawn in results:
+            if out is not None:
+                out.write(line + "\n")
+            totals[0] += 1
+            totals[1] += count
+            totals[2] += drawn
+            totals[3] += not ok
+
+    if workers == 1:
+        write(map(_render_line, jobs))
+    else:
+        window = workers * chunksize * _CHUNKS_PER_WORKER
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = list(islice(jobs, window))
+                if not batch:
+                    break
+                write(pool.map(_render_line, batch, chunksize=chunksize))
+    return tuple(totals)
+
+
+def _demo():
+    from blueprint_benchmark import synthetic_blueprint
+    from blueprint_decoder import encode_blueprint
+
+    print("(no source given; thumbnailing a generated library)")
+    with tempfile.TemporaryDirectory() as directory:
+        library = os.path.join(directory, 'library.txt')
+        with open(library, 'w') as f:
+            for i in range(100):
+                data = synthetic_blueprint(2000, tiles=4000, wired_deciders=50, seed=i)
+                f.write(encode_blueprint(data) + "\n")
+        cache_dir = os.path.join(directory, 'thumbnails')
+        for label in ('first run', 'cached'):
+            start = time.perf_counter()
+            _, count, drawn, _ = run_thumbnails(iter_inputs(library), cache_dir,
+                                                workers=1, wires=True)
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<10} {count} thumbnails ({drawn} drawn) in {elapsed:.2f}s, "
+                  f"{elapsed / count * 1000:.1f} ms each")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PNG thumbnails of blueprints.")
+    parser.add_argument('source', nargs='?',
+                        help="directory, file with one string per line, or '-' for stdin")
+    parser.add_argument('--cache', default='thumbnails',
+                        help="thumbnail directory (default: thumbnails)")
+    parser.add_argument('-o', '--output',
+                        help="JSON Lines file to write (default: stdout)")
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE,
+                        help=f"longest side in pixels (default: {DEFAULT_SIZE})")
+    parser.add_argument('--wires', action='store_true', help="draw wires")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=16,
+                        help="items per worker dispatch (default: 16)")
+    args = parser.parse_args()
+
+    print("Blueprint Thumbnails", file=sys.stderr)
+    print("="*60, file=sys.stderr)
+    if args.source is None:
+        _demo()
+        return
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        total, count, drawn, failed = run_thumbnails(
+            iter_inputs(args.source), args.cache, out, args.workers, args.chunksize,
+            args.size, args.wires)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{total} inputs, {count} thumbnails ({drawn} drawn, {count - drawn} cached), "
+          f"{failed} failed in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Bulk geometric transforms for whole blueprints.
+Translation, 90 degree rotation, mirroring and grid snapping are composed
+into one Transform and applied to every entity and tile in a single
+batched pass, with NumPy doing the arithmetic when it is installed.
+"""
+
+import math
+import sys
+import time
+from array import array
+
+from entity_table import EntityTable, MISSING
+from spatial_index import DIRECTIONS, ENTITY_SIZES, direction_count, is_sideways
+from tile_layer import TileLayer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Transforms track 16 directions; a quarter turn is 4 steps
+QUARTER_TURN = DIRECTIONS // 4
+
+
+class Transform:
+    """
+    A grid-preserving affine transform plus the matching direction remap.
+
+    Positions map as x' = a*x + b*y + tx and y' = c*x + d*y + ty, where
+    (a, b, c, d) is always a rotation or reflection, so tiles stay on the
+    tile grid. Methods return self and can be chained:
+
+        Transform().rotate().translate(10, 0)
+    """
+
+    def __init__(self):
+        self.matrix = (1, 0, 0, 1)
+        self.offset = (0, 0)
+        self.directions = list(range(DIRECTIONS))
+
+    def _then(self, matrix, offset, direction_map):
+        a, b, c, d = self.matrix
+        p, q, r, s = matrix
+        tx, ty = self.offset
+        self.matrix = (p * a + q * c, p * b + q * d,
+                       r * a + s * c, r * b + s * d)
+        self.offset = (p * tx + q * ty + offset[0],
+                       r * tx + s * ty + offset[1])
+        self.directions = [direction_map(d) for d in self.directions]
+        return self
+
+    def translate(self, dx, dy):
+        """
+        Moves everything by (dx, dy) tiles.
+        """
+        return self._then((1, 0, 0, 1), (dx, dy), lambda d: d)
+
+    def rotate(self, turns=1):
+        """
+        Rotates clockwise by a number of quarter turns around (0, 0).
+        """
+        turns %= 4
+        for _ in range(turns):
+            # Screen coordinates (y points down): (x, y) -> (-y, x)
+            self._then((0, -1, 1, 0), (0, 0),
+                       lambda d: (d + QUARTER_TURN) % DIRECTIONS)
+        return self
+
+    def mirror(self, axis='x'):
+        """
+        Mirrors across the vertical axis ('x' flips left and right) or the
+        horizontal axis ('y' flips top and bottom).
+        """
+        if axis == 'x':
+            return self._then((-1, 0, 0, 1), (0, 0),
+                              lambda d: (DIRECTIONS - d) % DIRECTIONS)
+        if axis == 'y':
+            return self._then((1, 0, 0, -1), (0, 0),
+                              lambda d: (DIRECTIONS // 2 - d) % DIRECTIONS)
+        raise ValueError(f"Unknown mirror axis: {axis!r}")
+
+    def apply_points(self, xs, ys):
+        """
+        Transforms parallel sequences of x and y coordinates.
+
+        Returns:
+            tuple: (new xs, new ys) as NumPy arrays or lists of floats
+        """
+        a, b, c, d = self.matrix
+        tx, ty = self.offset
+        if np is not None:
+            xs = np.asarray(xs, dtype=float)
+            ys = np.asarray(ys, dtype=float)
+            return a * xs + b * ys + tx, c * xs + d * ys + ty
+        return ([a * x + b * y + tx for x, y in zip(xs, ys)],
+                [c * x + d * y + ty for x, y in zip(xs, ys)])
+
+    def direction_map(self, directions=DIRECTIONS):
+        """
+        Returns the new direction of each old one, as a list.
+
+        Args:
+            directions: Directions in a full turn (16, or 8 for 1.x
+                blueprints; see spatial_index.direction_count)
+        """
+        # Quarter turns and mirrors keep even 16-way directions even, so
+        # an 8-way direction d is 16-way direction 2 * d
+        step = DIRECTIONS // directions
+        return [self.directions[d * step] // step for d in range(directions)]
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _transform_table(table, transform, lookup):
+    a, b, c, d = transform.matrix
+    tx, ty = transform.offset
+    if np is not None:
+        # Work on the arrays' own memory; NaN (no position) stays NaN
+        xs = np.frombuffer(table.x, dtype='d')
+        ys = np.frombuffer(table.y, dtype='d')
+        old_x = xs.copy()
+        xs[:] = a * old_x + b * ys + tx
+        ys[:] = c * old_x + d * ys + ty
+        directions = np.frombuffer(table.direction, dtype='b')
+        known = (directions >= 0) & (directions < len(lookup))
+        directions[known] = np.array(lookup, dtype='b')[directions[known]]
+        return
+
+    xs, ys = transform.apply_points(table.x, table.y)
+    table.x = array('d', xs)
+    table.y = array('d', ys)
+    table.direction = array('b', (
+        lookup[d] if d != MISSING and d < len(lookup) else d
+        for d in table.direction))
+
+
+def _transform_entities(entities, transform, lookup):
+    placed = [e for e in entities if isinstance(e.get('position'), dict)]
+    xs, ys = transform.apply_points([e['position']['x'] for e in placed],
+                                    [e['position']['y'] for e in placed])
+    if np is not None:
+        xs, ys = xs.tolist(), ys.tolist()
+    for entity, x, y in zip(placed, xs, ys):
+        entity['position'] = {'x': _number(x), 'y': _number(y)}
+
+    for entity in entities:
+        direction = entity.get('direction')
+        if type(direction) is int and 0 <= direction < len(lookup):
+            entity['direction'] = lookup[direction]
+
+
+def _transform_tiles(tiles, transform):
+    # Tile positions are top-left corners; transform the centres instead
+    xs, ys = transform.apply_points([t['position']['x'] + 0.5 for t in tiles],
+                                    [t['position']['y'] + 0.5 for t in tiles])
+    if np is not None:
+        xs, ys = xs.tolist(), ys.tolist()
+    for tile, x, y in zip(tiles, xs, ys):
+        tile['position'] = {'x': math.floor(x), 'y': math.floor(y)}
+
+
+def _transform_layer(layer, transform):
+    # Moves whole runs of tiles. A run stays a run when rows stay rows and
+    # turns into a column when the transform swaps the axes; tiles are
+    # transformed by their centres, like _transform_tiles()
+    a, b, c, d = transform.matrix
+    tx, ty = transform.offset
+    rows, columns = [], []
+    for name, y, x0, x1 in layer.runs(extras=False):
+        if b == 0:
+            new_y = math.floor(d * (y + 0.5) + ty)
+            new_x = math.floor(min(a * (x0 + 0.5), a * (x1 - 0.5)) + tx)
+            rows.append((name, new_y, new_x, x1 - x0))
+        else:
+            new_x = math.floor(b * (y + 0.5) + tx)
+            new_y = math.floor(min(c * (x0 + 0.5), c * (x1 - 0.5)) + ty)
+            columns.append((name, new_x, new_y, x1 - x0))
+
+    moved = TileLayer()
+    if rows or columns:
+        moved.origin = min([x for _, _, x, _ in rows] + [x for _, x, _, _ in columns])
+    origin = moved.origin
+    for name, y, x, length in rows:
+        by_y = moved.rows.setdefault(name, {})
+        by_y[y] = by_y.get(y, 0) | ((1 << length) - 1) << (x - origin)
+    for name, x, y0, length in columns:
+        by_y = moved.rows.setdefault(name, {})
+        bit = 1 << (x - origin)
+        for y in range(y0, y0 + length):
+            by_y[y] = by_y.get(y, 0) | bit
+    moved.extras = layer.extras
+    _transform_tiles(moved.extras, transform)
+    return moved
+
+
+def apply_transform(blueprint_data, transform):
+    """
+    Applies a Transform to every entity and tile, in place.
+
+    Works on single blueprints and (nested) books, on entity lists held
+    either as dicts or as an EntityTable, and on tiles held as a TileLayer.
+    Directions are remapped in each blueprint's own scheme (16 directions,
+    or 8 for Factorio 1.x versions).
+
+    Args:
+        blueprint_data: The decoded blueprint data
+        transform: The Transform to apply
+
+    Returns:
+        dict: The same blueprint data
+    """
+    if 'blueprint_book' in blueprint_data:
+        for child in blueprint_data['blueprint_book'].get('blueprints', []):
+            apply_transform(child, transform)
+        return blueprint_data
+    if 'blueprint' not in blueprint_data:
+        return blueprint_data
+
+    bp = blueprint_data['blueprint']
+    lookup = transform.direction_map(direction_count(bp.get('version')))
+    entities = bp.get('entities')
+    if isinstance(entities, EntityTable):
+        _transform_table(entities, transform, lookup)
+    elif entities:
+        _transform_entities(entities, transform, lookup)
+    tiles = bp.get('tiles')
+    if isinstance(tiles, TileLayer):
+        bp['tiles'] = _transform_layer(tiles, transform)
+    elif tiles:
+        _transform_tiles(tiles, transform)
+    return blueprint_data
+
+
+def translate(blueprint_data, dx, dy):
+    """
+    Moves a whole blueprint by (dx, dy) tiles, in place.
+    """
+    return apply_transform(blueprint_data, Transform().translate(dx, dy))
+
+
+def rotate(blueprint_data, turns=1):
+    """
+    Rotates a whole blueprint clockwise by quarter turns, in place.
+    """
+    return apply_transform(blueprint_data, Transform().rotate(turns))
+
+
+def mirror(blueprint_data, axis='x'):
+    """
+    Mirrors a whole blueprint left-right ('x') or top-bottom ('y'), in place.
+    """
+    return apply_transform(blueprint_data, Transform().mirror(axis))
+
+
+def _snap_value(value, size):
+    # Put the footprint's edge on a tile boundary
+    return _number(math.floor(value - size / 2 + 0.5) + size / 2)
+
+
+def snap(blueprint_data, sizes=ENTITY_SIZES):
+    """
+    Re-snaps every entity so its footprint lines up with the tile grid
+    (odd-sized sides centred on .5, even-sized sides on whole tiles) and
+    every tile to whole coordinates, in place.
+
+    Args:
+        blueprint_data: The decoded blueprint data
+        sizes: Name -> (width, height) table
+
+    Returns:
+        dict: The same blueprint data
+    """
+    if 'blueprint_book' in blueprint_data:
+        for child in blueprint_data['blueprint_book'].get('blueprints', []):
+            snap(child, sizes)
+        return blueprint_data
+    if 'blueprint' not in blueprint_data:
+        return blueprint_data
+
+    bp = blueprint_data['blueprint']
+    directions = direction_count(bp.get('version'))
+    entities = bp.get('entities') or []
+    if isinstance(entities, EntityTable):
+        for row in range(len(entities)):
+            x = entities.x[row]
+            if x != x:  # no position
+                continue
+            width, height = sizes.get(entities.names[entities.name_codes[row]], (1, 1))
+            if is_sideways(entities.direction[row], directions):
+                width, height = height, width
+            entities.set_position(row, _snap_value(x, width),
+                                  _snap_value(entities.y[row], height))
+    else:
+        for entity in entities:
+            position = entity.get('position')
+            if not isinstance(position, dict):
+                continue
+            width, height = sizes.get(entity.get('name'), (1, 1))
+            if is_sideways(entity.get('direction'), directions):
+                width, height = height, width
+            entity['position'] = {'x': _snap_value(position['x'], width),
+                                  'y': _snap_value(position['y'], height)}
+
+    tiles = bp.get('tiles') or []
+    # A TileLayer's bitmap tiles already sit on whole coordinates
+    for tile in tiles.extras if isinstance(tiles, TileLayer) else tiles:
+        position = tile['position']
+        tile['position'] = {'x': math.floor(position['x'] + 0.5),
+                            'y': math.floor(position['y'] + 0.5)}
+    return blueprint_data
+
+
+def main():
+    from entity_table import attach_entity_tables, sample_entities
+
+    print("Blueprint Transform Benchmark")
+    print("="*60)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    transform = Transform().rotate().mirror('x').translate(10, -4)
+    print(f"{count} entities, NumPy {'on' if np is not None else 'off'}")
+
+    blueprint_data = {"blueprint": {"entities": sample_entities(count)}}
+    start = time.perf_counter()
+    apply_transform(blueprint_data, transform)
+    print(f"  dict entities:  {time.perf_counter() - start:.3f}s")
+
+    attach_entity_tables(blueprint_data)
+    start = time.perf_counter()
+    apply_transform(blueprint_data, transform)
+    print(f"  EntityTable:    {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
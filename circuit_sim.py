@@ -0,0 +1,852 @@
+#!/usr/bin/env python3
+"""
+Tick-accurate circuit-network simulator for decoded blueprints.
+Builds the red and green networks from the blueprint's wires, then
+evaluates constant, decider and arithmetic combinators tick by tick with
+the game's one-tick combinator delay and 32-bit wrap-around. Network
+contents are dense signal vectors; with NumPy installed all simple
+combinators of a build are evaluated together as array operations.
+Probes and assertions make designs testable without loading the game.
+"""
+
+import operator
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+EACH = 'signal-each'
+ANYTHING = 'signal-anything'
+EVERYTHING = 'signal-everything'
+WILDCARDS = (EACH, ANYTHING, EVERYTHING)
+
+DEFAULT_QUALITY = 'normal'
+
+# Wire connector ids: combinators read on 1 (red) and 2 (green) and write
+# on 3 (red) and 4 (green); other entities use 1 and 2 for both
+RED_INPUT, GREEN_INPUT, RED_OUTPUT, GREEN_OUTPUT = 1, 2, 3, 4
+TWO_SIDED = ('decider-combinator', 'arithmetic-combinator')
+
+_INT_MIN, _INT_RANGE = -0x80000000, 0x100000000
+
+_COMPARATORS = {
+    '>': operator.gt, '<': operator.lt, '=': operator.eq,
+    '≥': operator.ge, '>=': operator.ge, '≤': operator.le, '<=': operator.le,
+    '≠': operator.ne, '!=': operator.ne,
+}
+
+
+def wrap(value):
+    """
+    Wraps an integer into the signed 32-bit range, as the game does.
+    """
+    return (value - _INT_MIN) % _INT_RANGE + _INT_MIN
+
+
+def _divide(a, b):
+    # Integer division rounding towards zero; x / 0 is 0
+    if b == 0:
+        return 0
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def _modulo(a, b):
+    return 0 if b == 0 else a - b * _divide(a, b)
+
+
+def _power(a, b):
+    return 0 if b < 0 else pow(a, b, _INT_RANGE)
+
+
+_OPERATIONS = {
+    '*': operator.mul, '/': _divide, '+': operator.add, '-': operator.sub,
+    '%': _modulo, '^': _power,
+    '<<': lambda a, b: a << (b & 31), '>>': lambda a, b: a >> (b & 31),
+    'AND': operator.and_, 'OR': operator.or_, 'XOR': operator.xor,
+}
+
+
+def signal_key(signal, quality=None):
+    """
+    Normalizes a signal to its (name, quality) key.
+
+    Args:
+        signal: A name, a (name, quality) tuple, or a signal/filter dict
+            from blueprint JSON
+        quality: Quality for a bare name (default: normal)
+    """
+    if isinstance(signal, dict):
+        return signal['name'], signal.get('quality') or DEFAULT_QUALITY
+    if isinstance(signal, tuple):
+        return signal
+    return signal, quality or DEFAULT_QUALITY
+
+
+def _display(key):
+    name, quality = key
+    return name if quality == DEFAULT_QUALITY else f"{name}@{quality}"
+
+
+def _networks(spec):
+    # {"red": bool, "green": bool} -> (red, green); both by default
+    if not spec:
+        return True, True
+    return bool(spec.get('red', True)), bool(spec.get('green', True))
+
+
+class _Signals:
+    # (name, quality) -> dense vector slot
+
+    def __init__(self):
+        self.keys = []
+        self.slots = {}
+
+    def slot(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+        return slot
+
+    def ref(self, signal):
+        # Slot for a signal dict, the wildcard name, or None
+        if not signal or 'name' not in signal:
+            return None
+        if signal['name'] in WILDCARDS:
+            return signal['name']
+        return self.slot(signal_key(signal))
+
+
+class _Reader:
+    # Reads an entity's red and green inputs, held as {slot: value} dicts
+
+    __slots__ = ('red', 'green')
+
+    def __init__(self, red, green):
+        self.red = red
+        self.green = green
+
+    def read(self, slot, nets):
+        red = self.red.get(slot, 0) if nets[0] else 0
+        green = self.green.get(slot, 0) if nets[1] else 0
+        return wrap(red + green)
+
+    def present(self, nets):
+        slots = set()
+        if nets[0]:
+            slots.update(self.red)
+        if nets[1]:
+            slots.update(self.green)
+        return [slot for slot in sorted(slots) if self.read(slot, nets)]
+
+
+class _Condition:
+    __slots__ = ('first', 'second', 'constant', 'compare', 'first_nets', 'second_nets')
+
+    def __init__(self, raw, signals):
+        self.first = signals.ref(raw.get('first_signal'))
+        second = signals.ref(raw.get('second_signal'))
+        # Wildcards only make sense as the first signal
+        self.second = None if second in WILDCARDS else second
+        self.constant = raw.get('constant', 0)
+        self.compare = _COMPARATORS[raw.get('comparator', '<')]
+        self.first_nets = _networks(raw.get('first_signal_networks'))
+        self.second_nets = _networks(raw.get('second_signal_networks'))
+
+    def test(self, reader, each_slot):
+        if self.second is None:
+            b = self.constant
+        else:
+            b = reader.read(self.second, self.second_nets)
+        first, compare, nets = self.first, self.compare, self.first_nets
+        if first is None:
+            return False
+        if first == EVERYTHING:
+            return all(compare(reader.read(s, nets), b) for s in reader.present(nets))
+        if first == ANYTHING:
+            return any(compare(reader.read(s, nets), b) for s in reader.present(nets))
+        if first == EACH:
+            return each_slot is not None and compare(reader.read(each_slot, nets), b)
+        return compare(reader.read(first, nets), b)
+
+
+class _Output:
+    __slots__ = ('signal', 'copy', 'constant', 'nets')
+
+    def __init__(self, raw, signals):
+        self.signal = signals.ref(raw.get('signal'))
+        self.copy = raw.get('copy_count_from_input', True)
+        self.constant = raw.get('constant', 1)
+        self.nets = _networks(raw.get('networks'))
+
+
+class _Combinator:
+    # Shared by deciders and arithmetic combinators: the networks on each
+    # input and output connector, filled in once networks are known
+    __slots__ = ('number', 'inputs', 'outputs')
+
+    def __init__(self, number):
+        self.number = number
+        self.inputs = None    # (red network, green network)
+        self.outputs = None
+
+
+class _Decider(_Combinator):
+    __slots__ = ('groups', 'results', 'each_nets')
+
+    def __init__(self, entity, signals):
+        super().__init__(entity['entity_number'])
+        behavior = (entity.get('control_behavior') or {}).get('decider_conditions') or {}
+        if 'conditions' in behavior or 'outputs' in behavior:
+            raw_conditions = behavior.get('conditions', [])
+            raw_outputs = behavior.get('outputs', [])
+        else:
+            # Factorio 1.x: one condition and one output signal
+            raw_conditions = [behavior] if behavior else []
+            raw_outputs = []
+            if behavior.get('output_signal'):
+                raw_outputs.append({
+                    'signal': behavior['output_signal'],
+                    'copy_count_from_input': behavior.get('copy_count_from_input', True),
+                })
+
+        # 'and' binds tighter than 'or': split into OR-ed groups of AND-ed
+        # conditions
+        self.groups = []
+        for i, raw in enumerate(raw_conditions):
+            condition = _Condition(raw, signals)
+            if i == 0 or raw.get('compare_type', 'or') == 'or':
+                self.groups.append([condition])
+            else:
+                self.groups[-1].append(condition)
+        self.results = [_Output(raw, signals) for raw in raw_outputs]
+        self.each_nets = next((c.first_nets for group in self.groups for c in group
+                               if c.first == EACH), None)
+
+    def is_simple(self):
+        if len(self.groups) != 1 or len(self.groups[0]) != 1 or len(self.results) != 1:
+            return False
+        condition, result = self.groups[0][0], self.results[0]
+        return (type(condition.first) is int and condition.first_nets == (True, True)
+                and condition.second_nets == (True, True)
+                and type(result.signal) is int and result.nets == (True, True))
+
+    def _passes(self, reader, each_slot):
+        return any(all(c.test(reader, each_slot) for c in group) for group in self.groups)
+
+    def evaluate(self, reader):
+        if self.each_nets is not None:
+            passing = [s for s in reader.present(self.each_nets) if self._passes(reader, s)]
+            if not passing:
+                return {}
+        elif self._passes(reader, None):
+            passing = None
+        else:
+            return {}
+
+        out = {}
+        for result in self.results:
+            signal, nets = result.signal, result.nets
+            if signal == EACH:
+                for s in passing or ():
+                    value = reader.read(s, nets) if result.copy else result.constant
+                    out[s] = out.get(s, 0) + value
+            elif signal == EVERYTHING:
+                for s in reader.present(nets):
+                    value = reader.read(s, nets) if result.copy else result.constant
+                    out[s] = out.get(s, 0) + value
+            elif type(signal) is int:
+                if passing is not None:
+                    # Each in, one signal out: sum (or count) the passing signals
+                    if result.copy:
+                        value = sum(reader.read(s, nets) for s in passing)
+                    else:
+                        value = result.constant * len(passing)
+                else:
+                    value = reader.read(signal, nets) if result.copy else result.constant
+                out[signal] = out.get(signal, 0) + value
+        return {s: wrap(v) for s, v in out.items() if wrap(v)}
+
+
+class _Arithmetic(_Combinator):
+    __slots__ = ('first', 'first_constant', 'second', 'second_constant',
+                 'operation', 'output', 'first_nets', 'second_nets')
+
+    def __init__(self, entity, signals):
+        super().__init__(entity['entity_number'])
+        raw = (entity.get('control_behavior') or {}).get('arithmetic_conditions') or {}
+        self.first = signals.ref(raw.get('first_signal'))
+        self.first_constant = raw.get('first_constant', 0)
+        self.second = signals.ref(raw.get('second_signal'))
+        self.second_constant = raw.get('second_constant', 0)
+        self.operation = raw.get('operation', '*')
+        if self.operation not in _OPERATIONS:
+            raise ValueError(f"Unknown arithmetic operation: {self.operation!r}")
+        self.output = signals.ref(raw.get('output_signal'))
+        self.first_nets = _networks(raw.get('first_signal_networks'))
+        self.second_nets = _networks(raw.get('second_signal_networks'))
+
+    def is_simple(self):
+        return (self.first not in WILDCARDS and self.second not in WILDCARDS
+                and type(self.output) is int
+                and self.first_nets == (True, True) and self.second_nets == (True, True))
+
+    def _operand(self, reader, signal, constant, nets):
+        if signal is None or signal in WILDCARDS:
+            return constant
+        return reader.read(signal, nets)
+
+    def evaluate(self, reader):
+        output = self.output
+        if output is None or output == ANYTHING or output == EVERYTHING:
+            return {}
+        operation = _OPERATIONS[self.operation]
+        b = self._operand(reader, self.second, self.second_constant, self.second_nets)
+        if self.first == EACH:
+            results = {s: wrap(operation(reader.read(s, self.first_nets), b))
+                       for s in reader.present(self.first_nets)}
+            if output == EACH:
+                return {s: v for s, v in results.items() if v}
+            total = wrap(sum(results.values()))
+            return {output: total} if total else {}
+        if output == EACH:
+            return {}
+        a = self._operand(reader, self.first, self.first_constant, self.first_nets)
+        value = wrap(operation(a, b))
+        return {output: value} if value else {}
+
+
+def _constant_signals(entity):
+    # (key, count) pairs a constant combinator outputs
+    behavior = entity.get('control_behavior') or {}
+    if behavior.get('is_on', True) is False:
+        return
+    sections = behavior.get('sections')
+    if sections is not None:
+        for section in sections.get('sections', []):
+            if section.get('active', True) is False:
+                continue
+            for entry in section.get('filters', []):
+                if 'name' in entry:
+                    yield signal_key(entry), entry.get('count', 0)
+    else:
+        # Factorio 1.x
+        for entry in behavior.get('filters', []):
+            if entry.get('signal'):
+                yield signal_key(entry['signal']), entry.get('count', 0)
+
+
+def _connector_id(point, colour):
+    # Factorio 1.x circuit point (1 in, 2 out) and colour -> 2.0 connector id
+    return (int(point) - 1) * 2 + (1 if colour == 'red' else 2)
+
+
+def is_circuit_wire(c1, c2):
+    """
+    Tells whether a 2.0 wire between connectors c1 and c2 is a red or
+    green circuit wire. 1-4 are circuit connectors (odd red, even green);
+    higher ids are copper wires and power switch sides.
+    """
+    return c1 <= 4 and c2 <= 4 and c1 % 2 == c2 % 2
+
+
+def iter_circuit_wires(entities, wires):
+    """
+    Lists the red and green wires of a blueprint, in either format.
+
+    Args:
+        entities: The blueprint's entities (Factorio 1.x 'connections'
+            are read from them)
+        wires: The blueprint's Factorio 2.0 'wires' list
+
+    Yields:
+        tuple: ((entity, connector), (entity, connector)) using 2.0
+            connector ids
+    """
+    for wire in wires:
+        e1, c1, e2, c2 = wire[:4]
+        if is_circuit_wire(c1, c2):
+            yield (e1, c1), (e2, c2)
+    for entity in entities:
+        for point, colours in (entity.get('connections') or {}).items():
+            if point not in ('1', '2') or not isinstance(colours, dict):
+                continue
+            for colour in ('red', 'green'):
+                for target in colours.get(colour, []):
+                    yield ((entity['entity_number'], _connector_id(point, colour)),
+                           (target['entity_id'],
+                            _connector_id(target.get('circuit_id', 1), colour)))
+
+
+class Probe:
+    """
+    Records chosen signals of one network after every tick.
+
+    history holds one {signal: value} dict per tick, keyed by the signals
+    as they were passed in.
+    """
+
+    def __init__(self, simulator, entity_number, signals, side='input', colour=None):
+        self._simulator = simulator
+        self.entity_number = entity_number
+        self.signals = list(signals)
+        self.side = side
+        self.colour = colour
+        self.history = []
+
+    def _record(self):
+        read = self._simulator.read
+        self.history.append({signal: read(self.entity_number, signal, self.side, self.colour)
+                             for signal in self.signals})
+
+    def values(self, signal):
+        """
+        Lists the recorded values of one signal, one per tick.
+        """
+        return [sample[signal] for sample in self.history]
+
+
+class CircuitSimulator:
+    """
+    Simulates the circuit networks of a decoded blueprint.
+
+    Usage:
+        sim = CircuitSimulator(blueprint_data)
+        probe = sim.probe(3, ['signal-A'], side='output')
+        sim.run(60)
+        sim.assert_signal(3, 'signal-A', 60, side='output')
+    """
+
+    def __init__(self, blueprint_data, use_numpy=True):
+        """
+        Args:
+            blueprint_data: Decoded blueprint data ({"blueprint": {...}})
+            use_numpy: Evaluate with NumPy when it is installed
+        """
+        bp = blueprint_data.get('blueprint', blueprint_data)
+        entities = list(bp.get('entities', []))
+        self._np = np if use_numpy else None
+        self._signals = _Signals()
+        self._entities = {e['entity_number']: e for e in entities if 'entity_number' in e}
+
+        combinators = []
+        constants = []
+        for entity in entities:
+            name = entity.get('name')
+            if name == 'decider-combinator':
+                combinators.append(_Decider(entity, self._signals))
+            elif name == 'arithmetic-combinator':
+                combinators.append(_Arithmetic(entity, self._signals))
+            elif name == 'constant-combinator':
+                signals = [(self._signals.slot(key), count)
+                           for key, count in _constant_signals(entity)]
+                constants.append((entity['entity_number'], signals))
+
+        self._build_networks(entities, bp.get('wires', []), combinators, constants)
+        width = self.width = max(1, len(self._signals.keys))
+
+        constant = [0] * (self.networks * width)
+        for number, signals in constants:
+            for connector in (RED_INPUT, GREEN_INPUT):
+                if (number, connector) not in self._net_of:
+                    continue
+                base = self._net_of[(number, connector)] * width
+                for slot, count in signals:
+                    constant[base + slot] += count
+        # wrap() keeps a few thousand combinators far from int64 limits
+        constant = [wrap(v) for v in constant]
+
+        self._simple_deciders = []
+        self._simple_arithmetic = []
+        self._generic = []
+        for combinator in combinators:
+            red_in, green_in = combinator.inputs
+            red_out, green_out = combinator.outputs
+            if isinstance(combinator, _Decider) and combinator.is_simple():
+                condition, result = combinator.groups[0][0], combinator.results[0]
+                second = condition.second
+                self._simple_deciders.append((
+                    red_in * width + condition.first, green_in * width + condition.first,
+                    -1 if second is None else red_in * width + second,
+                    -1 if second is None else green_in * width + second,
+                    condition.constant, condition.compare, bool(result.copy),
+                    red_in * width + result.signal, green_in * width + result.signal,
+                    result.constant,
+                    red_out * width + result.signal, green_out * width + result.signal))
+            elif isinstance(combinator, _Arithmetic) and combinator.is_simple():
+                first, second = combinator.first, combinator.second
+                self._simple_arithmetic.append((
+                    -1 if first is None else red_in * width + first,
+                    -1 if first is None else green_in * width + first,
+                    combinator.first_constant,
+                    -1 if second is None else red_in * width + second,
+                    -1 if second is None else green_in * width + second,
+                    combinator.second_constant, combinator.operation,
+                    red_out * width + combinator.output, green_out * width + combinator.output))
+            else:
+                self._generic.append(combinator)
+
+        if self._np is not None:
+            self._constant = self._np.array(constant, dtype=self._np.int64)
+            self._prepare_numpy()
+        else:
+            self._constant = constant
+        self._values = self._constant.copy()
+        self.tick = 0
+        self._probes = []
+
+    def _build_networks(self, entities, wires, combinators, constants):
+        # Union-find over the (entity, connector) nodes that have wires
+        parent = {}
+
+        def find(node):
+            root = parent.setdefault(node, node)
+            while root != parent[root]:
+                root = parent[root]
+            while node != root:
+                parent[node], node = root, parent[node]
+            return root
+
+        for a, b in iter_circuit_wires(entities, wires):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_a] = root_b
+
+        ids = {}
+        self._net_of = {}
+        for node in parent:
+            self._net_of[node] = ids.setdefault(find(node), len(ids))
+        # Unwired connectors read nothing and write into a scratch network
+        # that is cleared every tick
+        self._void = len(ids)
+        self.networks = len(ids) + 1
+
+        for combinator in combinators:
+            net = lambda connector: self._net_of.get((combinator.number, connector), self._void)
+            combinator.inputs = (net(RED_INPUT), net(GREEN_INPUT))
+            combinator.outputs = (net(RED_OUTPUT), net(GREEN_OUTPUT))
+
+    def _prepare_numpy(self):
+        # Column arrays for evaluating all simple combinators at once
+        numpy = self._np
+        size = self.networks * self.width
+
+        def columns(rows, count):
+            if not rows:
+                return [numpy.zeros(0, dtype=numpy.int64)] * count
+            return [numpy.array(column) for column in zip(*rows)]
+
+        (a_r, a_g, b_r, b_g, constant, compares, copy, o_r, o_g, out_constant,
+         w_r, w_g) = columns(self._simple_deciders, 12)
+        self._deciders = None
+        if self._simple_deciders:
+            groups = {}
+            for i, compare in enumerate(compares):
+                groups.setdefault(compare, []).append(i)
+            self._deciders = dict(
+                a_r=a_r, a_g=a_g, has_b=b_r >= 0, b_r=numpy.maximum(b_r, 0),
+                b_g=numpy.maximum(b_g, 0), constant=constant.astype(numpy.int64),
+                groups=[(compare, numpy.array(rows)) for compare, rows in groups.items()],
+                copy=copy.astype(bool), o_r=o_r, o_g=o_g,
+                out_constant=out_constant.astype(numpy.int64),
+                targets=numpy.concatenate([w_r, w_g]))
+
+        (a_r, a_g, a_constant, b_r, b_g, b_constant, operations,
+         w_r, w_g) = columns(self._simple_arithmetic, 9)
+        self._arithmetic = None
+        if self._simple_arithmetic:
+            groups = {}
+            for i, operation in enumerate(operations):
+                groups.setdefault(operation, []).append(i)
+            self._arithmetic = dict(
+                has_a=a_r >= 0, a_r=numpy.maximum(a_r, 0), a_g=numpy.maximum(a_g, 0),
+                a_constant=a_constant.astype(numpy.int64),
+                has_b=b_r >= 0, b_r=numpy.maximum(b_r, 0), b_g=numpy.maximum(b_g, 0),
+                b_constant=b_constant.astype(numpy.int64),
+                groups=[(operation, numpy.array(rows)) for operation, rows in groups.items()],
+                targets=numpy.concatenate([w_r, w_g]))
+        self._size = size
+
+    def _step_numpy(self, values, new):
+        numpy = self._np
+        targets, weights = [], []
+
+        d = self._deciders
+        if d is not None:
+            a = _np_wrap(values[d['a_r']] + values[d['a_g']])
+            b = numpy.where(d['has_b'], _np_wrap(values[d['b_r']] + values[d['b_g']]),
+                            d['constant'])
+            passed = numpy.zeros(len(a), dtype=bool)
+            for compare, rows in d['groups']:
+                passed[rows] = compare(a[rows], b[rows])
+            out = numpy.where(d['copy'], _np_wrap(values[d['o_r']] + values[d['o_g']]),
+                              d['out_constant'])
+            out = numpy.where(passed, out, 0)
+            targets.append(d['targets'])
+            weights.append(numpy.concatenate([out, out]))
+
+        m = self._arithmetic
+        if m is not None:
+            a = numpy.where(m['has_a'], _np_wrap(values[m['a_r']] + values[m['a_g']]),
+                            m['a_constant'])
+            b = numpy.where(m['has_b'], _np_wrap(values[m['b_r']] + values[m['b_g']]),
+                            m['b_constant'])
+            out = numpy.empty(len(a), dtype=numpy.int64)
+            for operation, rows in m['groups']:
+                out[rows] = _np_wrap(_NP_OPERATIONS[operation](a[rows], b[rows]))
+            targets.append(m['targets'])
+            weights.append(numpy.concatenate([out, out]))
+
+        if targets:
+            # Sums of int32 outputs stay exact in float64 up to millions of
+            # writers per signal
+            added = numpy.bincount(numpy.concatenate(targets),
+                                   weights=numpy.concatenate(weights),
+                                   minlength=self._size)
+            new += added.astype(numpy.int64)
+
+    def _step_python(self, values, new):
+        for (a_r, a_g, b_r, b_g, constant, compare, copy, o_r, o_g, out_constant,
+             w_r, w_g) in self._simple_deciders:
+            b = constant if b_r < 0 else wrap(values[b_r] + values[b_g])
+            if compare(wrap(values[a_r] + values[a_g]), b):
+                out = wrap(values[o_r] + values[o_g]) if copy else out_constant
+                new[w_r] += out
+                new[w_g] += out
+
+        for (a_r, a_g, a_constant, b_r, b_g, b_constant, operation,
+             w_r, w_g) in self._simple_arithmetic:
+            a = a_constant if a_r < 0 else wrap(values[a_r] + values[a_g])
+            b = b_constant if b_r < 0 else wrap(values[b_r] + values[b_g])
+            out = wrap(_OPERATIONS[operation](a, b))
+            new[w_r] += out
+            new[w_g] += out
+
+    def _row(self, values, net):
+        # Non-zero signals of a network as {slot: value}
+        start = net * self.width
+        row = values[start:start + self.width]
+        if self._np is not None:
+            slots = self._np.flatnonzero(row)
+            return dict(zip(slots.tolist(), row[slots].tolist()))
+        return {slot: value for slot, value in enumerate(row) if value}
+
+    def step(self):
+        """
+        Advances the simulation by one tick.
+        """
+        values = self._values
+        new = self._constant.copy()
+        if self._np is not None:
+            self._step_numpy(values, new)
+        else:
+            self._step_python(values, new)
+
+        width = self.width
+        for combinator in self._generic:
+            red_in, green_in = combinator.inputs
+            reader = _Reader(self._row(values, red_in), self._row(values, green_in))
+            out = combinator.evaluate(reader)
+            if out:
+                red_out, green_out = combinator.outputs
+                for slot, value in out.items():
+                    new[red_out * width + slot] += value
+                    new[green_out * width + slot] += value
+
+        void = self._void * width
+        new[void:void + width] = self._constant[void:void + width]
+        self._values = new
+        self.tick += 1
+        for probe in self._probes:
+            probe._record()
+
+    def run(self, ticks):
+        """
+        Advances the simulation by a number of ticks.
+        """
+        for _ in range(ticks):
+            self.step()
+
+    def run_until(self, predicate, max_ticks=10000):
+        """
+        Steps until predicate(simulator) is true.
+
+        Returns:
+            int: Ticks taken
+
+        Raises:
+            AssertionError: If the predicate is still false after max_ticks
+        """
+        for ticks in range(max_ticks + 1):
+            if predicate(self):
+                return ticks
+            if ticks < max_ticks:
+                self.step()
+        raise AssertionError(f"Condition not reached within {max_ticks} ticks")
+
+    def _networks_at(self, entity_number, side, colour):
+        entity = self._entities.get(entity_number)
+        if entity is None:
+            raise KeyError(f"No entity {entity_number}")
+        if side not in ('input', 'output'):
+            raise ValueError(f"Unknown side: {side!r}")
+        if entity.get('name') in TWO_SIDED and side == 'output':
+            connectors = (RED_OUTPUT, GREEN_OUTPUT)
+        else:
+            connectors = (RED_INPUT, GREEN_INPUT)
+        if colour == 'red':
+            connectors = connectors[:1]
+        elif colour == 'green':
+            connectors = connectors[1:]
+        elif colour is not None:
+            raise ValueError(f"Unknown wire colour: {colour!r}")
+        nets = (self._net_of.get((entity_number, c)) for c in connectors)
+        return [net for net in nets if net is not None]
+
+    def read(self, entity_number, signal, side='input', colour=None):
+        """
+        Reads one signal where an entity connects to the circuit network.
+
+        Args:
+            entity_number: The entity to look at
+            signal: Name, (name, quality) tuple or signal dict
+            side: 'input' or 'output' (combinators only)
+            colour: 'red', 'green', or None for both added together
+
+        Returns:
+            int: The signal's value this tick
+        """
+        slot = self._signals.slots.get(signal_key(signal))
+        if slot is None:
+            return 0
+        total = sum(int(self._values[net * self.width + slot])
+                    for net in self._networks_at(entity_number, side, colour))
+        return wrap(total)
+
+    def signals(self, entity_number, side='input', colour=None):
+        """
+        Lists every non-zero signal where an entity connects.
+
+        Returns:
+            dict: Signal name (name@quality for other qualities) -> value
+        """
+        totals = {}
+        for net in self._networks_at(entity_number, side, colour):
+            for slot, value in self._row(self._values, net).items():
+                totals[slot] = totals.get(slot, 0) + int(value)
+        keys = self._signals.keys
+        return {_display(keys[slot]): wrap(value)
+                for slot, value in sorted(totals.items()) if wrap(value)}
+
+    def probe(self, entity_number, signals, side='input', colour=None):
+        """
+        Starts recording signals after every tick; see Probe.
+        """
+        probe = Probe(self, entity_number, signals, side, colour)
+        self._probes.append(probe)
+        return probe
+
+    def assert_signal(self, entity_number, signal, expected, side='input', colour=None):
+        """
+        Checks a signal's current value.
+
+        Raises:
+            AssertionError: If the value differs from expected
+        """
+        actual = self.read(entity_number, signal, side, colour)
+        if actual != expected:
+            raise AssertionError(
+                f"tick {self.tick}: entity {entity_number} {side} {signal}: "
+                f"expected {expected}, got {actual}")
+
+
+def _np_wrap(values):
+    return ((values - _INT_MIN) & (_INT_RANGE - 1)) + _INT_MIN
+
+
+def _np_divide(a, b):
+    safe = np.where(b == 0, 1, b)
+    quotient = np.abs(a) // np.abs(safe)
+    quotient = np.where((a < 0) != (safe < 0), -quotient, quotient)
+    return np.where(b == 0, 0, quotient)
+
+
+if np is not None:
+    # int64 arithmetic on int32 operands; results are wrapped afterwards,
+    # and products/powers that overflow int64 still agree modulo 2**32
+    _NP_OPERATIONS = {
+        '*': np.multiply, '/': _np_divide, '+': np.add, '-': np.subtract,
+        '%': lambda a, b: np.where(b == 0, 0, a - b * _np_divide(a, b)),
+        '^': lambda a, b: np.where(b < 0, 0, np.power(a, np.maximum(b, 0))),
+        '<<': lambda a, b: np.left_shift(a, b & 31),
+        '>>': lambda a, b: np.right_shift(a, b & 31),
+        'AND': np.bitwise_and, 'OR': np.bitwise_or, 'XOR': np.bitwise_xor,
+    }
+
+
+def clock_blueprint(count):
+    """
+    Builds a test blueprint of `count` clocks: an arithmetic combinator
+    adding 1 to signal-A in a loop, read by a decider that outputs
+    signal-B = 1 while A > 30. All deciders write onto one shared red
+    network, so it carries B = count once the clocks pass 30.
+    """
+    entities, wires = [], []
+    for i in range(count):
+        clock, decider = 2 * i + 1, 2 * i + 2
+        entities.append({
+            "entity_number": clock, "name": "arithmetic-combinator",
+            "position": {"x": i * 2 + 0.5, "y": 1},
+            "control_behavior": {"arithmetic_conditions": {
+                "first_signal": {"type": "virtual", "name": "signal-A"},
+                "second_constant": 1, "operation": "+",
+                "output_signal": {"type": "virtual", "name": "signal-A"}}},
+        })
+        entities.append({
+            "entity_number": decider, "name": "decider-combinator",
+            "position": {"x": i * 2 + 0.5, "y": 3},
+            "control_behavior": {"decider_conditions": {
+                "conditions": [{"first_signal": {"type": "virtual", "name": "signal-A"},
+                                "constant": 30, "comparator": ">"}],
+                "outputs": [{"signal": {"type": "virtual", "name": "signal-B"},
+                             "copy_count_from_input": False}]}},
+        })
+        wires.append([clock, RED_OUTPUT, clock, RED_INPUT])
+        wires.append([clock, RED_OUTPUT, decider, RED_INPUT])
+        if i:
+            wires.append([decider - 2, RED_OUTPUT, decider, RED_OUTPUT])
+    return {"blueprint": {"entities": entities, "wires": wires,
+                          "item": "blueprint", "version": 562949958205441}}
+
+
+def main():
+    print("Circuit Simulator Benchmark")
+    print("="*60)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    blueprint_data = clock_blueprint(count)
+
+    start = time.perf_counter()
+    sim = CircuitSimulator(blueprint_data)
+    print(f"{2 * count} combinators, {sim.networks} networks, {sim.width} signals, "
+          f"NumPy {'on' if np is not None else 'off'}")
+    print(f"  build: {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    sim.run(ticks)
+    elapsed = time.perf_counter() - start
+    print(f"  {ticks} ticks: {elapsed:.3f}s ({ticks / elapsed:.0f} ticks/s)")
+
+    sim.assert_signal(1, 'signal-A', ticks, side='output')
+    sim.assert_signal(2, 'signal-B', count if ticks - 1 > 30 else 0, side='output')
+    print("Assertions: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for the blueprint codec pipeline.
+decode_blueprint and encode_blueprint accept a CodecProfiler and report
+wall time, bytes in and out and (optionally) peak allocation for each
+stage: base64, inflate/deflate, UTF-8 and JSON. Callbacks receive every
+stage record as it finishes, for feeding a metrics pipeline.
+"""
+
+import json
+import time
+import tracemalloc
+
+
+class StageRecord:
+    """
+    Measurements for one run of one stage.
+    """
+
+    __slots__ = ('stage', 'seconds', 'bytes_in', 'bytes_out', 'peak_bytes')
+
+    def __init__(self, stage, bytes_in=0):
+        self.stage = stage
+        self.seconds = 0.0
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.peak_bytes = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Stage:
+    # Context manager timing one stage run
+
+    def __init__(self, profiler, record):
+        self._profiler = profiler
+        self.record = record
+
+    def __enter__(self):
+        profiler = self._profiler
+        if profiler.trace_memory:
+            self._base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc_info):
+        record = self.record
+        record.seconds = time.perf_counter() - self._start
+        if self._profiler.trace_memory:
+            record.peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - self._base)
+        self._profiler._finish(record)
+        return False
+
+
+class _NullStage:
+    # Shared stand-in used when no profiler is attached
+
+    record = StageRecord('')
+
+    def __enter__(self):
+        return self.record
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(profiler, name, bytes_in=0):
+    """
+    Opens a stage on a profiler, or a no-op stage when profiler is None.
+
+    Usage:
+        with stage(profiler, 'inflate', len(data)) as record:
+            out = zlib.decompress(data)
+            record.bytes_out = len(out)
+    """
+    if profiler is None:
+        return _NULL_STAGE
+    return _Stage(profiler, StageRecord(name, bytes_in))
+
+
+class CodecProfiler:
+    """
+    Collects stage records and totals them per stage.
+
+    Streaming stages run many times (once per chunk); their records add up
+    into one total per stage name, with the largest peak kept.
+    """
+
+    def __init__(self, trace_memory=False, callbacks=()):
+        """
+        Args:
+            trace_memory: Measure peak allocation per stage with tracemalloc
+                (started here if it is not already running)
+            callbacks: Functions called with each StageRecord as it finishes
+        """
+        self.trace_memory = trace_memory
+        self.callbacks = list(callbacks)
+        self.totals = {}  # stage name -> dict of summed measurements
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_callback(self, callback):
+        """
+        Registers a function to receive every StageRecord.
+        """
+        self.callbacks.append(callback)
+
+    def stage(self, name, bytes_in=0):
+        """
+        Opens a stage; see the module-level stage().
+        """
+        return _Stage(self, StageRecord(name, bytes_in))
+
+    def wrap_iter(self, name, iterable, size=len):
+        """
+        Times how long an iterator takes to produce its items, counting
+        size(item) as bytes out.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as record:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                record.bytes_out = size(item)
+            yield item
+
+    def _finish(self, record):
+        total = self.totals.get(record.stage)
+        if total is None:
+            total = self.totals[record.stage] = {
+                'stage': record.stage, 'calls': 0, 'seconds': 0.0,
+                'bytes_in': 0, 'bytes_out': 0, 'peak_bytes': None,
+            }
+        total['calls'] += 1
+        total['seconds'] += record.seconds
+        total['bytes_in'] += record.bytes_in
+        total['bytes_out'] += record.bytes_out
+        if record.peak_bytes is not None:
+            total['peak_bytes'] = max(total['peak_bytes'] or 0, record.peak_bytes)
+        for callback in self.callbacks:
+            callback(record)
+
+    def report(self):
+        """
+        Returns the per-stage totals in the order stages first ran.
+        """
+        return list(self.totals.values())
+
+    def to_json(self):
+        """
+        Serializes the report for a metrics pipeline.
+        """
+        return json.dumps({'stages': self.report()}, indent=2)
+
+    def format_table(self):
+        """
+        Formats the report as a text table.
+        """
+        total_seconds = sum(t['seconds'] for t in self.totals.values()) or 1.0
+        lines = [f"{'Stage':<10} {'Time':>10} {'Share':>7} {'Bytes in':>12} "
+                 f"{'Bytes out':>12} {'Peak alloc':>12}",
+                 "-"*68]
+        for total in self.report():
+            peak = total['peak_bytes']
+            lines.append(
+                f"{total['stage']:<10} {total['seconds'] * 1000:>8.2f}ms "
+                f"{total['seconds'] / total_seconds:>7.1%} {total['bytes_in']:>12} "
+                f"{total['bytes_out']:>12} {'-' if peak is None else peak:>12}")
+        return "\n".join(lines)
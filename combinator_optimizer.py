@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Combinator packing optimizer.
+Shrinks circuit builds without changing what any circuit reader sees:
+combinators whose output nothing reads are dropped, identical deciders on
+the same networks are folded into one, and constant combinators sharing
+the same red and green networks are merged into one with their signals
+summed. The result is checked tick by tick against the original with
+circuit_sim.
+"""
+
+import copy
+import json
+import sys
+import time
+
+from circuit_sim import (CircuitSimulator, DEFAULT_QUALITY, GREEN_INPUT, GREEN_OUTPUT,
+                         RED_INPUT, RED_OUTPUT, iter_circuit_wires, wrap)
+
+
+DEFAULT_VERIFY_TICKS = 120
+MAX_SECTION_FILTERS = 1000  # filters per constant combinator section
+
+COMBINATORS = ('decider-combinator', 'arithmetic-combinator')
+# Entities that carry circuit wires without reading them
+RELAYS = ('small-electric-pole', 'medium-electric-pole', 'big-electric-pole',
+          'substation', 'constant-combinator')
+
+_COMPARATOR_NAMES = {'>=': '≥', '<=': '≤', '!=': '≠'}
+
+
+def _network_map(entities, wires):
+    # (entity, connector) -> network id, for wired circuit connectors
+    parent = {}
+
+    def find(node):
+        root = parent.setdefault(node, node)
+        while root != parent[root]:
+            root = parent[root]
+        while node != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for a, b in iter_circuit_wires(entities, wires):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_a] = root_b
+    return {node: find(node) for node in parent}
+
+
+def _move_wires(wires, old, new):
+    # Re-plugs every wire of entity `old` into the same connector of `new`
+    for wire in wires:
+        for slot in (0, 2):
+            if wire[slot] == old:
+                wire[slot] = new
+
+
+def _remove_entity(wires, number):
+    # Drops an entity's wires, re-joining its neighbours on each connector
+    # in a star so the networks it carried stay connected
+    neighbours = {}
+    kept = []
+    for wire in wires:
+        ends = ((wire[0], wire[1]), (wire[2], wire[3]))
+        if ends[0][0] != number and ends[1][0] != number:
+            kept.append(wire)
+            continue
+        for here, there in (ends, ends[::-1]):
+            if here[0] == number and there[0] != number:
+                neighbours.setdefault(here[1], []).append(there)
+    for connector, ends in neighbours.items():
+        hub = ends[0]
+        for end in ends[1:]:
+            if end != hub:
+                kept.append([hub[0], hub[1], end[0], end[1]])
+    wires[:] = kept
+
+
+def _clean_wires(wires):
+    # Drops self-loops and duplicate wires
+    seen = set()
+    result = []
+    for wire in wires:
+        a, b = (wire[0], wire[1]), (wire[2], wire[3])
+        key = (min(a, b), max(a, b))
+        if a == b or key in seen:
+            continue
+        seen.add(key)
+        result.append(wire)
+    return result
+
+
+def _constant_filters(entity):
+    # Active filters of a 2.0 constant combinator, or None if it cannot be
+    # merged safely (1.x format, logistic groups, toggled-off sections)
+    behavior = entity.get('control_behavior')
+    if behavior is None:
+        return []
+    if 'filters' in behavior:
+        return None
+    filters = []
+    for section in (behavior.get('sections') or {}).get('sections', []):
+        if 'group' in section or section.get('active', True) is False:
+            return None
+        filters.extend(f for f in section.get('filters', []) if 'name' in f)
+    return filters
+
+
+def _is_off(entity):
+    return (entity.get('control_behavior') or {}).get('is_on', True) is False
+
+
+def _decider_key(entity):
+    # Canonical settings of a 2.0 decider whose outputs are all constants,
+    # or None if it cannot be folded
+    behavior = (entity.get('control_behavior') or {}).get('decider_conditions') or {}
+    if 'outputs' not in behavior:
+        return None
+    outputs = []
+    for output in behavior['outputs']:
+        if output.get('copy_count_from_input', True):
+            return None
+        outputs.append({'signal': output.get('signal'),
+                        'networks': output.get('networks') or {}})
+    conditions = []
+    for i, condition in enumerate(behavior.get('conditions', [])):
+        condition = dict(condition)
+        comparator = condition.get('comparator', '<')
+        condition['comparator'] = _COMPARATOR_NAMES.get(comparator, comparator)
+        condition['compare_type'] = 'or' if i == 0 else condition.get('compare_type', 'or')
+        if 'second_signal' not in condition:
+            condition.setdefault('constant', 0)
+        for key in ('first_signal_networks', 'second_signal_networks'):
+            networks = condition.get(key) or {}
+            condition[key] = {'red': networks.get('red', True),
+                              'green': networks.get('green', True)}
+        conditions.append(condition)
+    return json.dumps({'conditions': conditions, 'outputs': outputs}, sort_keys=True)
+
+
+def _find_dead(entities, net_of):
+    # Combinators whose outputs no entity reads, found to a fixpoint
+    readers = {}
+    for (number, connector), net in net_of.items():
+        entity = entities.get(number)
+        if entity is None:
+            continue
+        name = entity.get('name')
+        if name in COMBINATORS:
+            reads = connector in (RED_INPUT, GREEN_INPUT)
+        else:
+            reads = name not in RELAYS
+        if reads:
+            readers.setdefault(net, set()).add(number)
+
+    dead = set()
+    changed = True
+    while changed:
+        changed = False
+        for number, entity in entities.items():
+            if number in dead:
+                continue
+            name = entity.get('name')
+            if name in COMBINATORS:
+                outputs = (RED_OUTPUT, GREEN_OUTPUT)
+            elif name == 'constant-combinator':
+                outputs = (RED_INPUT, GREEN_INPUT)
+            else:
+                continue
+            nets = [net_of.get((number, c)) for c in outputs]
+            read = any(readers.get(net, set()) - dead for net in nets if net is not None)
+            silent = (name == 'constant-combinator'
+                      and (_is_off(entity) or _constant_filters(entity) == []))
+            if not read or silent:
+                dead.add(number)
+                changed = True
+    return dead
+
+
+def _merge_constants(group, entities, wires):
+    # Sums the signals of constant combinators on the same networks into
+    # the first one; returns the numbers that can be removed
+    kept = entities[group[0]]
+    totals = {}
+    for number in group:
+        for entry in _constant_filters(entities[number]):
+            key = (entry.get('type', 'item'), entry['name'],
+                   entry.get('quality') or DEFAULT_QUALITY)
+            if key not in totals:
+                totals[key] = [entry, 0]
+            totals[key][1] += entry.get('count', 0)
+
+    filters = []
+    for entry, count in totals.values():
+        count = wrap(count)
+        if count:
+            filters.append(dict(entry, count=count))
+    sections = []
+    for start in range(0, len(filters), MAX_SECTION_FILTERS):
+        chunk = filters[start:start + MAX_SECTION_FILTERS]
+        sections.append({'index': len(sections) + 1,
+                         'filters': [dict(f, index=i + 1) for i, f in enumerate(chunk)]})
+    kept['control_behavior'] = {'sections': {'sections': sections}}
+
+    for number in group[1:]:
+        _move_wires(wires, number, group[0])
+    return group[1:] if filters else group
+
+
+def _renumber(bp, entities):
+    # Makes entity numbers contiguous again; returns old -> new
+    numbers = {}
+    for i, entity in enumerate(entities):
+        numbers[entity['entity_number']] = i + 1
+        entity['entity_number'] = i + 1
+    for wire in bp.get('wires', []):
+        wire[0] = numbers.get(wire[0], wire[0])
+        wire[2] = numbers.get(wire[2], wire[2])
+    for entity in entities:
+        if 'neighbours' in entity:
+            entity['neighbours'] = [numbers[n] for n in entity['neighbours'] if n in numbers]
+    for schedule in bp.get('schedules', []):
+        schedule['locomotives'] = [numbers[n] for n in schedule.get('locomotives', [])
+                                   if n in numbers]
+    return numbers
+
+
+def _network_signals(simulator, net):
+    # {signal key: value} on a network, or {} for an unwired connector
+    if net is None:
+        return {}
+    keys = simulator._signals.keys
+    return {keys[slot]: value
+            for slot, value in simulator._row(simulator._values, net).items()}
+
+
+def verify(original, optimized, numbers, ticks=DEFAULT_VERIFY_TICKS):
+    """
+    Simulates both blueprints side by side and compares what every kept
+    entity that reads the circuit network sees on its red and green
+    inputs. Relays (poles, constant combinators) read nothing, so what
+    they carry may change, as in _find_dead().
+
+    Args:
+        original, optimized: Decoded blueprint data
+        numbers: Original entity number -> optimized entity number
+        ticks: How long to simulate
+
+    Raises:
+        AssertionError: On the first difference
+    """
+    before = CircuitSimulator(original)
+    after = CircuitSimulator(optimized)
+    # Each pair of matching networks is compared once, not once per entity
+    pairs = {}
+    for old, new in numbers.items():
+        if before._entities[old].get('name') in RELAYS:
+            continue
+        for connector, colour in ((RED_INPUT, 'red'), (GREEN_INPUT, 'green')):
+            pair = (before._net_of.get((old, connector)), after._net_of.get((new, connector)))
+            pairs.setdefault(pair, (old, new, colour))
+    for tick in range(ticks + 1):
+        for (net_before, net_after), (old, new, colour) in pairs.items():
+            expected = _network_signals(before, net_before)
+            actual = _network_signals(after, net_after)
+            if expected != actual:
+                raise AssertionError(
+                    f"tick {tick}: entity {old} (now {new}) {colour} input: "
+                    f"expected {before.signals(old, 'input', colour)}, "
+                    f"got {after.signals(new, 'input', colour)}")
+        before.step()
+        after.step()
+
+
+def optimize(blueprint_data, verify_ticks=DEFAULT_VERIFY_TICKS):
+    """
+    Packs the combinators of a blueprint into fewer entities.
+
+    Only Factorio 2.0 'wires' are rewired; blueprints using 1.x
+    'connections' are rejected. Wire lengths are not checked, so merged
+    combinators may need wires longer than the game allows.
+
+    Args:
+        blueprint_data: Decoded blueprint data (left unchanged)
+        verify_ticks: Ticks to compare old and new circuits for (0 to skip)
+
+    Returns:
+        tuple: (optimized blueprint data, report dict)
+    """
+    data = copy.deepcopy(blueprint_data)
+    bp = data['blueprint']
+    if any('connections' in e for e in bp.get('entities', [])):
+        raise ValueError("Factorio 1.x 'connections' are not supported; "
+                         "re-export the blueprint from Factorio 2.0")
+
+    entities = {e['entity_number']: e for e in bp.get('entities', [])}
+    wires = [list(w) for w in bp.get('wires', [])]
+    net_of = _network_map(entities.values(), wires)
+    report = {'entities_before': len(entities), 'wires_before': len(wires),
+              'dead_removed': 0, 'deciders_folded': 0, 'constants_merged': 0}
+
+    # Combinators nobody reads
+    for number in sorted(_find_dead(entities, net_of)):
+        _remove_entity(wires, number)
+        del entities[number]
+        report['dead_removed'] += 1
+
+    def nets(number, connectors):
+        return tuple(net_of.get((number, c)) for c in connectors)
+
+    # Identical deciders reading and writing the same networks: one copy
+    # with every output constant multiplied
+    groups = {}
+    for number, entity in entities.items():
+        if entity.get('name') == 'decider-combinator':
+            key = _decider_key(entity)
+            if key is not None:
+                io = nets(number, (RED_INPUT, GREEN_INPUT, RED_OUTPUT, GREEN_OUTPUT))
+                groups.setdefault((key, io), []).append(number)
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        outputs = entities[group[0]]['control_behavior']['decider_conditions']['outputs']
+        for output in outputs:
+            output['constant'] = wrap(output.get('constant', 1) * len(group))
+        for number in group[1:]:
+            _move_wires(wires, number, group[0])
+            del entities[number]
+            report['deciders_folded'] += 1
+
+    # Constant combinators on the same pair of networks
+    groups = {}
+    for number, entity in entities.items():
+        if entity.get('name') == 'constant-combinator' and _constant_filters(entity) is not None:
+            groups.setdefault(nets(number, (RED_INPUT, GREEN_INPUT)), []).append(number)
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        for number in _merge_constants(group, entities, wires):
+            if number == group[0]:
+                _remove_entity(wires, number)
+            del entities[number]
+            report['constants_merged'] += 1
+
+    bp['entities'] = list(entities.values())
+    bp['wires'] = _clean_wires(wires)
+    if not bp['wires']:
+        del bp['wires']
+    numbers = _renumber(bp, bp['entities'])
+
+    report['entities_after'] = len(bp['entities'])
+    report['wires_after'] = len(bp.get('wires', []))
+    report['removed'] = report['entities_before'] - report['entities_after']
+    if verify_ticks:
+        verify(blueprint_data, data, numbers, verify_ticks)
+    report['verified_ticks'] = verify_ticks
+    return data, report
+
+
+def redundant_blueprint(count):
+    """
+    Builds a test blueprint with room to pack: one clock read by `count`
+    identical deciders writing onto a bus, `count` constant combinators
+    feeding a lamp, and `count` arithmetic combinators nobody reads.
+    """
+    signal = lambda name: {"type": "virtual", "name": name}
+    entities = [
+        {"entity_number": 1, "name": "arithmetic-combinator", "position": {"x": 0.5, "y": 0},
+         "control_behavior": {"arithmetic_conditions": {
+             "first_signal": signal("signal-A"), "second_constant": 1, "operation": "+",
+             "output_signal": signal("signal-A")}}},
+        {"entity_number": 2, "name": "small-lamp", "position": {"x": 0, "y": 2},
+         "control_behavior": {"circuit_enabled": True, "circuit_condition": {
+             "first_signal": signal("signal-B"), "constant": 0, "comparator": ">"}}},
+        {"entity_number": 3, "name": "small-lamp", "position": {"x": 0, "y": 4},
+         "control_behavior": {"circuit_enabled": True, "circuit_condition": {
+             "first_signal": signal("signal-C"), "constant": 0, "comparator": ">"}}},
+    ]
+    wires = [[1, RED_OUTPUT, 1, RED_INPUT]]
+    for i in range(count):
+        decider, constant, idle = 4 + 3 * i, 5 + 3 * i, 6 + 3 * i
+        entities.append({
+            "entity_number": decider, "name": "decider-combinator",
+            "position": {"x": i + 2.5, "y": 2},
+            "control_behavior": {"decider_conditions": {
+                "conditions": [{"first_signal": signal("signal-A"), "constant": 30,
+                                "comparator": ">"}],
+                "outputs": [{"signal": signal("signal-B"), "copy_count_from_input": False}]}},
+        })
+        entities.append({
+            "entity_number": constant, "name": "constant-combinator",
+            "position": {"x": i + 2.5, "y": 4},
+            "control_behavior": {"sections": {"sections": [{"index": 1, "filters": [
+                {"index": 1, "type": "virtual", "name": "signal-C", "quality": "normal",
+                 "comparator": "=", "count": i + 1},
+                {"index": 2, "type": "virtual", "name": "signal-D", "quality": "normal",
+                 "comparator": "=", "count": 1 if i % 2 else -1}]}]}},
+        })
+        entities.append({
+            "entity_number": idle, "name": "arithmetic-combinator",
+            "position": {"x": i + 2.5, "y": 6},
+            "control_behavior": {"arithmetic_conditions": {
+                "first_signal": signal("signal-A"), "second_constant": 2, "operation": "*",
+                "output_signal": signal("signal-E")}},
+        })
+        wires.append([1, RED_OUTPUT, decider, RED_INPUT])
+        wires.append([1, RED_OUTPUT, idle, RED_INPUT])
+        wires.append([decider - 3 if i else 2, RED_OUTPUT if i else RED_INPUT,
+                      decider, RED_OUTPUT])
+        wires.append([constant - 3 if i else 3, GREEN_INPUT, constant, GREEN_INPUT])
+    return {"blueprint": {"entities": entities, "wires": wires,
+                          "item": "blueprint", "version": 562949958205441}}
+
+
+def main():
+    from blueprint_decoder import decode_blueprint, encode_blueprint
+
+    print("Combinator Packing Optimizer")
+    print("="*60)
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as f:
+            blueprint_data, version_byte = decode_blueprint(f.read().strip())
+    else:
+        print("(no blueprint file given; using a generated test circuit)")
+        blueprint_data, version_byte = redundant_blueprint(200), '0'
+
+    start = time.perf_counter()
+    optimized, report = optimize(blueprint_data)
+    print(f"Entities: {report['entities_before']} -> {report['entities_after']} "
+          f"({report['removed']} removed)")
+    print(f"  dead combinators removed: {report['dead_removed']}")
+    print(f"  duplicate deciders folded: {report['deciders_folded']}")
+    print(f"  constant combinators merged: {report['constants_merged']}")
+    print(f"Wires: {report['wires_before']} -> {report['wires_after']}")
+    print(f"Circuit behaviour verified over {report['verified_ticks']} ticks "
+          f"({time.perf_counter() - start:.3f}s in total)")
+    if len(sys.argv) > 1:
+        print("\nOptimized blueprint string:")
+        print(encode_blueprint(optimized, version_byte))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Columnar, array-backed storage for blueprint entities.
+Positions, directions and entity numbers live in typed arrays, names are
+interned as small integer codes, and everything else (control behavior,
+items, tags, ...) sits in a sparse per-row side store. Plain entity dicts
+are only rebuilt when a row is accessed or the blueprint is encoded.
+"""
+
+import sys
+import time
+import tracemalloc
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Marks a missing entity_number or direction in the integer columns
+MISSING = -1
+
+# Keys held in columns; everything else goes to the side store
+_COLUMN_KEYS = ('entity_number', 'name', 'position', 'direction')
+
+
+class EntityTable:
+    """
+    Array-backed view of a blueprint's entity list.
+
+    Iterating, indexing and to_json() hand out freshly built dicts, but
+    nested values from the side store (control_behavior, items, tags, ...)
+    are the table's own objects, not copies: replacing a key of a handed-out
+    dict leaves the table alone, while editing a nested value in place
+    changes the table too. To change the table, use append() and
+    set_position(), or write to the columns (entity_number, x, y, direction)
+    and to self.extras directly.
+    """
+
+    def __init__(self):
+        self.entity_number = array('q')
+        self.x = array('d')
+        self.y = array('d')
+        self.direction = array('b')
+        self.name_codes = array('I')
+        self.names = []          # name for each code
+        self._codes = {}         # code for each name
+        self.extras = {}         # row -> dict of the remaining fields
+
+    @classmethod
+    def from_entities(cls, entities):
+        """
+        Builds a table from a list of entity dicts.
+        """
+        table = cls()
+        for entity in entities:
+            table.append(entity)
+        return table
+
+    def name_code(self, name):
+        """
+        Returns the interned code for an entity name, adding it if new.
+        """
+        code = self._codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self._codes[name] = code
+            self.names.append(name)
+        return code
+
+    def append(self, entity):
+        """
+        Adds an entity dict as a new row.
+
+        Returns:
+            int: The row index
+        """
+        row = len(self.name_codes)
+        extra = {k: v for k, v in entity.items() if k not in _COLUMN_KEYS}
+
+        number = entity.get('entity_number')
+        if type(number) is not int or number < 0:
+            if 'entity_number' in entity:
+                extra['entity_number'] = number
+            number = MISSING
+        self.entity_number.append(number)
+
+        position = entity.get('position')
+        if (isinstance(position, dict) and len(position) == 2
+                and type(position.get('x')) in (int, float)
+                and type(position.get('y')) in (int, float)):
+            self.x.append(position['x'])
+            self.y.append(position['y'])
+        else:
+            if position is not None:
+                extra['position'] = position
+            self.x.append(float('nan'))
+            self.y.append(float('nan'))
+
+        direction = entity.get('direction')
+        if type(direction) is not int or not 0 <= direction < 128:
+            if 'direction' in entity:
+                extra['direction'] = direction
+            direction = MISSING
+        self.direction.append(direction)
+
+        # A missing name is interned as None
+        self.name_codes.append(self.name_code(entity.get('name')))
+
+        if extra:
+            self.extras[row] = extra
+        return row
+
+    def __len__(self):
+        return len(self.name_codes)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("entity row out of range")
+
+        entity = {}
+        if self.entity_number[row] != MISSING:
+            entity['entity_number'] = self.entity_number[row]
+        name = self.names[self.name_codes[row]]
+        if name is not None:
+            entity['name'] = name
+        x = self.x[row]
+        if x == x:  # not NaN
+            y = self.y[row]
+            entity['position'] = {
+                'x': int(x) if x.is_integer() else x,
+                'y': int(y) if y.is_integer() else y,
+            }
+        if self.direction[row] != MISSING:
+            entity['direction'] = self.direction[row]
+        extra = self.extras.get(row)
+        if extra:
+            entity.update(extra)
+        return entity
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def to_json(self):
+        """
+        Returns the rows as an iterator of plain entity dicts, which the
+        blueprint encoder serializes one at a time.
+        """
+        return iter(self)
+
+    def to_entities(self):
+        """
+        Materializes the whole table as a list of entity dicts.
+        """
+        return list(self)
+
+    def name_counts(self):
+        """
+        Counts entities per name without building any entity dicts.
+
+        Returns:
+            dict: name -> count
+        """
+        result = {}
+        for code, count in Counter(self.name_codes).items():
+            name = self.names[code]
+            result['unknown' if name is None else name] = count
+        return result
+
+    def set_position(self, row, x, y):
+        """
+        Moves one entity.
+        """
+        self.x[row] = x
+        self.y[row] = y
+
+    def columns(self):
+        """
+        Returns the numeric columns, as zero-copy NumPy arrays when NumPy is
+        installed and as the underlying array.array objects otherwise.
+        """
+        columns = {
+            'entity_number': self.entity_number,
+            'x': self.x,
+            'y': self.y,
+            'direction': self.direction,
+            'name_code': self.name_codes,
+        }
+        if np is not None:
+            columns = {key: np.frombuffer(column, dtype=column.typecode)
+                       for key, column in columns.items()}
+        return columns
+
+
+def attach_entity_tables(blueprint_data):
+    """
+    Swaps every 'entities' list in a blueprint or (nested) book for an
+    EntityTable, in place.
+
+    Args:
+        blueprint_data: The decoded blueprint data
+
+    Returns:
+        dict: The same blueprint data
+    """
+    if 'blueprint' in blueprint_data:
+        bp = blueprint_data['blueprint']
+        if isinstance(bp.get('entities'), list):
+            bp['entities'] = EntityTable.from_entities(bp['entities'])
+    elif 'blueprint_book' in blueprint_data:
+        for child in blueprint_data['blueprint_book'].get('blueprints', []):
+            attach_entity_tables(child)
+    return blueprint_data
+
+
+def sample_entities(count):
+    """
+    Builds `count` synthetic entity dicts (belts, inserters and decider
+    combinators on a 300-wide grid) for benchmarks.
+
+    Returns:
+        list: Entity dicts
+    """
+    entities = []
+    for i in range(count):
+        entity = {
+            "entity_number": i + 1,
+            "name": ("transport-belt", "inserter", "decider-combinator")[i % 3],
+            "position": {"x": i % 300 + 0.5, "y": i // 300 + 0.5},
+            "direction": (i % 4) * 4,
+        }
+        if i % 3 == 2:
+            entity["control_behavior"] = {
+                "decider_conditions": {
+                    "first_signal": {"type": "virtual", "name": "signal-A"},
+                    "constant": 0,
+                    "comparator": ">",
+                }
+            }
+        entities.append(entity)
+    return entities
+
+
+def main():
+    from blueprint_decoder import decode_blueprint, encode_blueprint
+
+    print("EntityTable Benchmark")
+    print("="*60)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    blueprint_string = encode_blueprint({"blueprint": {"entities": sample_entities(count)}})
+
+    tracemalloc.start()
+    blueprint_data, _ = decode_blueprint(blueprint_string)
+    dict_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    entities = blueprint_data['blueprint']['entities']
+
+    table = EntityTable.from_entities(entities)
+    del blueprint_data
+
+    tracemalloc.start()
+    blueprint_data, _ = decode_blueprint(blueprint_string)
+    attach_entity_tables(blueprint_data)
+    table_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{count} entities")
+    print(f"  dict form memory:   {dict_size / count:8.1f} bytes/entity")
+    print(f"  table form memory:  {table_size / count:8.1f} bytes/entity")
+
+    start = time.perf_counter()
+    counts = {}
+    for entity in entities:
+        name = entity.get('name', 'unknown')
+        counts[name] = counts.get(name, 0) + 1
+    dict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table_counts = table.name_counts()
+    table_time = time.perf_counter() - start
+    assert table_counts == counts
+
+    start = time.perf_counter()
+    total = sum(table.x)
+    column_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert sum(entity['position']['x'] for entity in entities) == total
+    dict_sum_time = time.perf_counter() - start
+
+    print(f"  count names, dicts:  {dict_time * 1000:8.2f} ms")
+    print(f"  count names, table:  {table_time * 1000:8.2f} ms")
+    print(f"  sum x, dicts:        {dict_sum_time * 1000:8.2f} ms")
+    print(f"  sum x, column:       {column_time * 1000:8.2f} ms")
+
+    assert table.to_entities() == entities
+    assert decode_blueprint(encode_blueprint(blueprint_data))[0]['blueprint']['entities'] == entities
+    print("Round trip through encode_blueprint: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+pigz-style parallel zlib compression for very large blueprint strings.
+The JSON text is cut into blocks that are deflated on a thread pool (zlib
+releases the GIL while compressing). Each block ends on a sync-flush
+boundary and is primed with the tail of the block before it, so the raw
+deflate pieces concatenate into one ordinary zlib stream that
+decode_blueprint and Factorio both accept.
+"""
+
+import os
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_BLOCK_SIZE = 128 * 1024
+
+# Deflate can look back this far, so each block is primed with this much of
+# the block before it
+_WINDOW_SIZE = 32 * 1024
+
+_ADLER_BASE = 65521
+
+
+def adler32_combine(adler1, adler2, len2):
+    """
+    Combines the Adler-32 checksums of two consecutive pieces of data.
+
+    Args:
+        adler1: Checksum of the first piece
+        adler2: Checksum of the second piece
+        len2: Length of the second piece in bytes
+
+    Returns:
+        int: Checksum of the two pieces joined together
+    """
+    rem = len2 % _ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % _ADLER_BASE
+    sum1 = (sum1 + (adler2 & 0xffff) + _ADLER_BASE - 1) % _ADLER_BASE
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + _ADLER_BASE - rem) % _ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def zlib_header(level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Builds the two-byte zlib header zlib.compress would write for a level.
+    """
+    if level < 0:
+        level = 6
+    if level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    elif level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+    cmf = 0x78  # deflate with a 32 KiB window
+    flg = flevel << 6
+    flg |= 31 - (cmf * 256 + flg) % 31
+    return bytes((cmf, flg))
+
+
+def _deflate_block(data, dictionary, level, strategy):
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, strategy,
+                                      zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, strategy)
+    # A sync flush ends the block on a byte boundary without marking it
+    # final, so the next block's output can follow it directly
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return compressed, zlib.adler32(data), len(data)
+
+
+def _iter_blocks(chunks, block_size):
+    pending = bytearray()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        pending.extend(chunk)
+        while len(pending) >= block_size:
+            yield bytes(pending[:block_size])
+            del pending[:block_size]
+    if pending:
+        yield bytes(pending)
+
+
+def iter_parallel_deflate(chunks, level=zlib.Z_DEFAULT_COMPRESSION,
+                          strategy=zlib.Z_DEFAULT_STRATEGY, workers=None,
+                          block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Compresses data into a single zlib stream using several threads.
+
+    Blocks are submitted as the input arrives and only a few per worker are
+    in flight at once, so memory stays bounded for streaming input.
+
+    Args:
+        chunks: Iterable of str (encoded as UTF-8) or bytes
+        level: zlib compression level, 0-9 or -1 for zlib's default
+        strategy: zlib strategy, e.g. zlib.Z_FILTERED or zlib.Z_RLE
+        workers: Number of compression threads (default: CPU count)
+        block_size: Uncompressed bytes per block
+
+    Yields:
+        bytes: Consecutive pieces of the zlib stream
+    """
+    workers = workers or os.cpu_count() or 1
+    checksum = 1  # Adler-32 of no data
+    previous_tail = b''
+    in_flight = deque()
+
+    yield zlib_header(level)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for block in _iter_blocks(chunks, block_size):
+            in_flight.append(pool.submit(_deflate_block, block, previous_tail,
+                                         level, strategy))
+            previous_tail = block[-_WINDOW_SIZE:]
+
+            while len(in_flight) > workers * 2:
+                compressed, adler, length = in_flight.popleft().result()
+                checksum = adler32_combine(checksum, adler, length)
+                yield compressed
+
+        while in_flight:
+            compressed, adler, length = in_flight.popleft().result()
+            checksum = adler32_combine(checksum, adler, length)
+            yield compressed
+
+    # An empty final block closes the deflate stream, then the checksum
+    final = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    yield final.flush(zlib.Z_FINISH)
+    yield checksum.to_bytes(4, 'big')
+
+
+def parallel_compress(data, level=zlib.Z_DEFAULT_COMPRESSION,
+                      strategy=zlib.Z_DEFAULT_STRATEGY, workers=None,
+                      block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Drop-in parallel replacement for zlib.compress(data, level).
+    """
+    return b''.join(iter_parallel_deflate([data], level, strategy, workers,
+                                          block_size))
+
+
+def main():
+    # Imported here since blueprint_stream itself imports this module
+    from blueprint_decoder import decode_blueprint
+    from blueprint_stream import encode_blueprint_stream, iter_json_pieces
+
+    print("Parallel Deflate Benchmark")
+    print("="*60)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    blueprint_data = {
+        "blueprint": {
+            "entities": [
+                {
+                    "entity_number": i + 1,
+                    "name": "decider-combinator" if i % 3 else "transport-belt",
+                    "position": {"x": i % 300 + 0.5, "y": i // 300 + 0.5},
+                    "direction": (i % 4) * 4,
+                }
+                for i in range(count)
+            ],
+            "item": "blueprint",
+            "version": 562949958205441,
+        }
+    }
+
+    json_bytes = ''.join(iter_json_pieces(blueprint_data)).encode('utf-8')
+
+    start = time.perf_counter()
+    reference = zlib.compress(json_bytes)
+    baseline = time.perf_counter() - start
+    print(f"{count} entities, {len(json_bytes)} bytes of JSON")
+    print(f"  zlib.compress:  {baseline:.3f}s  ({len(reference)} bytes)")
+
+    cpus = os.cpu_count() or 1
+    counts = sorted({1, cpus} | {n for n in (2, 4, 8, 16) if n <= cpus})
+    for workers in counts:
+        start = time.perf_counter()
+        compressed = parallel_compress(json_bytes, workers=workers)
+        elapsed = time.perf_counter() - start
+        assert zlib.decompress(compressed) == json_bytes
+        print(f"  {workers:3d} workers:    {elapsed:.3f}s  "
+              f"({baseline / elapsed:.2f}x, {len(compressed)} bytes)")
+
+    # End to end through the blueprint string pipeline
+    encoded = encode_blueprint_stream(blueprint_data, workers=max(counts))
+    assert decode_blueprint(encoded)[0] == blueprint_data
+    print("Round trip through decode_blueprint: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Uniform-grid spatial index over blueprint entities.
+Answers "what is at (x, y)", rectangle, nearest-neighbour and collision
+queries from a hash of grid cells instead of scanning bp['entities'], and
+stays current as entities are added, moved or removed.
+"""
+
+import math
+
+
+DEFAULT_CELL_SIZE = 4
+
+# Footprint (width, height) in tiles when facing north; anything not listed
+# is treated as 1x1
+ENTITY_SIZES = {
+    'decider-combinator': (1, 2),
+    'arithmetic-combinator': (1, 2),
+    'selector-combinator': (1, 2),
+    'pump': (1, 2),
+    'splitter': (2, 1),
+    'fast-splitter': (2, 1),
+    'express-splitter': (2, 1),
+    'turbo-splitter': (2, 1),
+    'stone-furnace': (2, 2),
+    'steel-furnace': (2, 2),
+    'big-electric-pole': (2, 2),
+    'substation': (2, 2),
+    'accumulator': (2, 2),
+    'boiler': (3, 2),
+    'heat-exchanger': (3, 2),
+    'assembling-machine-1': (3, 3),
+    'assembling-machine-2': (3, 3),
+    'assembling-machine-3': (3, 3),
+    'electric-furnace': (3, 3),
+    'chemical-plant': (3, 3),
+    'centrifuge': (3, 3),
+    'beacon': (3, 3),
+    'lab': (3, 3),
+    'radar': (3, 3),
+    'solar-panel': (3, 3),
+    'storage-tank': (3, 3),
+    'electric-mining-drill': (3, 3),
+    'pumpjack': (3, 3),
+    'roboport': (4, 4),
+    'oil-refinery': (5, 5),
+    'nuclear-reactor': (5, 5),
+    'steam-engine': (3, 5),
+    'steam-turbine': (3, 5),
+    'rocket-silo': (9, 9),
+}
+
+# Directions in a full turn: 16 from Factorio 2.0 on, 8 in 1.x blueprints
+DIRECTIONS = 16
+LEGACY_DIRECTIONS = 8
+
+# Blueprint version of Factorio 2.0.0 (major version in the top 16 bits)
+_VERSION_2_0 = 2 << 48
+
+
+def direction_count(version):
+    """
+    Tells which direction scheme a blueprint uses.
+
+    Args:
+        version: The blueprint's 'version' number, or None if it has none
+            (taken as 2.0)
+
+    Returns:
+        int: DIRECTIONS (16) for Factorio 2.0, LEGACY_DIRECTIONS (8) for 1.x
+    """
+    if isinstance(version, int) and version < _VERSION_2_0:
+        return LEGACY_DIRECTIONS
+    return DIRECTIONS
+
+
+def is_sideways(direction, directions=DIRECTIONS):
+    """
+    Tells whether a direction turns an entity on its side (east or west).
+    """
+    return direction == directions // 4 or direction == directions * 3 // 4
+
+
+def footprint(name, x, y, direction=0, sizes=ENTITY_SIZES, directions=DIRECTIONS):
+    """
+    Computes the box an entity covers.
+
+    Args:
+        name: Entity name
+        x, y: Entity centre
+        direction: Direction (0 north, then clockwise: 4 east, 8 south and
+            12 west with 16 directions; 2, 4 and 6 with 8)
+        sizes: Name -> (width, height) table
+        directions: Directions in a full turn, see direction_count()
+
+    Returns:
+        tuple: (left, top, right, bottom)
+    """
+    width, height = sizes.get(name, (1, 1))
+    if is_sideways(direction, directions):
+        width, height = height, width
+    return (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+
+
+def _entity_box(entity, sizes, directions):
+    position = entity['position']
+    return footprint(entity.get('name'), position['x'], position['y'],
+                     entity.get('direction', 0), sizes, directions)
+
+
+def _boxes_overlap(a, b):
+    # Boxes that only share an edge do not collide
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class SpatialIndex:
+    """
+    Grid of cells, each holding the entities whose footprint touches it.
+
+    Entities are the blueprint's own dicts; the index remembers them by
+    identity, so move() and remove() take the same dict that was added.
+    Directions are read with `directions` per turn (16, or 8 for 1.x).
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, sizes=ENTITY_SIZES,
+                 directions=DIRECTIONS):
+        self.cell_size = cell_size
+        self.sizes = sizes
+        self.directions = directions
+        self._cells = {}     # (cx, cy) -> {id(entity): entity}
+        self._boxes = {}     # id(entity) -> footprint box
+        self._extent = None  # [min cx, min cy, max cx, max cy] ever used
+
+    @classmethod
+    def from_blueprint(cls, blueprint_data, cell_size=DEFAULT_CELL_SIZE,
+                       sizes=ENTITY_SIZES):
+        """
+        Indexes every entity of a decoded blueprint in one pass.
+
+        Args:
+            blueprint_data: Decoded blueprint data, or a list of entities
+            cell_size: Grid cell size in tiles
+            sizes: Name -> (width, height) table
+
+        Returns:
+            SpatialIndex: The filled index, using the blueprint's direction
+                scheme (16 directions for a plain entity list)
+        """
+        directions = DIRECTIONS
+        if isinstance(blueprint_data, dict):
+            bp = blueprint_data['blueprint']
+            entities = bp.get('entities', [])
+            directions = direction_count(bp.get('version'))
+        else:
+            entities = blueprint_data
+        index = cls(cell_size, sizes, directions)
+        for entity in entities:
+            index.add(entity)
+        return index
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _cell_range(self, box):
+        size = self.cell_size
+        return (math.floor(box[0] / size), math.floor(box[1] / size),
+                math.ceil(box[2] / size) - 1, math.ceil(box[3] / size) - 1)
+
+    def _insert(self, entity, box):
+        key = id(entity)
+        self._boxes[key] = box
+        x0, y0, x1, y1 = self._cell_range(box)
+        for cx in range(x0, max(x0, x1) + 1):
+            for cy in range(y0, max(y0, y1) + 1):
+                self._cells.setdefault((cx, cy), {})[key] = entity
+
+        extent = self._extent
+        if extent is None:
+            self._extent = [x0, y0, max(x0, x1), max(y0, y1)]
+        else:
+            extent[0] = min(extent[0], x0)
+            extent[1] = min(extent[1], y0)
+            extent[2] = max(extent[2], x1)
+            extent[3] = max(extent[3], y1)
+
+    def _delete(self, entity):
+        key = id(entity)
+        box = self._boxes.pop(key)
+        x0, y0, x1, y1 = self._cell_range(box)
+        for cx in range(x0, max(x0, x1) + 1):
+            for cy in range(y0, max(y0, y1) + 1):
+                cell = self._cells[(cx, cy)]
+                del cell[key]
+                if not cell:
+                    del self._cells[(cx, cy)]
+
+    def add(self, entity):
+        """
+        Adds an entity dict (it needs a 'position').
+        """
+        if id(entity) in self._boxes:
+            raise ValueError("Entity is already indexed")
+        self._insert(entity, _entity_box(entity, self.sizes, self.directions))
+
+    def remove(self, entity):
+        """
+        Removes a previously added entity dict.
+        """
+        self._delete(entity)
+
+    def move(self, entity, x, y, direction=None):
+        """
+        Moves (and optionally turns) an indexed entity, updating its dict.
+        """
+        self._delete(entity)
+        entity['position'] = {'x': x, 'y': y}
+        if direction is not None:
+            entity['direction'] = direction
+        self._insert(entity, _entity_box(entity, self.sizes, self.directions))
+
+    def _candidates(self, box):
+        x0, y0, x1, y1 = self._cell_range(box)
+        found = {}
+        cells = self._cells
+        for cx in range(x0, max(x0, x1) + 1):
+            for cy in range(y0, max(y0, y1) + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    found.update(cell)
+        return found
+
+    def at(self, x, y):
+        """
+        Lists the entities whose footprint contains the point (x, y).
+        """
+        cell = self._cells.get((math.floor(x / self.cell_size),
+                                math.floor(y / self.cell_size)), {})
+        boxes = self._boxes
+        return [entity for key, entity in cell.items()
+                if boxes[key][0] <= x < boxes[key][2]
+                and boxes[key][1] <= y < boxes[key][3]]
+
+    def query(self, left, top, right, bottom):
+        """
+        Lists the entities whose footprint overlaps a rectangle.
+        """
+        box = (left, top, right, bottom)
+        boxes = self._boxes
+        return [entity for key, entity in self._candidates(box).items()
+                if _boxes_overlap(boxes[key], box)]
+
+    def collisions_at(self, name, x, y, direction=0):
+        """
+        Lists the entities an entity placed at (x, y) would collide with.
+        """
+        return self.query(*footprint(name, x, y, direction, self.sizes, self.directions))
+
+    def can_place(self, name, x, y, direction=0):
+        """
+        Tells whether an entity fits at (x, y) without overlapping another.
+        """
+        return not self.collisions_at(name, x, y, direction)
+
+    def overlaps(self):
+        """
+        Finds every pair of indexed entities whose footprints overlap.
+
+        Returns:
+            list: (entity, entity) pairs, each pair listed once
+        """
+        pairs = []
+        seen = set()
+        boxes = self._boxes
+        for cell in self._cells.values():
+            if len(cell) < 2:
+                continue
+            items = list(cell.items())
+            for i, (key_a, entity_a) in enumerate(items):
+                for key_b, entity_b in items[i + 1:]:
+                    pair = (key_a, key_b) if key_a < key_b else (key_b, key_a)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    if _boxes_overlap(boxes[key_a], boxes[key_b]):
+                        pairs.append((entity_a, entity_b))
+        return pairs
+
+    def nearest(self, x, y, max_distance=None):
+        """
+        Finds the entity whose centre is closest to (x, y).
+
+        Args:
+            x, y: Query point
+            max_distance: Ignore entities further away than this
+
+        Returns:
+            dict: The nearest entity, or None if there is none in range
+        """
+        if not self._boxes:
+            return None
+
+        size = self.cell_size
+        qx, qy = math.floor(x / size), math.floor(y / size)
+        ex0, ey0, ex1, ey1 = self._extent
+        max_ring = max(qx - ex0, ex1 - qx, qy - ey0, ey1 - qy, 0)
+        if max_distance is not None:
+            max_ring = min(max_ring, math.ceil(max_distance / size) + 1)
+
+        best = None
+        best_distance = math.inf if max_distance is None else max_distance
+        boxes = self._boxes
+        seen = set()
+
+        for ring in range(max_ring + 1):
+            # Everything beyond this ring is at least ring * size away
+            if best is not None and best_distance <= ring * size - size:
+                break
+            for cx in range(qx - ring, qx + ring + 1):
+                on_edge = cx in (qx - ring, qx + ring)
+                for cy in ((range(qy - ring, qy + ring + 1)) if on_edge
+                           else (qy - ring, qy + ring)):
+                    cell = self._cells.get((cx, cy))
+                    if not cell:
+                        continue
+                    for key, entity in cell.items():
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        box = boxes[key]
+                        distance = math.hypot((box[0] + box[2]) / 2 - x,
+                                              (box[1] + box[3]) / 2 - y)
+                        if distance < best_distance or (
+                                best is None and distance == best_distance):
+                            best = entity
+                            best_distance = distance
+        return best
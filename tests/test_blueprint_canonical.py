@@ -0,0 +1,75 @@
+import copy
+import random
+
+import pytest
+
+from blueprint_benchmark import synthetic_blueprint
+from blueprint_canonical import _shuffled, canonical_digest, canonicalize
+
+
+def legacy_pair():
+    # Two 1.x combinators wired red from 1's input to 2's input
+    return {"blueprint": {"entities": [
+        {"entity_number": 1, "name": "decider-combinator", "position": {"x": 0.5, "y": 1},
+         "connections": {"1": {"red": [{"entity_id": 2}]}}},
+        {"entity_number": 2, "name": "decider-combinator", "position": {"x": 2.5, "y": 1},
+         "connections": {"1": {"red": [{"entity_id": 1}]}}},
+    ]}}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_shuffled_renumbered_copy_digests_the_same(seed):
+    data = synthetic_blueprint(300, tiles=50, wired_deciders=30, seed=seed)
+    assert canonical_digest(_shuffled(data, seed)) == canonical_digest(data)
+
+
+def test_key_order_floats_and_defaults_do_not_matter():
+    data = synthetic_blueprint(100, tiles=40, wired_deciders=10, seed=7)
+    other = copy.deepcopy(data)
+    bp = other['blueprint']
+    bp['tiles'].reverse()
+    random.Random(0).shuffle(bp['wires'])
+    for entity in bp['entities']:
+        entity.setdefault('direction', 0)
+        entity.setdefault('quality', 'normal')
+        entity['position'] = {'y': float(entity['position']['y']),
+                              'x': float(entity['position']['x'])}
+    other['blueprint'] = dict(reversed(list(bp.items())))
+    assert canonical_digest(other) == canonical_digest(data)
+
+
+def test_legacy_default_circuit_id_does_not_matter():
+    data = legacy_pair()
+    explicit = copy.deepcopy(data)
+    explicit['blueprint']['entities'][0]['connections']['1']['red'][0]['circuit_id'] = 1
+    assert canonical_digest(explicit) == canonical_digest(data)
+    explicit['blueprint']['entities'][0]['connections']['1']['red'][0]['circuit_id'] = 2
+    assert canonical_digest(explicit) != canonical_digest(data)
+
+
+def test_real_changes_change_the_digest():
+    data = synthetic_blueprint(100, wired_deciders=10, seed=2)
+    digest = canonical_digest(data)
+    for change in (lambda bp: bp['entities'][0].update(direction=4),
+                   lambda bp: bp['entities'][0]['position'].update(x=999.5),
+                   lambda bp: bp['wires'].pop(),
+                   lambda bp: bp.update(label='other')):
+        other = copy.deepcopy(data)
+        change(other['blueprint'])
+        assert canonical_digest(other) != digest
+
+
+def test_book_children_in_index_order():
+    children = [dict(synthetic_blueprint(20, seed=i), index=i) for i in range(3)]
+    book = {'blueprint_book': {'blueprints': children}}
+    reordered = {'blueprint_book': {'blueprints': children[::-1]}}
+    assert canonical_digest(reordered) == canonical_digest(book)
+
+
+def test_canonicalize_is_a_fixed_point():
+    data = _shuffled(synthetic_blueprint(100, wired_deciders=10, seed=4))
+    canonical = canonicalize(data)
+    assert canonicalize(canonical) == canonical
+    assert canonical_digest(canonical) == canonical_digest(data)
+    numbers = [e['entity_number'] for e in canonical['blueprint']['entities']]
+    assert numbers == list(range(1, len(numbers) + 1))
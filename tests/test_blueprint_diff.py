@@ -0,0 +1,96 @@
+import copy
+import random
+
+import pytest
+
+from blueprint_benchmark import synthetic_blueprint
+from blueprint_canonical import canonical_digest
+from blueprint_diff import apply_patch, diff, summarize_patch
+
+
+def renumber(bp, rng):
+    entities = bp['entities']
+    rng.shuffle(entities)
+    numbers = {e['entity_number']: n for n, e in enumerate(entities, 1)}
+    for entity in entities:
+        entity['entity_number'] = numbers[entity['entity_number']]
+    for wire in bp.get('wires', []):
+        wire[0], wire[2] = numbers[wire[0]], numbers[wire[2]]
+
+
+def edit(bp, rng):
+    # A handful of random edits of every kind diff() knows about
+    entities = bp['entities']
+    for _ in range(rng.randint(0, 3)):
+        gone = entities.pop(rng.randrange(len(entities)))['entity_number']
+        bp['wires'] = [w for w in bp.get('wires', []) if gone not in (w[0], w[2])]
+    for entity in rng.sample(entities, rng.randint(0, 3)):
+        entity['position'] = {'x': entity['position']['x'] + 1000,
+                              'y': entity['position']['y'] - 1000}
+    for entity in rng.sample(entities, rng.randint(0, 3)):
+        entity['direction'] = (entity.get('direction', 0) + 4) % 16
+    number = max(e['entity_number'] for e in entities)
+    for i in range(rng.randint(0, 3)):
+        number += 1
+        entities.append({'entity_number': number, 'name': 'small-lamp',
+                         'position': {'x': -500.5 - i, 'y': 0.5}})
+    if rng.random() < 0.5 and len(entities) > 1:
+        a, b = rng.sample(entities, 2)
+        bp.setdefault('wires', []).append([a['entity_number'], 1, b['entity_number'], 2])
+    if rng.random() < 0.3:
+        bp['label'] = 'edited'
+    if rng.random() < 0.5:
+        renumber(bp, rng)
+
+
+def assert_round_trip(old, new):
+    patch = diff(old, new)
+    patched = apply_patch(copy.deepcopy(old), copy.deepcopy(patch))
+    assert diff(patched, new) == {}
+    assert canonical_digest(patched) == canonical_digest(new)
+    return patch
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_blueprint_round_trip(seed):
+    rng = random.Random(seed)
+    old = synthetic_blueprint(60, tiles=20, wired_deciders=10, seed=seed)
+    new = copy.deepcopy(old)
+    edit(new['blueprint'], rng)
+    assert_round_trip(old, new)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_book_round_trip(seed):
+    rng = random.Random(seed)
+    children = [dict(synthetic_blueprint(30, wired_deciders=5, seed=seed * 10 + i), index=i)
+                for i in range(4)]
+    old = {'blueprint_book': {'blueprints': children, 'item': 'blueprint-book'}}
+    new = copy.deepcopy(old)
+    for child in new['blueprint_book']['blueprints']:
+        if rng.random() < 0.7:
+            edit(child['blueprint'], rng)
+    if rng.random() < 0.5:
+        new['blueprint_book']['blueprints'].reverse()
+    patch = assert_round_trip(old, new)
+    assert 'children.add' not in summarize_patch(patch)
+
+
+def test_renumbered_copy_has_empty_patch():
+    old = synthetic_blueprint(50, wired_deciders=8, seed=3)
+    new = copy.deepcopy(old)
+    renumber(new['blueprint'], random.Random(1))
+    assert diff(old, new) == {}
+    book = lambda data: {'blueprint_book': {'blueprints': [dict(data, index=0)]}}
+    assert diff(book(old), book(new)) == {}
+
+
+def test_relabelled_child_is_diffed_not_re_added():
+    old_child = synthetic_blueprint(30, seed=5)
+    new_child = copy.deepcopy(old_child)
+    new_child['blueprint']['label'] = 'renamed'
+    patch = diff({'blueprint_book': {'blueprints': [dict(old_child, index=0)]}},
+                 {'blueprint_book': {'blueprints': [dict(new_child, index=0)]}})
+    (entry,) = patch['blueprint_book']['children']
+    assert entry['from'] == 0
+    assert entry['patch'] == {'blueprint': {'fields': {'set': {'label': 'renamed'}}}}
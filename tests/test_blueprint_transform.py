@@ -0,0 +1,69 @@
+import copy
+import random
+
+import pytest
+
+from blueprint_transform import Transform, _transform_tiles, apply_transform, rotate
+from tile_layer import TileLayer
+
+
+TRANSFORMS = [
+    Transform().rotate(),
+    Transform().rotate(3).translate(7, -2),
+    Transform().mirror('x').translate(0.5, 3.25),
+    Transform().mirror('y').rotate(),
+    Transform().rotate(2).mirror('x').translate(-11, 4),
+]
+
+
+def random_tiles(rng, count):
+    names = ['landfill', 'concrete', 'space-platform-foundation']
+    placed = {(rng.randint(-40, 40), rng.randint(-20, 20)) for _ in range(count)}
+    tiles = [{'name': rng.choice(names), 'position': {'x': x, 'y': y}} for x, y in placed]
+    # Tiles the bitmaps cannot hold stay dicts
+    tiles.append({'name': 'landfill', 'position': {'x': 0.5, 'y': 2}})
+    tiles.append({'name': 'concrete', 'position': {'x': 100, 'y': 100}, 'tag': 1})
+    return tiles
+
+
+def tile_set(tiles):
+    return sorted((t['name'], t['position']['x'], t['position']['y'], t.get('tag'))
+                  for t in tiles)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('transform', TRANSFORMS)
+def test_tile_layer_moves_like_tile_dicts(seed, transform):
+    tiles = random_tiles(random.Random(seed), 300)
+    expected = copy.deepcopy(tiles)
+    _transform_tiles(expected, transform)
+
+    bp = {'blueprint': {'tiles': TileLayer.from_tiles(tiles)}}
+    apply_transform(bp, transform)
+    layer = bp['blueprint']['tiles']
+    assert isinstance(layer, TileLayer)
+    assert tile_set(layer) == tile_set(expected)
+
+
+def test_legacy_blueprint_turns_in_eight_directions():
+    # Factorio 1.1: east is 2, south 4, west 6
+    bp = {'blueprint': {'version': 281479275675648, 'entities': [
+        {'entity_number': 1, 'name': 'inserter', 'position': {'x': 0.5, 'y': 0.5}},
+        {'entity_number': 2, 'name': 'inserter', 'position': {'x': 1.5, 'y': 0.5},
+         'direction': 2},
+        {'entity_number': 3, 'name': 'inserter', 'position': {'x': 2.5, 'y': 0.5},
+         'direction': 6},
+    ]}}
+    rotate(bp)
+    assert [e.get('direction') for e in bp['blueprint']['entities']] == [None, 4, 0]
+
+
+def test_blueprint_turns_in_sixteen_directions():
+    bp = {'blueprint': {'version': 562949958205441, 'entities': [
+        {'entity_number': 1, 'name': 'inserter', 'position': {'x': 0.5, 'y': 0.5},
+         'direction': 4},
+        {'entity_number': 2, 'name': 'rail-ramp', 'position': {'x': 1, 'y': 1},
+         'direction': 2},
+    ]}}
+    apply_transform(bp, Transform().rotate().mirror('x'))
+    assert [e['direction'] for e in bp['blueprint']['entities']] == [8, 10]
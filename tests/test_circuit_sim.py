@@ -0,0 +1,113 @@
+import pytest
+
+from circuit_sim import (RED_INPUT, RED_OUTPUT, CircuitSimulator, clock_blueprint, np,
+                         wrap)
+
+
+BACKENDS = [False] + ([True] if np is not None else [])
+
+
+def virtual(name):
+    return {"type": "virtual", "name": name}
+
+
+def constant(number, x, **signals):
+    filters = [{"index": i, "type": "virtual", "name": name, "quality": "normal",
+                "comparator": "=", "count": count}
+               for i, (name, count) in enumerate(signals.items(), 1)]
+    return {"entity_number": number, "name": "constant-combinator",
+            "position": {"x": x, "y": 0},
+            "control_behavior": {"sections": {"sections": [{"index": 1, "filters": filters}]}}}
+
+
+def arithmetic(number, x, first, operation, second_constant, output):
+    return {"entity_number": number, "name": "arithmetic-combinator",
+            "position": {"x": x, "y": 0},
+            "control_behavior": {"arithmetic_conditions": {
+                "first_signal": virtual(first), "operation": operation,
+                "second_constant": second_constant, "output_signal": virtual(output)}}}
+
+
+def pole(number, x):
+    # Somewhere for an output to go; unwired outputs are dropped
+    return {"entity_number": number, "name": "small-electric-pole", "position": {"x": x, "y": 2}}
+
+
+def blueprint(entities, wires):
+    return {"blueprint": {"entities": entities, "wires": wires, "item": "blueprint"}}
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_clock_counts_one_per_tick_and_decider_lags_one_tick(use_numpy):
+    sim = CircuitSimulator(clock_blueprint(3), use_numpy=use_numpy)
+    clock = sim.probe(1, ['signal-A'], side='output')
+    bus = sim.probe(2, ['signal-B'], side='output')
+    sim.run(40)
+    # Tick t: the clock has added 1 t times; the deciders see A = t - 1
+    # and output B = 1 each once that is above 30, i.e. from tick 32
+    assert clock.values('signal-A') == list(range(1, 41))
+    assert bus.values('signal-B') == [0] * 31 + [3] * 9
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_constant_through_arithmetic_and_decider(use_numpy):
+    decider = {
+        "entity_number": 3, "name": "decider-combinator", "position": {"x": 4, "y": 0},
+        "control_behavior": {"decider_conditions": {
+            "conditions": [{"first_signal": virtual("signal-A"), "constant": 5,
+                            "comparator": ">"}],
+            "outputs": [{"signal": virtual("signal-A"), "copy_count_from_input": True}]}},
+    }
+    data = blueprint(
+        [constant(1, 0, **{"signal-A": 2, "signal-B": 4}),
+         arithmetic(2, 2, "signal-A", "*", 3, "signal-A"), decider, pole(4, 6)],
+        [[1, RED_INPUT, 2, RED_INPUT], [2, RED_OUTPUT, 3, RED_INPUT],
+         [3, RED_OUTPUT, 4, RED_INPUT]])
+    sim = CircuitSimulator(data, use_numpy=use_numpy)
+    # Tick 0: only the constant combinator's signals exist
+    assert sim.signals(2) == {'signal-A': 2, 'signal-B': 4}
+    assert sim.read(2, 'signal-A', side='output') == 0
+    sim.step()
+    assert sim.read(2, 'signal-A', side='output') == 6
+    assert sim.read(3, 'signal-A', side='output') == 0
+    sim.step()
+    sim.assert_signal(3, 'signal-A', 6, side='output')
+    sim.run(10)
+    sim.assert_signal(3, 'signal-A', 6, side='output')
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+@pytest.mark.parametrize('operation, value, operand, expected', [
+    ('+', 2147483647, 1, -2147483648),
+    ('*', 65536, 65536, 0),
+    ('/', -7, 2, -3),
+    ('%', -7, 2, -1),
+    ('/', 7, 0, 0),
+    ('^', 2, 31, -2147483648),
+    ('<<', 1, 33, 2),
+])
+def test_arithmetic_matches_32_bit_game_rules(use_numpy, operation, value, operand, expected):
+    data = blueprint([constant(1, 0, **{"signal-A": value}),
+                      arithmetic(2, 2, "signal-A", operation, operand, "signal-B"),
+                      pole(3, 4)],
+                     [[1, RED_INPUT, 2, RED_INPUT], [2, RED_OUTPUT, 3, RED_INPUT]])
+    sim = CircuitSimulator(data, use_numpy=use_numpy)
+    sim.step()
+    sim.assert_signal(2, 'signal-B', expected, side='output')
+
+
+def test_legacy_connections_build_the_same_networks():
+    entities = [constant(1, 0, **{"signal-A": 10}),
+                arithmetic(2, 2, "signal-A", "-", 3, "signal-A"), pole(3, 4)]
+    entities[0]["connections"] = {"1": {"green": [{"entity_id": 2, "circuit_id": 1}]}}
+    entities[1]["connections"] = {"2": {"red": [{"entity_id": 3}]}}
+    sim = CircuitSimulator({"blueprint": {"entities": entities}}, use_numpy=False)
+    sim.step()
+    sim.assert_signal(2, 'signal-A', 10, colour='green')
+    sim.assert_signal(2, 'signal-A', 7, side='output')
+
+
+def test_wrap():
+    assert wrap(2 ** 31) == -2 ** 31
+    assert wrap(-2 ** 31 - 1) == 2 ** 31 - 1
+    assert wrap(5) == 5
@@ -0,0 +1,67 @@
+import copy
+
+import pytest
+
+from circuit_sim import CircuitSimulator
+from combinator_optimizer import optimize, redundant_blueprint, verify
+
+
+def test_packs_redundant_build_and_keeps_what_readers_see():
+    count = 5
+    original = redundant_blueprint(count)
+    before = copy.deepcopy(original)
+    optimized, report = optimize(original, verify_ticks=60)
+
+    assert original == before
+    assert report['dead_removed'] == count
+    assert report['deciders_folded'] == count - 1
+    assert report['constants_merged'] == count - 1
+    assert report['entities_after'] == report['entities_before'] - 3 * count + 2
+
+    # The lamps (entities 2 and 3 in both) read the folded and merged outputs
+    sim = CircuitSimulator(optimized, use_numpy=False)
+    sim.run(40)
+    sim.assert_signal(2, 'signal-B', count)
+    sim.assert_signal(3, 'signal-C', sum(range(1, count + 1)))
+
+
+def test_verify_reports_a_changed_signal():
+    original = redundant_blueprint(2)
+    changed = copy.deepcopy(original)
+    for entity in changed['blueprint']['entities']:
+        if entity['name'] == 'constant-combinator':
+            entity['control_behavior']['sections']['sections'][0]['filters'][0]['count'] += 1
+            break
+    numbers = {e['entity_number']: e['entity_number'] for e in original['blueprint']['entities']}
+    verify(original, copy.deepcopy(original), numbers, ticks=10)
+    with pytest.raises(AssertionError, match="tick 0"):
+        verify(original, changed, numbers, ticks=10)
+
+
+def test_rejects_legacy_connections():
+    data = {"blueprint": {"entities": [
+        {"entity_number": 1, "name": "constant-combinator", "position": {"x": 0, "y": 0},
+         "connections": {"1": {"red": [{"entity_id": 1}]}}}]}}
+    with pytest.raises(ValueError):
+        optimize(data)
+
+
+def test_unread_relay_network_may_change():
+    # constant -> decider -> pole that nothing reads: the decider is dead,
+    # and the pole's network losing signal-B is not a difference
+    data = {"blueprint": {"entities": [
+        {"entity_number": 1, "name": "constant-combinator", "position": {"x": 0.5, "y": 0.5},
+         "control_behavior": {"sections": {"sections": [{"index": 1, "filters": [
+             {"index": 1, "type": "virtual", "name": "signal-A", "quality": "normal",
+              "comparator": "=", "count": 5}]}]}}},
+        {"entity_number": 2, "name": "decider-combinator", "position": {"x": 2.5, "y": 1},
+         "control_behavior": {"decider_conditions": {
+             "conditions": [{"first_signal": {"type": "virtual", "name": "signal-A"},
+                             "constant": 0, "comparator": ">"}],
+             "outputs": [{"signal": {"type": "virtual", "name": "signal-B"},
+                          "copy_count_from_input": False}]}}},
+        {"entity_number": 3, "name": "medium-electric-pole", "position": {"x": 4.5, "y": 0.5}},
+    ], "wires": [[1, 1, 2, 1], [2, 3, 3, 1]]}}
+    optimized, report = optimize(data)
+    assert report['dead_removed'] == 2
+    assert [e['name'] for e in optimized['blueprint']['entities']] == ['medium-electric-pole']
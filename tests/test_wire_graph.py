@@ -0,0 +1,35 @@
+from wire_graph import WireGraph
+
+
+def legacy_switch():
+    # Factorio 1.x: a power switch wired to a pole by circuit and copper,
+    # and by copper to a second pole
+    return {'blueprint': {'entities': [
+        {'entity_number': 1, 'name': 'power-switch', 'position': {'x': 0, 'y': 0},
+         'connections': {'1': {'red': [{'entity_id': 2}]},
+                         'Cu0': [{'entity_id': 3, 'wire_id': 0}],
+                         'Cu1': [{'entity_id': 2, 'wire_id': 0}]}},
+        {'entity_number': 2, 'name': 'small-electric-pole', 'position': {'x': 2, 'y': 0},
+         'connections': {'1': {'red': [{'entity_id': 1, 'circuit_id': 1}]}}},
+        {'entity_number': 3, 'name': 'small-electric-pole', 'position': {'x': -2, 'y': 0}},
+    ]}}
+
+
+def test_removed_entity_leaves_no_legacy_copper_wires():
+    graph = WireGraph(legacy_switch())
+    graph.remove_entity(3)
+    switch = graph.to_blueprint()['blueprint']['entities'][0]
+    assert switch['connections'] == {
+        'Cu1': [{'entity_id': 2, 'wire_id': 0}],
+        '1': {'red': [{'entity_id': 2, 'circuit_id': 1}]},
+    }
+
+    graph.remove_entity(2)
+    switch = graph.to_blueprint()['blueprint']['entities'][0]
+    assert 'connections' not in switch
+
+
+def test_same_network_across_legacy_wires():
+    graph = WireGraph(legacy_switch())
+    assert graph.legacy
+    assert graph.same_network((1, 1), (2, 1))
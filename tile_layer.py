@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Compact bitmap storage for blueprint tiles.
+Landfill, concrete and platform floors come as long runs of identical
+{"name", "position"} dicts. A TileLayer keeps one bitmap per tile name
+and row instead (a Python int, bit i set for x = origin + i), so a
+million-tile floor is a few hundred kilobytes. Area fill, subtract and
+count work on whole rows at a time, and tile dicts are only rebuilt when
+the layer is iterated or the blueprint is encoded.
+"""
+
+import json
+import re
+import sys
+import time
+import tracemalloc
+from array import array
+
+from blueprint_lazy import DEFAULT_MAX_INFLATED_SIZE, LazyBlueprint, inflate_blueprint
+
+
+_CHUNK_SIZE = 1 << 20
+
+# A plain tile object in either key order, as exported by the game
+_TILE = re.compile(
+    rb'\{\s*"name"\s*:\s*"([^"\\{]*)"\s*,\s*"position"\s*:\s*'
+    rb'\{\s*"x"\s*:\s*(-?\d+)\s*,\s*"y"\s*:\s*(-?\d+)\s*\}\s*\}'
+    rb'|\{\s*"position"\s*:\s*\{\s*"x"\s*:\s*(-?\d+)\s*,\s*"y"\s*:\s*(-?\d+)\s*\}'
+    rb'\s*,\s*"name"\s*:\s*"([^"\\{]*)"\s*\}')
+
+
+def _chunk_end(text, pos, limit):
+    # Offset of the last tile's opening brace before `limit` (a position
+    # object's brace follows a colon), or the end of the text
+    if limit >= len(text):
+        return len(text)
+    end = text.rfind(b'{', pos, limit)
+    while end > pos:
+        before = end - 1
+        while text[before] in b' \t\r\n':
+            before -= 1
+        if text[before] != ord(':'):
+            return end
+        end = text.rfind(b'{', pos, end)
+    return len(text)
+
+
+def _runs(bits):
+    # Yields (start, end) of each run of set bits, lowest first
+    while bits:
+        low = bits & -bits
+        start = low.bit_length() - 1
+        carried = bits + low          # the run carries into the bit above it
+        end = (carried & -carried).bit_length() - 1
+        bits &= carried
+        yield start, end
+
+
+class TileLayer:
+    """
+    Bitmap-backed view of a blueprint's tile list.
+
+    Only tiles at whole-number positions with no other fields go into the
+    bitmaps; anything else is kept as a dict in self.extras. A position
+    holds at most one tile, so filling over other tiles replaces them.
+    Tiles come back grouped by name and row, not in their original order.
+    """
+
+    def __init__(self):
+        self.origin = 0          # x of bit 0 in every row
+        self.rows = {}           # name -> {y: bitmap}
+        self.extras = []         # tiles the bitmaps cannot hold
+
+    @classmethod
+    def from_tiles(cls, tiles):
+        """
+        Builds a layer from a list of tile dicts.
+        """
+        layer = cls()
+        placed = {}
+        for tile in tiles:
+            position = tile.get('position')
+            if (len(tile) == 2 and isinstance(position, dict) and len(position) == 2
+                    and type(position.get('x')) is int and type(position.get('y')) is int
+                    and isinstance(tile.get('name'), str)):
+                placed.setdefault((tile['name'], position['y']), []).append(position['x'])
+            else:
+                layer.extras.append(tile)
+        layer._load(placed)
+        return layer
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Builds a layer straight from the JSON text of a tile list, without
+        creating tile dicts when every tile is a plain one.
+        """
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        placed = {}
+        matched = 0
+        pos = 0
+        while pos < len(text):
+            # A chunk at a time, so only one chunk of matches is alive
+            end = _chunk_end(text, pos, pos + _CHUNK_SIZE)
+            for name, x, y, x2, y2, name2 in _TILE.findall(text, pos, end):
+                if name2:
+                    name, x, y = name2, x2, y2
+                xs = placed.get((name, y))
+                if xs is None:
+                    xs = placed[name, y] = array('q')
+                xs.append(int(x))
+                matched += 1
+            pos = end
+        # Each plain tile has exactly two opening braces; any other shape
+        # (extra fields, odd names) takes the slow path
+        if matched * 2 != text.count(b'{'):
+            return cls.from_tiles(json.loads(text))
+        layer = cls()
+        layer._load({(name.decode('utf-8'), int(y)): xs for (name, y), xs in placed.items()})
+        return layer
+
+    def _load(self, placed):
+        if not placed:
+            return
+        self.origin = min(min(xs) for xs in placed.values())
+        occupied = {}
+        for (name, y), xs in placed.items():
+            # Sorted positions become one shifted mask per run
+            xs = sorted(xs)
+            bits = 0
+            start = previous = xs[0]
+            for x in xs:
+                if x > previous + 1:
+                    bits |= ((1 << (previous + 1 - start)) - 1) << (start - self.origin)
+                    start = x
+                previous = x
+            bits |= ((1 << (previous + 1 - start)) - 1) << (start - self.origin)
+            # A position listed under two names keeps only one of them
+            clash = occupied.get(y, 0) & bits
+            if clash:
+                for other in self.rows.values():
+                    if y in other:
+                        other[y] &= ~clash
+                        if not other[y]:
+                            del other[y]
+            occupied[y] = occupied.get(y, 0) | bits
+            self.rows.setdefault(name, {})[y] = bits
+
+    def _mask(self, x0, x1):
+        # Bitmap for x0 <= x < x1, moving the origin left if needed
+        if x0 < self.origin:
+            shift = self.origin - x0
+            for rows in self.rows.values():
+                for y in rows:
+                    rows[y] <<= shift
+            self.origin = x0
+        return ((1 << (x1 - x0)) - 1) << (x0 - self.origin)
+
+    def fill(self, name, x0, y0, x1, y1):
+        """
+        Covers the area x0 <= x < x1, y0 <= y < y1 with one tile name,
+        replacing any other tiles there.
+        """
+        if x1 <= x0 or y1 <= y0:
+            return
+        self.subtract(x0, y0, x1, y1)
+        mask = self._mask(x0, x1)
+        rows = self.rows.setdefault(name, {})
+        for y in range(y0, y1):
+            rows[y] = rows.get(y, 0) | mask
+
+    def subtract(self, x0, y0, x1, y1, name=None):
+        """
+        Removes the tiles in x0 <= x < x1, y0 <= y < y1 (only those of one
+        name, if given).
+        """
+        if x1 <= x0 or y1 <= y0:
+            return
+        lo = max(x0 - self.origin, 0)
+        hi = x1 - self.origin
+        if hi <= 0:
+            return
+        keep = ~(((1 << (hi - lo)) - 1) << lo)
+        names = [name] if name is not None else list(self.rows)
+        for tile_name in names:
+            rows = self.rows.get(tile_name, {})
+            ys = range(y0, y1) if y1 - y0 < len(rows) else [y for y in rows if y0 <= y < y1]
+            for y in ys:
+                bits = rows.get(y)
+                if bits is not None:
+                    bits &= keep
+                    if bits:
+                        rows[y] = bits
+                    else:
+                        del rows[y]
+            if not rows:
+                self.rows.pop(tile_name, None)
+
+    def add(self, name, x, y):
+        """
+        Places one tile.
+        """
+        self.fill(name, x, y, x + 1, y + 1)
+
+    def get(self, x, y):
+        """
+        Returns the name of the tile at (x, y), or None.
+        """
+        bit = x - self.origin
+        if bit < 0:
+            return None
+        for name, rows in self.rows.items():
+            if rows.get(y, 0) >> bit & 1:
+                return name
+        return None
+
+    def count(self, name=None, area=None):
+        """
+        Counts tiles without building any tile dicts.
+
+        Args:
+            name: Only count this tile name
+            area: Optional (x0, y0, x1, y1), half-open like fill()
+
+        Returns:
+            int: The number of tiles (extras included when no area is given)
+        """
+        names = [name] if name is not None else list(self.rows)
+        total = 0
+        if area is None:
+            for tile_name in names:
+                total += self._bitmap_count(tile_name)
+            return total + sum(1 for t in self.extras if name is None or t.get('name') == name)
+
+        x0, y0, x1, y1 = area
+        lo, hi = max(x0 - self.origin, 0), x1 - self.origin
+        if hi <= lo or y1 <= y0:
+            return 0
+        mask = ((1 << (hi - lo)) - 1) << lo
+        for tile_name in names:
+            rows = self.rows.get(tile_name, {})
+            for y, bits in rows.items():
+                if y0 <= y < y1:
+                    total += (bits & mask).bit_count()
+        return total
+
+    def _bitmap_count(self, name):
+        return sum(bits.bit_count() for bits in self.rows.get(name, {}).values())
+
+    def name_counts(self):
+        """
+        Counts tiles per name.
+
+        Returns:
+            dict: name -> count
+        """
+        result = {name: self._bitmap_count(name) for name in self.rows}
+        for tile in self.extras:
+            name = tile.get('name', 'unknown')
+            result[name] = result.get(name, 0) + 1
+        return result
+
+    def bounds(self):
+        """
+        Returns (x0, y0, x1, y1) around the bitmap tiles, or None if empty.
+        """
+        rows = [(y, bits) for by_y in self.rows.values() for y, bits in by_y.items()]
+        if not rows:
+            return None
+        ys = [y for y, _ in rows]
+        combined = 0
+        for _, bits in rows:
+            combined |= bits
+        low = (combined & -combined).bit_length() - 1
+        return (self.origin + low, min(ys),
+                self.origin + combined.bit_length(), max(ys) + 1)
+
+    def __len__(self):
+        return self.count()
+
+    def runs(self, extras=True):
+        """
+        Yields (name, y, x0, x1) for each horizontal run of same-named
+        tiles, x1 exclusive; extras come as runs of one tile unless
+        `extras` is false.
+        """
+        origin = self.origin
+        for name, rows in self.rows.items():
+            for y in sorted(rows):
+                for start, end in _runs(rows[y]):
+                    yield name, y, origin + start, origin + end
+        if not extras:
+            return
+        for tile in self.extras:
+            position = tile['position']
+            yield tile.get('name'), position['y'], position['x'], position['x'] + 1
+
+    def __iter__(self):
+        origin = self.origin
+        for name, rows in self.rows.items():
+            for y in sorted(rows):
+                for start, end in _runs(rows[y]):
+                    for x in range(origin + start, origin + end):
+                        yield {'name': name, 'position': {'x': x, 'y': y}}
+        yield from self.extras
+
+    def to_json(self):
+        """
+        Returns the tiles as an iterator of plain tile dicts, which the
+        blueprint encoder serializes one at a time.
+        """
+        return iter(self)
+
+    def to_tiles(self):
+        """
+        Materializes the layer as a list of tile dicts.
+        """
+        return list(self)
+
+
+def attach_tile_layers(blueprint_data):
+    """
+    Swaps every 'tiles' list in a blueprint or (nested) book for a
+    TileLayer, in place.
+
+    Args:
+        blueprint_data: The decoded blueprint data
+
+    Returns:
+        dict: The same blueprint data
+    """
+    if 'blueprint' in blueprint_data:
+        bp = blueprint_data['blueprint']
+        if isinstance(bp.get('tiles'), list):
+            bp['tiles'] = TileLayer.from_tiles(bp['tiles'])
+    elif 'blueprint_book' in blueprint_data:
+        for child in blueprint_data['blueprint_book'].get('blueprints', []):
+            attach_tile_layers(child)
+    return blueprint_data
+
+
+def _load_view(view):
+    # Parses a LazyBlueprint into plain data, tiles straight into layers
+    result = {}
+    for key in view:
+        body = view.body if key == view.kind else None
+        if body is None:
+            result[key] = view[key]
+        elif view.is_book:
+            result[key] = {k: [_load_view(child) for child in view.children]
+                           if k == 'blueprints' else body[k] for k in body}
+        else:
+            result[key] = {k: TileLayer.from_json(body.raw(k)) if k == 'tiles' else body[k]
+                           for k in body}
+    return result
+
+
+def decode_with_tile_layers(blueprint_string, max_inflated_size=DEFAULT_MAX_INFLATED_SIZE):
+    """
+    Decodes a blueprint string like decode_blueprint, but parses every
+    tile list directly into a TileLayer, so the tile dicts are never
+    built.
+
+    Returns:
+        tuple: (blueprint data, version byte)
+    """
+    data, version_byte = inflate_blueprint(blueprint_string, max_inflated_size)
+    return _load_view(LazyBlueprint.from_json(data, version_byte)), version_byte
+
+
+def main():
+    from blueprint_decoder import decode_blueprint, encode_blueprint, summarize_blueprint
+
+    print("TileLayer Benchmark")
+    print("="*60)
+
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    tiles = [{"name": "landfill" if (x // 50 + y // 50) % 4 else "refined-concrete",
+              "position": {"x": x - side // 2, "y": y - side // 2}}
+             for y in range(side) for x in range(side)]
+    blueprint_string = encode_blueprint({"blueprint": {"tiles": tiles, "item": "blueprint"}})
+    del tiles
+    count = side * side
+
+    tracemalloc.start()
+    blueprint_data, _ = decode_blueprint(blueprint_string)
+    dict_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    reference = blueprint_data['blueprint']['tiles']
+    del blueprint_data
+
+    tracemalloc.start()
+    layered, _ = decode_with_tile_layers(blueprint_string)
+    layer_size, layer_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    layer = layered['blueprint']['tiles']
+
+    # Timed again without tracemalloc slowing every allocation down
+    start = time.perf_counter()
+    decode_blueprint(blueprint_string)
+    dict_time = time.perf_counter() - start
+    start = time.perf_counter()
+    decode_with_tile_layers(blueprint_string)
+    layer_time = time.perf_counter() - start
+
+    print(f"{count} tiles")
+    print(f"  dict list:  {dict_size / 2**20:8.1f} MiB  {dict_time:.3f}s")
+    print(f"  TileLayer:  {layer_size / 2**20:8.1f} MiB  {layer_time:.3f}s "
+          f"(peak {layer_peak / 2**20:.1f} MiB while decoding)")
+
+    start = time.perf_counter()
+    layer.subtract(-100, -100, 100, 100)
+    layer.fill("space-platform-foundation", -20, -20, 20, 20)
+    covered = layer.count(area=(-100, -100, 100, 100))
+    print(f"  subtract + fill + area count: {(time.perf_counter() - start) * 1000:.2f} ms "
+          f"({covered} tiles in the area)")
+    assert covered == 1600
+    assert len(layer) == count - 200 * 200 + 1600
+
+    summary = summarize_blueprint(layered)
+    expected = sorted(((t['name'], t['position']['x'], t['position']['y']) for t in reference
+                       if not (-100 <= t['position']['x'] < 100 and -100 <= t['position']['y'] < 100)))
+    start = time.perf_counter()
+    round_trip = decode_blueprint(encode_blueprint(layered))[0]['blueprint']['tiles']
+    print(f"  encode + decode back: {time.perf_counter() - start:.3f}s, "
+          f"summary reports {summary['tiles']} tiles")
+    assert sorted((t['name'], t['position']['x'], t['position']['y']) for t in round_trip
+                  if t['name'] != "space-platform-foundation") == expected
+    print("Round trip through encode_blueprint: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Circuit-wire connectivity index for a blueprint.
+Builds the red and green wire graph in one pass over the blueprint's wires
+(2.0 'wires' or 1.x 'connections') and keeps its circuit networks in a
+union-find, so "what shares a network with this combinator" is answered
+without rescanning. Wires and entities can be added and removed; the index
+follows incrementally and writes the wires back in the blueprint's own
+format for encode_blueprint.
+
+Nodes are (entity_number, connector) pairs using 2.0 connector ids:
+1 red input, 2 green input, 3 red output, 4 green output (other entities
+only have 1 and 2).
+"""
+
+import sys
+import time
+
+from circuit_sim import (GREEN_INPUT, GREEN_OUTPUT, RED_INPUT, RED_OUTPUT, TWO_SIDED,
+                         clock_blueprint, is_circuit_wire, iter_circuit_wires)
+
+
+def _colour(connector):
+    return 'red' if connector % 2 else 'green'
+
+
+class WireGraph:
+    """
+    Red/green wire graph with network (connected component) tracking.
+
+    Network ids are the union-find roots: stable between edits, but they
+    may change when wires or entities are added or removed.
+
+    Usage:
+        graph = WireGraph(blueprint_data)
+        graph.entities_on(12, RED_OUTPUT)     # entities on that red network
+        graph.remove_entity(12)
+        graph.add_wire(3, RED_INPUT, 7, RED_OUTPUT)
+        encode_blueprint(graph.to_blueprint())
+    """
+
+    def __init__(self, blueprint_data):
+        """
+        Args:
+            blueprint_data: Decoded blueprint; it is not copied, and
+                to_blueprint() writes the edited wires back into it
+        """
+        self.data = blueprint_data
+        bp = blueprint_data['blueprint']
+        self._entities = {e['entity_number']: e for e in bp.get('entities', [])}
+        # Factorio 1.x blueprints keep wires on the entities
+        self.legacy = 'wires' not in bp and any('connections' in e
+                                                for e in self._entities.values())
+        self._adjacent = {}    # node -> set of wired nodes
+        self._parent = {}      # union-find forest over wired nodes
+        self._members = {}     # root -> set of nodes on that network
+        self._other_wires = [] # 2.0 copper and power switch wires, untouched
+
+        wires = []
+        for wire in bp.get('wires', []):
+            if is_circuit_wire(wire[1], wire[3]):
+                wires.append(((wire[0], wire[1]), (wire[2], wire[3])))
+            else:
+                self._other_wires.append(wire)
+        if self.legacy:
+            wires.extend(iter_circuit_wires(self._entities.values(), []))
+        self._load(wires)
+
+    def _load(self, wires):
+        # One pass over the wires: adjacency first, then a union-find over
+        # the distinct nodes and a single grouping pass
+        adjacent = self._adjacent
+        parent = self._parent
+        for a, b in wires:
+            if a == b:
+                continue
+            ends = adjacent.get(a)
+            if ends is None:
+                ends = adjacent[a] = set()
+                parent[a] = a
+            ends.add(b)
+            ends = adjacent.get(b)
+            if ends is None:
+                ends = adjacent[b] = set()
+                parent[b] = b
+            ends.add(a)
+            while parent[a] != a:
+                parent[a] = a = parent[parent[a]]
+            while parent[b] != b:
+                parent[b] = b = parent[parent[b]]
+            if a != b:
+                parent[b] = a
+        members = self._members
+        for node in parent:
+            root = self._find(node)
+            group = members.get(root)
+            if group is None:
+                group = members[root] = set()
+            group.add(node)
+
+    # -- union-find --
+
+    def _find(self, node):
+        parent = self._parent
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while node != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def _add_node(self, node):
+        if node not in self._parent:
+            self._parent[node] = node
+            self._members[node] = {node}
+            self._adjacent[node] = set()
+
+    def _link(self, a, b):
+        # Adds an edge; returns False if it was already there
+        if a == b:
+            return False
+        self._add_node(a)
+        self._add_node(b)
+        if b in self._adjacent[a]:
+            return False
+        self._adjacent[a].add(b)
+        self._adjacent[b].add(a)
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a != root_b:
+            # Union by size: the smaller member set moves
+            if len(self._members[root_a]) < len(self._members[root_b]):
+                root_a, root_b = root_b, root_a
+            self._parent[root_b] = root_a
+            self._members[root_a] |= self._members.pop(root_b)
+        return True
+
+    def _rebuild(self, roots):
+        # Recomputes the networks that had these roots after edges were
+        # removed; only their members are visited
+        nodes = set()
+        for root in roots:
+            nodes |= self._members.pop(root, set())
+        for node in nodes:
+            del self._parent[node]
+        while nodes:
+            start = nodes.pop()
+            if not self._adjacent[start]:
+                # No wires left: the node leaves the graph
+                del self._adjacent[start]
+                continue
+            component = {start}
+            stack = [start]
+            while stack:
+                for neighbour in self._adjacent[stack.pop()]:
+                    if neighbour not in component:
+                        component.add(neighbour)
+                        stack.append(neighbour)
+            nodes -= component
+            for node in component:
+                self._parent[node] = start
+            self._members[start] = component
+
+    # -- queries --
+
+    def __len__(self):
+        return len(self._members)
+
+    def network_id(self, entity_number, connector):
+        """
+        Returns the network id of a connector, or None if it has no wires.
+        """
+        node = (entity_number, connector)
+        return self._find(node) if node in self._parent else None
+
+    def same_network(self, a, b):
+        """
+        Tells whether two (entity_number, connector) nodes are on one network.
+        """
+        return a in self._parent and b in self._parent and self._find(a) == self._find(b)
+
+    def members(self, entity_number, connector):
+        """
+        Lists the (entity_number, connector) nodes on a connector's network.
+
+        Returns:
+            frozenset: Nodes, empty if the connector has no wires
+        """
+        root = self.network_id(entity_number, connector)
+        return frozenset(self._members[root]) if root is not None else frozenset()
+
+    def network_size(self, entity_number, connector):
+        """
+        Returns the number of connectors on a network, without listing them.
+        """
+        root = self.network_id(entity_number, connector)
+        return len(self._members[root]) if root is not None else 0
+
+    def entities_on(self, entity_number, connector):
+        """
+        Returns the numbers of the entities sharing a connector's network,
+        including the entity itself.
+        """
+        root = self.network_id(entity_number, connector)
+        if root is None:
+            return set()
+        return {number for number, _ in self._members[root]}
+
+    def neighbours(self, entity_number, connector=None):
+        """
+        Lists the connectors wired directly to an entity.
+
+        Args:
+            entity_number: The entity
+            connector: One connector, or None for all of them
+
+        Returns:
+            set: (entity_number, connector) nodes at the other wire ends
+        """
+        connectors = (RED_INPUT, GREEN_INPUT, RED_OUTPUT, GREEN_OUTPUT) \
+            if connector is None else (connector,)
+        result = set()
+        for c in connectors:
+            result |= self._adjacent.get((entity_number, c), set())
+        return result
+
+    def networks(self, colour=None):
+        """
+        Yields every network as (network id, colour, frozenset of nodes).
+
+        Args:
+            colour: 'red', 'green', or None for both
+        """
+        for root, members in self._members.items():
+            if colour is None or _colour(root[1]) == colour:
+                yield root, _colour(root[1]), frozenset(members)
+
+    def wires(self):
+        """
+        Yields each circuit wire once as a 2.0 [e1, c1, e2, c2] list.
+        """
+        for a, ends in self._adjacent.items():
+            for b in ends:
+                if a < b:
+                    yield [a[0], a[1], b[0], b[1]]
+
+    # -- edits --
+
+    def _check_connector(self, entity_number, connector):
+        if entity_number not in self._entities:
+            raise KeyError(f"No entity {entity_number}")
+        entity = self._entities[entity_number]
+        highest = GREEN_OUTPUT if entity.get('name') in TWO_SIDED else GREEN_INPUT
+        if not 1 <= connector <= highest:
+            raise ValueError(f"{entity.get('name')} has no circuit connector {connector}")
+
+    def add_wire(self, e1, c1, e2, c2):
+        """
+        Connects two circuit connectors of the same colour.
+
+        Returns:
+            bool: False if the wire already existed
+
+        Raises:
+            KeyError: If an entity does not exist
+            ValueError: If the connectors do not exist or differ in colour
+        """
+        self._check_connector(e1, c1)
+        self._check_connector(e2, c2)
+        if c1 % 2 != c2 % 2:
+            raise ValueError("Red and green connectors cannot be wired together")
+        return self._link((e1, c1), (e2, c2))
+
+    def remove_wire(self, e1, c1, e2, c2):
+        """
+        Removes a wire, splitting its network if it was the only link.
+
+        Returns:
+            bool: False if there was no such wire
+        """
+        a, b = (e1, c1), (e2, c2)
+        if b not in self._adjacent.get(a, ()):
+            return False
+        self._adjacent[a].discard(b)
+        self._adjacent[b].discard(a)
+        self._rebuild({self._find(a)})
+        return True
+
+    def add_entity(self, entity):
+        """
+        Adds an entity (without wires), numbering it if it has no
+        entity_number yet.
+
+        Returns:
+            int: The entity's number
+        """
+        if 'entity_number' not in entity:
+            entity['entity_number'] = max(self._entities, default=0) + 1
+        number = entity['entity_number']
+        if number in self._entities:
+            raise ValueError(f"Entity {number} already exists")
+        self._entities[number] = entity
+        return number
+
+    def remove_entity(self, entity_number):
+        """
+        Removes an entity with all of its wires.
+
+        Returns:
+            dict: The removed entity
+        """
+        entity = self._entities.pop(entity_number)
+        roots = set()
+        for connector in (RED_INPUT, GREEN_INPUT, RED_OUTPUT, GREEN_OUTPUT):
+            node = (entity_number, connector)
+            if node not in self._parent:
+                continue
+            roots.add(self._find(node))
+            for neighbour in self._adjacent[node]:
+                self._adjacent[neighbour].discard(node)
+            self._adjacent[node].clear()
+        self._rebuild(roots)
+        self._other_wires = [w for w in self._other_wires
+                             if w[0] != entity_number and w[2] != entity_number]
+        return entity
+
+    # -- output --
+
+    def to_blueprint(self):
+        """
+        Writes the entities and wires back into the blueprint data, in
+        the format it was read in.
+
+        Returns:
+            dict: The blueprint data, ready for encode_blueprint
+        """
+        bp = self.data['blueprint']
+        bp['entities'] = list(self._entities.values())
+        for entity in bp['entities']:
+            if 'neighbours' in entity:
+                entity['neighbours'] = [n for n in entity['neighbours'] if n in self._entities]
+
+        if not self.legacy:
+            wires = sorted(self.wires()) + self._other_wires
+            if wires:
+                bp['wires'] = wires
+            else:
+                bp.pop('wires', None)
+            return self.data
+
+        # 1.x lists each wire on both entities; points "1" (input) and
+        # "2" (output), copper "Cu0"/"Cu1" entries are kept unless they
+        # lead to a removed entity
+        connections = {}
+        for (number, connector), ends in self._adjacent.items():
+            point = connections.setdefault(number, {}).setdefault(
+                str((connector + 1) // 2), {})
+            targets = point.setdefault(_colour(connector), [])
+            for other, other_connector in sorted(ends):
+                targets.append({'entity_id': other,
+                                'circuit_id': (other_connector + 1) // 2})
+        for number, entity in self._entities.items():
+            kept = {}
+            for key, value in (entity.get('connections') or {}).items():
+                if key in ('1', '2'):
+                    continue
+                if isinstance(value, list):
+                    value = [end for end in value if not isinstance(end, dict)
+                             or end.get('entity_id') in self._entities]
+                    if not value:
+                        continue
+                kept[key] = value
+            kept.update(connections.get(number, {}))
+            if kept:
+                entity['connections'] = kept
+            else:
+                entity.pop('connections', None)
+        return self.data
+
+
+def main():
+    print("Circuit Wire Graph")
+    print("="*60)
+
+    if len(sys.argv) > 1:
+        from blueprint_decoder import decode_blueprint
+        with open(sys.argv[1], 'r') as f:
+            blueprint_data = decode_blueprint(f.read().strip())[0]
+    else:
+        print("(no blueprint file given; using a generated clock circuit)")
+        blueprint_data = clock_blueprint(25000)
+
+    start = time.perf_counter()
+    graph = WireGraph(blueprint_data)
+    elapsed = time.perf_counter() - start
+    wires = sum(1 for _ in graph.wires())
+    red = sum(1 for _ in graph.networks('red'))
+    print(f"{len(graph._entities)} entities, {wires} circuit wires, "
+          f"{len(graph)} networks ({red} red, {len(graph) - red} green)")
+    print(f"  index: {elapsed:.3f}s")
+
+    if graph._members:
+        largest = max(graph._members.values(), key=len)
+        print(f"  largest network: {len(largest)} connectors")
+        number, connector = next(iter(largest))
+        start = time.perf_counter()
+        for _ in range(100000):
+            graph.network_size(number, connector)
+        print(f"  lookup: {(time.perf_counter() - start) * 10:.3f} us each")
+
+
+if __name__ == "__main__":
+    main()